@@ -0,0 +1,42 @@
+"""Users follow counters
+
+Revision ID: 3f6d2a8c41b7
+Revises: 7b3e92d5c610
+Create Date: 2026-10-18 06:02:44.517930
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "3f6d2a8c41b7"
+down_revision: Union[str, None] = "7b3e92d5c610"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "users",
+        sa.Column("followers_count", sa.INTEGER(), server_default="0", nullable=False),
+    )
+    op.add_column(
+        "users",
+        sa.Column("following_count", sa.INTEGER(), server_default="0", nullable=False),
+    )
+    op.execute(
+        "UPDATE users SET "
+        "followers_count = "
+        "(SELECT count(*) FROM followers WHERE followers.followed_id = users.id), "
+        "following_count = "
+        "(SELECT count(*) FROM followers WHERE followers.follower_id = users.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("users", "following_count")
+    op.drop_column("users", "followers_count")
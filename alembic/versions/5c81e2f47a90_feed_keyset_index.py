@@ -0,0 +1,32 @@
+"""Feed keyset index
+
+Revision ID: 5c81e2f47a90
+Revises: a103edd0dcfc
+Create Date: 2026-10-18 04:31:02.118540
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "5c81e2f47a90"
+down_revision: Union[str, None] = "a103edd0dcfc"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        "ix_tweets_user_id_timestamp_id",
+        "tweets",
+        ["user_id", sa.text("timestamp DESC"), sa.text("id DESC")],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_tweets_user_id_timestamp_id", table_name="tweets")
@@ -0,0 +1,29 @@
+"""Users and tweets versions
+
+Revision ID: 7b3e92d5c610
+Revises: e4b9d1c07f3a
+Create Date: 2026-10-18 05:21:07.318254
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "7b3e92d5c610"
+down_revision: Union[str, None] = "e4b9d1c07f3a"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("users", sa.Column("version", sa.INTEGER(), server_default="1", nullable=False))
+    op.add_column("tweets", sa.Column("version", sa.INTEGER(), server_default="1", nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("tweets", "version")
+    op.drop_column("users", "version")
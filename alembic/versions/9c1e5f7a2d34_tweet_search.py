@@ -0,0 +1,62 @@
+"""Tweet full-text search
+
+Revision ID: 9c1e5f7a2d34
+Revises: 3f6d2a8c41b7
+Create Date: 2026-10-18 06:31:15.204861
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "9c1e5f7a2d34"
+down_revision: Union[str, None] = "3f6d2a8c41b7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.execute(
+            "ALTER TABLE tweets ADD COLUMN search_vector tsvector GENERATED ALWAYS AS "
+            "(to_tsvector('simple', coalesce(tweet_data, ''))) STORED"
+        )
+        op.create_index(
+            "ix_tweets_search_vector", "tweets", ["search_vector"], postgresql_using="gin"
+        )
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE tweets_fts "
+        "USING fts5(tweet_data, content='tweets', content_rowid='id')"
+    )
+    op.execute(
+        "CREATE TRIGGER tweets_fts_insert AFTER INSERT ON tweets BEGIN "
+        "INSERT INTO tweets_fts (rowid, tweet_data) VALUES (new.id, new.tweet_data); END"
+    )
+    op.execute(
+        "CREATE TRIGGER tweets_fts_delete AFTER DELETE ON tweets BEGIN "
+        "INSERT INTO tweets_fts (tweets_fts, rowid, tweet_data) "
+        "VALUES ('delete', old.id, old.tweet_data); END"
+    )
+    op.execute(
+        "CREATE TRIGGER tweets_fts_update AFTER UPDATE OF tweet_data ON tweets BEGIN "
+        "INSERT INTO tweets_fts (tweets_fts, rowid, tweet_data) "
+        "VALUES ('delete', old.id, old.tweet_data); "
+        "INSERT INTO tweets_fts (rowid, tweet_data) VALUES (new.id, new.tweet_data); END"
+    )
+    op.execute("INSERT INTO tweets_fts (tweets_fts) VALUES ('rebuild')")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == "postgresql":
+        op.drop_index("ix_tweets_search_vector", table_name="tweets")
+        op.drop_column("tweets", "search_vector")
+        return
+    op.execute("DROP TRIGGER tweets_fts_update")
+    op.execute("DROP TRIGGER tweets_fts_delete")
+    op.execute("DROP TRIGGER tweets_fts_insert")
+    op.execute("DROP TABLE tweets_fts")
@@ -0,0 +1,30 @@
+"""Hash api keys and index them
+
+Revision ID: a103edd0dcfc
+Revises: 2d4090af011d
+Create Date: 2026-10-18 04:18:24.412871
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "a103edd0dcfc"
+down_revision: Union[str, None] = "2d4090af011d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # keys are stored as sha256 hex digests (see app.models.hash_api_key)
+    op.execute("UPDATE users SET api_key = encode(sha256(api_key::bytea), 'hex')")
+    op.create_index("ix_users_api_key", "users", ["api_key"], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # digests can't be turned back into the original keys
+    op.drop_index("ix_users_api_key", table_name="users")
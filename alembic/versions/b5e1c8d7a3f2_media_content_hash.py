@@ -0,0 +1,29 @@
+"""Media content hash
+
+Revision ID: b5e1c8d7a3f2
+Revises: f2b7c9d41e86
+Create Date: 2026-10-18 09:02:17.448120
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "b5e1c8d7a3f2"
+down_revision: Union[str, None] = "f2b7c9d41e86"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("media", sa.Column("content_hash", sa.String(length=64), nullable=True))
+    op.create_index("ix_media_content_hash", "media", ["content_hash"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_media_content_hash", table_name="media")
+    op.drop_column("media", "content_hash")
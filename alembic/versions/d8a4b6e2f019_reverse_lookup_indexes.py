@@ -0,0 +1,37 @@
+"""Likes and followers reverse lookup indexes
+
+Revision ID: d8a4b6e2f019
+Revises: 9c1e5f7a2d34
+Create Date: 2026-10-18 06:58:32.640127
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "d8a4b6e2f019"
+down_revision: Union[str, None] = "9c1e5f7a2d34"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_likes_tweet_id_user_id", "likes", ["tweet_id", "user_id"], unique=False)
+    op.create_index(
+        "ix_followers_followed_id_follower_id",
+        "followers",
+        ["followed_id", "follower_id"],
+        unique=False,
+    )
+    # covered by the leading column of ix_tweets_user_id_timestamp_id
+    op.drop_index("ix_tweets_user_id", table_name="tweets")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index("ix_tweets_user_id", "tweets", ["user_id"], unique=False)
+    op.drop_index("ix_followers_followed_id_follower_id", table_name="followers")
+    op.drop_index("ix_likes_tweet_id_user_id", table_name="likes")
@@ -0,0 +1,34 @@
+"""Media status
+
+Revision ID: e4a9d2c6b815
+Revises: b5e1c8d7a3f2
+Create Date: 2026-10-18 10:36:05.217904
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "e4a9d2c6b815"
+down_revision: Union[str, None] = "b5e1c8d7a3f2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table("media") as batch_op:
+        batch_op.add_column(
+            sa.Column("status", sa.String(length=16), nullable=False, server_default="ready")
+        )
+        batch_op.alter_column("image_link", existing_type=sa.String(), nullable=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DELETE FROM media WHERE image_link IS NULL")
+    with op.batch_alter_table("media") as batch_op:
+        batch_op.alter_column("image_link", existing_type=sa.String(), nullable=False)
+        batch_op.drop_column("status")
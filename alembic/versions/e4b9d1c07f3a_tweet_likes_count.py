@@ -0,0 +1,34 @@
+"""Tweet likes counter
+
+Revision ID: e4b9d1c07f3a
+Revises: 5c81e2f47a90
+Create Date: 2026-10-18 04:52:40.905213
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "e4b9d1c07f3a"
+down_revision: Union[str, None] = "5c81e2f47a90"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "tweets",
+        sa.Column("likes_count", sa.INTEGER(), server_default="0", nullable=False),
+    )
+    op.execute(
+        "UPDATE tweets SET likes_count = "
+        "(SELECT count(*) FROM likes WHERE likes.tweet_id = tweets.id)"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("tweets", "likes_count")
@@ -0,0 +1,27 @@
+"""Media image variants
+
+Revision ID: f2b7c9d41e86
+Revises: d8a4b6e2f019
+Create Date: 2026-10-18 07:24:51.093372
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "f2b7c9d41e86"
+down_revision: Union[str, None] = "d8a4b6e2f019"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column("media", sa.Column("variants", sa.JSON(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("media", "variants")
@@ -1,23 +1,74 @@
 from app.services import (
+    ORIGINAL_IMAGE,
+    api_key_cache,
+    backfill_timeline,
     celery_task_delete_media,
+    celery_task_delete_media_batch,
     check_unique_user,
+    close_http_session,
+    close_image_pool,
+    close_timeline_store,
     create_folder,
     delete_folder_recursive,
+    encode_cursor,
+    etag_matches,
     exception_handler,
+    fan_out_tweet,
+    follow_users,
+    followed_user_ids,
     get_direct_link,
     get_file_shareable_link,
     get_media_by_ids,
     get_media_by_user_id_tweet_id,
+    get_media_storage,
     get_users,
+    hash_upload,
+    last_seen_buffer,
+    like_tweet,
+    liked_tweet_ids,
+    likers_sample,
+    make_etag,
+    media_by_content_hash,
+    media_by_id,
+    media_ingest_queue,
+    open_http_session,
+    process_upload,
+    prune_timeline,
+    relations_sample,
+    release_media,
+    repair_follow_counters,
+    retract_tweet,
+    store_upload,
+    timeline_tweets,
     tweet_by_id,
     tweet_by_id_with_details,
+    tweet_version,
+    tweets_by_text,
     tweets_by_user_ids,
+    unfollow_users,
+    unlike_tweet,
     upload_file_to_disk,
     user_by_api_key,
     user_by_id,
+    user_id_by_api_key,
+    user_version,
+    variant_file_name,
+)
+from config.config import (
+    FAST_JSON,
+    LIKES_SAMPLE_SIZE,
+    MEDIA_ASYNC_INGESTION,
+    MEDIA_BATCH_CONCURRENCY,
+    MEDIA_BATCH_MAX_FILES,
+    MEDIA_CHUNK_SIZE,
+    MEDIA_MAX_SIZE,
+    PROFILE_SAMPLE_SIZE,
+    YANDEX_DISK_APP_FOLDER_PATH,
+    YANDEX_DISK_TOKEN,
+    get_db,
 )
-from config.config import YANDEX_DISK_APP_FOLDER_PATH, YANDEX_DISK_TOKEN, get_db
 from config.logging_config import logger
 
-from .models import Media, Tweet, User
+from .models import MEDIA_FAILED, MEDIA_PENDING, MEDIA_READY, Media, Tweet, User
+from .responses import FastJSONResponse
 from .schemas import *
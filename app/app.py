@@ -1,11 +1,36 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 
-from config.config import engine
-from config.logging_config import logger
+from config.config import (
+    MEDIA_BATCH_MAX_FILES,
+    MEDIA_MAX_SIZE,
+    METRICS_ENABLED,
+    SQL_DEBUG_HEADERS,
+    SQL_REPEAT_THRESHOLD,
+    async_session,
+    engine,
+)
+from config.logging_config import LOG_MODE, logger
 
-from . import events, models
+from . import (
+    close_http_session,
+    close_image_pool,
+    close_timeline_store,
+    events,
+    last_seen_buffer,
+    media_ingest_queue,
+    models,
+    open_http_session,
+)
+from .middlewares import (
+    BodySizeLimitMiddleware,
+    LogContextMiddleware,
+    MetricsMiddleware,
+    QueryStatsMiddleware,
+)
 from .routes import medias_router, tweets_router, users_router
+from .services.metrics import CONTENT_TYPE, registry
 
 app_logger = logger.bind(name="app")
 
@@ -21,11 +46,20 @@ async def startup():
         await conn.run_sync(models.Base.metadata.create_all)
         app_logger.debug("🔄 Tables are created 🔄")
 
+    last_seen_buffer.start(async_session)
+    await open_http_session()
+    await media_ingest_queue.start(async_session)
+
 
 @app.on_event("shutdown")
 async def shutdown():
     """Function before the end of the application (close connection, session)"""
     app_logger.debug("⤵️ App is stopped ⤵️")
+    await media_ingest_queue.stop()
+    await last_seen_buffer.stop(async_session)
+    await close_timeline_store()
+    await close_http_session()
+    close_image_pool()
     await engine.dispose()
 
 
@@ -33,6 +67,20 @@ origins = [
     "http://localhost:3000",
 ]
 
+# added before CORS, which wraps them so that their 413 responses carry its headers
+# room for the multipart envelope around the file(s)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_size=MEDIA_MAX_SIZE + 64 * 1024,
+    path_prefix="/api/medias",
+    exclude_prefix="/api/medias/batch",
+)
+app.add_middleware(
+    BodySizeLimitMiddleware,
+    max_size=(MEDIA_MAX_SIZE + 64 * 1024) * MEDIA_BATCH_MAX_FILES,
+    path_prefix="/api/medias/batch",
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -41,6 +89,19 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(
+    QueryStatsMiddleware,
+    expose_headers=SQL_DEBUG_HEADERS,
+    repeat_threshold=SQL_REPEAT_THRESHOLD,
+)
+
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# per-route sampling of the fast log mode
+if LOG_MODE == "fast":
+    app.add_middleware(LogContextMiddleware)
+
 app.include_router(medias_router)
 app.include_router(tweets_router)
 app.include_router(users_router)
@@ -50,3 +111,11 @@ app.include_router(users_router)
 def root():
     app_logger.info(" app.get('/api/healthchecker') ")
     return {"message": "The API is LIVE!!"}
+
+
+if METRICS_ENABLED:
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        """Metrics of this worker process in the Prometheus text format"""
+        return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
@@ -1,12 +1,25 @@
 from celery import group
 from sqlalchemy import event
 
-from app import Tweet
+from app import Tweet, User, api_key_cache
 from config.logging_config import logger
 
 app_logger = logger.bind(name="app")
 
 
+@event.listens_for(User.api_key, "set")
+def invalidate_replaced_api_key(target, value, oldvalue, initiator):
+    """Drop the cached identity of an api_key as soon as it is replaced"""
+    if isinstance(oldvalue, str):
+        api_key_cache.invalidate(oldvalue)
+
+
+@event.listens_for(User, "after_delete")
+def invalidate_deleted_user_api_key(mapper, connection, target):
+    """Drop the cached identity of a deleted user's api_key"""
+    api_key_cache.invalidate(target.api_key)
+
+
 # @event.listens_for(Tweet, "after_delete")
 # def trigger(mapper, connection, target):
 #     """Trigger for ... """
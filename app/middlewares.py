@@ -0,0 +1,194 @@
+import json
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.exceptions import HTTPException
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.metrics import (
+    http_request_duration_seconds,
+    http_requests_in_flight,
+    http_requests_total,
+)
+from config.logging_config import current_request, logger
+from config.query_stats import count_queries
+
+app_logger = logger.bind(name="app")
+
+BODY_TOO_LARGE_DETAIL = {
+    "result": False,
+    "error_type": 413,
+    "error_message": "File is too large",
+}
+
+
+class BodyTooLargeError(HTTPException):
+    """Raised from receive(), FastAPI lets HTTPException out of body parsing as is"""
+
+    def __init__(self):
+        super().__init__(status_code=413, detail=BODY_TOO_LARGE_DETAIL)
+
+
+class BodySizeLimitMiddleware:
+    """
+    Reject request bodies larger than max_size under path_prefix (except exclude_prefix,
+    which has a limit of its own) with 413.
+    Checked against Content-Length up front and against the received bytes while streaming,
+    so an oversized upload is cut off before it is spooled completely.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        max_size: int,
+        path_prefix: str = "/",
+        exclude_prefix: str | None = None,
+    ):
+        self.app = app
+        self.max_size = max_size
+        self.path_prefix = path_prefix
+        self.exclude_prefix = exclude_prefix
+
+    def applies_to(self, path: str) -> bool:
+        if self.exclude_prefix is not None and path.startswith(self.exclude_prefix):
+            return False
+        return path.startswith(self.path_prefix)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.applies_to(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > self.max_size:
+            await self.reject(send)
+            return
+
+        received = 0
+        response_started = False
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_size:
+                    raise BodyTooLargeError
+            return message
+
+        async def tracked_send(message: Message) -> None:
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracked_send)
+        except BodyTooLargeError:
+            if response_started:
+                raise
+            await self.reject(send)
+
+    @staticmethod
+    async def reject(send: Send) -> None:
+        body = json.dumps({"detail": BODY_TOO_LARGE_DETAIL}).encode()
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 413,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
+
+
+class QueryStatsMiddleware:
+    """
+    Count the SQL statements of every request, log shapes repeated `repeat_threshold` times
+    (N+1 candidates) and, with `expose_headers`, report the numbers in X-DB-* headers.
+    """
+
+    def __init__(self, app: ASGIApp, expose_headers: bool = False, repeat_threshold: int = 3):
+        self.app = app
+        self.expose_headers = expose_headers
+        self.repeat_threshold = repeat_threshold
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with count_queries() as stats:
+
+            async def send_with_stats(message: Message) -> None:
+                if message["type"] == "http.response.start":
+                    repeated = stats.repeated(self.repeat_threshold)
+                    for shape, n in repeated.items():
+                        app_logger.warning(
+                            f"{scope['method']} {scope['path']}: statement executed {n} times: "
+                            f"{shape}"
+                        )
+                    if self.expose_headers:
+                        headers = MutableHeaders(scope=message)
+                        headers["X-DB-Queries"] = str(stats.count)
+                        headers["X-DB-Time-Ms"] = f"{stats.duration * 1000:.2f}"
+                        headers["X-DB-Repeated"] = str(sum(repeated.values()))
+                await send(message)
+
+            await self.app(scope, receive, send_with_stats)
+
+
+class MetricsMiddleware:
+    """
+    Request count, latency and in-flight gauge per route template
+    (the matched route's path, so path parameters don't multiply the series)
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", "<unmatched>")
+            http_request_duration_seconds.observe(
+                time.perf_counter() - started, scope["method"], route_path
+            )
+            http_requests_total.inc(scope["method"], route_path, str(status))
+
+
+class LogContextMiddleware:
+    """Expose the request's scope to the log sampler (its route is known once routed)"""
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = current_request.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_request.reset(token)
@@ -1,3 +1,4 @@
+import hashlib
 from datetime import datetime, timezone
 from typing import Optional, Sequence
 
@@ -7,6 +8,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from config.config import Base
 
+
+def hash_api_key(api_key: str) -> str:
+    """Digest under which an api_key is stored and looked up"""
+    return hashlib.sha256(api_key.encode()).hexdigest()
+
+
 followers = sa.Table(
     "followers",
     Base.metadata,
@@ -42,11 +49,24 @@ class User(Base):
         sa.String(120), index=True, unique=True, nullable=False
     )
     about_me: so.Mapped[Optional[str]] = so.mapped_column(sa.String(140))
-    api_key: so.Mapped[str] = so.mapped_column(sa.String(256), nullable=False)
+    api_key: so.Mapped[str] = so.mapped_column(
+        sa.String(256), index=True, unique=True, nullable=False
+    )
 
     last_seen: so.Mapped[datetime] = so.mapped_column(
         sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()
     )
+    # bumped whenever the user's followers or following change (ETag of the profile)
+    version: so.Mapped[int] = so.mapped_column(
+        sa.Integer, nullable=False, default=1, server_default="1"
+    )
+    # maintained by User.update_follow_counters, see user_service.repair_follow_counters
+    followers_count: so.Mapped[int] = so.mapped_column(
+        sa.Integer, nullable=False, default=0, server_default="0"
+    )
+    following_count: so.Mapped[int] = so.mapped_column(
+        sa.Integer, nullable=False, default=0, server_default="0"
+    )
 
     tweets: so.Mapped[list["Tweet"]] = so.relationship(
         "Tweet", back_populates="author", passive_deletes=True
@@ -70,6 +90,11 @@ class User(Base):
         back_populates="following",
     )
 
+    @so.validates("api_key")
+    def validate_api_key(self, key: str, api_key: str) -> str:
+        """Only the digest of the key is ever persisted"""
+        return hash_api_key(api_key)
+
     async def set_api_key(self, api_key: str):
         self.api_key = api_key
 
@@ -90,62 +115,79 @@ class User(Base):
             await session.execute(
                 followers.insert().values(follower_id=self.id, followed_id=user.id)
             )
+            await User.update_follow_counters(session, self.id, [user.id], 1)
             await session.commit()
 
     async def unfollow(self, session: AsyncSession, user: "User"):
-        await session.execute(
+        result = await session.execute(
             followers.delete().where(
                 (followers.c.follower_id == self.id) & (followers.c.followed_id == user.id)
             )
         )
+        if result.rowcount:
+            await User.update_follow_counters(session, self.id, [user.id], -1)
         await session.commit()
 
-    async def followers_count(self, session: AsyncSession) -> int:
-        query = sa.select(sa.func.count()).where(followers.c.followed_id == self.id)
-        result = await session.execute(query)
-        return result.scalar()
-
-    async def following_count(self, session: AsyncSession) -> int:
-        query = sa.select(sa.func.count()).where(followers.c.follower_id == self.id)
-        result = await session.execute(query)
-        return result.scalar()
-
-    async def like_tweet(self, session: AsyncSession, tweet: "Tweet") -> None:
-        query = sa.select(
-            sa.exists().where((likes.c.user_id == self.id) & (likes.c.tweet_id == tweet.id))
-        )
-        result = await session.execute(query)
-        already_liked = result.scalar()
-
-        if not already_liked:
-            await session.execute(likes.insert().values(user_id=self.id, tweet_id=tweet.id))
-            await session.commit()
-
-    async def unlike_tweet(self, session: AsyncSession, tweet: "Tweet") -> None:
-        query = sa.select(
-            sa.exists().where((likes.c.user_id == self.id) & (likes.c.tweet_id == tweet.id))
-        )
-        result = await session.execute(query)
-        liked = result.scalar()
-
-        if liked:
-            await session.execute(
-                likes.delete().where((likes.c.user_id == self.id) & (likes.c.tweet_id == tweet.id))
+    @staticmethod
+    async def update_follow_counters(
+        session: AsyncSession, follower_id: int, followed_ids: Sequence[int], delta: int
+    ):
+        """
+        Count `delta` relations per followed user in one UPDATE, inside the caller's transaction.
+        Both profiles list the relation, so their versions are bumped too.
+        """
+        followed_ids = list(followed_ids)
+        await session.execute(
+            sa.update(User)
+            .where(User.id.in_([follower_id, *followed_ids]))
+            .values(
+                following_count=User.following_count
+                + sa.case((User.id == follower_id, delta * len(followed_ids)), else_=0),
+                followers_count=User.followers_count
+                + sa.case((User.id.in_(followed_ids), delta), else_=0),
+                version=User.version + 1,
             )
-            await session.commit()
+        )
 
     def __repr__(self):
         return f"<User {self.username}>"
 
 
+# media states: stored (ready), accepted and being stored in the background (pending), failed
+MEDIA_READY = "ready"
+MEDIA_PENDING = "pending"
+MEDIA_FAILED = "failed"
+
+
 class Media(Base):
     __tablename__ = "media"
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
-    image_link: so.Mapped[str] = so.mapped_column(sa.String(), nullable=False)
+    # None until a pending upload is stored
+    image_link: so.Mapped[Optional[str]] = so.mapped_column(sa.String(), nullable=True)
     file_name: so.Mapped[str] = so.mapped_column(sa.String(), nullable=False)
     tweet_id: so.Mapped[int] = so.mapped_column(
         sa.ForeignKey("tweets.id", ondelete="CASCADE"), index=True, nullable=True
     )
+    # sha256 of the uploaded bytes, media with the same hash share the stored files
+    content_hash: so.Mapped[Optional[str]] = so.mapped_column(
+        sa.String(64), index=True, nullable=True
+    )
+    status: so.Mapped[str] = so.mapped_column(
+        sa.String(16), nullable=False, default=MEDIA_READY, server_default=MEDIA_READY
+    )
+    # smaller sizes of a processed image: {name: {"file_name": ..., "link": ...}}
+    variants: so.Mapped[Optional[dict]] = so.mapped_column(sa.JSON, nullable=True)
+
+    @property
+    def file_names(self) -> list[str]:
+        """Every file stored for the media"""
+        variants = (self.variants or {}).values()
+        return [self.file_name, *(variant["file_name"] for variant in variants)]
+
+    @property
+    def variant_links(self) -> dict[str, str]:
+        """Links of the smaller sizes by variant name"""
+        return {name: variant["link"] for name, variant in (self.variants or {}).items()}
 
     def __repr__(self):
         return f"<Media {self.id}: {self.image_link}>"
@@ -156,10 +198,20 @@ class Tweet(Base):
     id: so.Mapped[int] = so.mapped_column(primary_key=True)
     tweet_data: so.Mapped[Optional[str]] = so.mapped_column(sa.String(1000))
     timestamp: so.Mapped[datetime] = so.mapped_column(
-        sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()
+        sa.DateTime(timezone=True),
+        nullable=False,
+        default=lambda: datetime.now(timezone.utc),
+        server_default=sa.func.now(),
+    )
+    # lookups by author use the leading column of ix_tweets_user_id_timestamp_id
+    user_id: so.Mapped[int] = so.mapped_column(sa.ForeignKey("users.id", ondelete="CASCADE"))
+    # maintained by tweet_service.like_tweet / unlike_tweet
+    likes_count: so.Mapped[int] = so.mapped_column(
+        sa.Integer, nullable=False, default=0, server_default="0"
     )
-    user_id: so.Mapped[int] = so.mapped_column(
-        sa.ForeignKey("users.id", ondelete="CASCADE"), index=True
+    # bumped whenever likes or media of the tweet change (ETag of the tweet)
+    version: so.Mapped[int] = so.mapped_column(
+        sa.Integer, nullable=False, default=1, server_default="1"
     )
     author: so.Mapped[User] = so.relationship("User", back_populates="tweets")
     liked_by: so.Mapped[list[User]] = so.relationship(
@@ -172,9 +224,54 @@ class Tweet(Base):
     async def set_tweet_media(self, db: AsyncSession, media: Sequence[Media]):
         for m in media:
             m.tweet_id = self.id
+        self.version = (self.version or 1) + 1
 
         await db.flush()
         await db.refresh(self)
 
     def __repr__(self):
         return f"<Tweet {self.id} by {self.user_id}>"
+
+
+# feed order (see tweet_service.tweets_by_user_ids)
+sa.Index("ix_tweets_user_id_timestamp_id", Tweet.user_id, Tweet.timestamp.desc(), Tweet.id.desc())
+# reverse lookups the primary keys don't cover: likers of a tweet, followers of a user
+sa.Index("ix_likes_tweet_id_user_id", likes.c.tweet_id, likes.c.user_id)
+sa.Index("ix_followers_followed_id_follower_id", followers.c.followed_id, followers.c.follower_id)
+
+
+# full-text search over tweet_data (see tweet_service.tweets_by_text), created with the table:
+# PostgreSQL gets a generated tsvector column with a GIN index, SQLite an FTS5 index kept
+# up to date by triggers
+SEARCH_CONFIG = "simple"
+
+for statement in (
+    "ALTER TABLE tweets ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS "
+    f"(to_tsvector('{SEARCH_CONFIG}', coalesce(tweet_data, ''))) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_tweets_search_vector ON tweets USING gin (search_vector)",
+):
+    sa.event.listen(
+        Tweet.__table__, "after_create", sa.DDL(statement).execute_if(dialect="postgresql")
+    )
+
+for statement in (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS tweets_fts "
+    "USING fts5(tweet_data, content='tweets', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS tweets_fts_insert AFTER INSERT ON tweets BEGIN "
+    "INSERT INTO tweets_fts (rowid, tweet_data) VALUES (new.id, new.tweet_data); END",
+    "CREATE TRIGGER IF NOT EXISTS tweets_fts_delete AFTER DELETE ON tweets BEGIN "
+    "INSERT INTO tweets_fts (tweets_fts, rowid, tweet_data) "
+    "VALUES ('delete', old.id, old.tweet_data); END",
+    "CREATE TRIGGER IF NOT EXISTS tweets_fts_update AFTER UPDATE OF tweet_data ON tweets BEGIN "
+    "INSERT INTO tweets_fts (tweets_fts, rowid, tweet_data) "
+    "VALUES ('delete', old.id, old.tweet_data); "
+    "INSERT INTO tweets_fts (rowid, tweet_data) VALUES (new.id, new.tweet_data); END",
+):
+    sa.event.listen(
+        Tweet.__table__, "after_create", sa.DDL(statement).execute_if(dialect="sqlite")
+    )
+sa.event.listen(
+    Tweet.__table__,
+    "before_drop",
+    sa.DDL("DROP TABLE IF EXISTS tweets_fts").execute_if(dialect="sqlite"),
+)
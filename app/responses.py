@@ -0,0 +1,14 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import JSONResponse
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON response for payloads that are already plain dicts/lists/str/int, rendered with orjson.
+    Returned directly from a route, it also skips the response_model validation.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
@@ -1,31 +1,144 @@
+import asyncio
 import os
 import uuid
 
-import aiofiles
 from fastapi import APIRouter, Depends, File, Header, HTTPException, UploadFile
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import (
-    YANDEX_DISK_APP_FOLDER_PATH,
-    YANDEX_DISK_TOKEN,
+    MEDIA_ASYNC_INGESTION,
+    MEDIA_BATCH_CONCURRENCY,
+    MEDIA_BATCH_MAX_FILES,
+    MEDIA_CHUNK_SIZE,
+    MEDIA_MAX_SIZE,
+    MEDIA_PENDING,
     Media,
-    create_folder,
-    delete_folder_recursive,
     get_db,
-    get_direct_link,
-    get_file_shareable_link,
+    get_media_storage,
+    hash_upload,
     logger,
-    upload_file_to_disk,
-    user_by_api_key,
+    media_by_content_hash,
+    media_by_id,
+    media_ingest_queue,
+    store_upload,
+    user_id_by_api_key,
 )
 
 medias_router = APIRouter(prefix="/api/medias", tags=["Medias"])
 app_logger = logger.bind(name="app")
 
-uploads_path = os.path.join(
-    os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
-    "uploads",
-)
+
+def upload_file_name(file: UploadFile) -> str:
+    """Unique storage name keeping the base name of the client's file"""
+    return f"{uuid.uuid4()}_{os.path.basename(file.filename or 'file')}"
+
+
+def too_large() -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail={
+            "result": False,
+            "error_type": 413,
+            "error_message": "File is too large",
+        },
+    )
+
+
+def shared_media(source: Media, content_hash: str) -> Media:
+    """New media referencing the files of `source`"""
+    return Media(
+        image_link=source.image_link,
+        file_name=source.file_name,
+        variants=source.variants,
+        content_hash=content_hash,
+        status=source.status,
+    )
+
+
+async def discard_media(media: list[Media]) -> None:
+    """Remove the files stored (or staged) for media that are not committed"""
+    for item in media:
+        if item.status == MEDIA_PENDING:
+            await media_ingest_queue.unstage(item.file_name)
+        else:
+            await get_media_storage().discard(item.file_names)
+
+
+async def add_media(db: AsyncSession, files: list[UploadFile], concurrency: int) -> list[Media]:
+    """
+    Media of the uploaded files, committed together in the order of the files.
+    Content already stored (or repeated in the batch) is stored once, the other media
+    share its files. Other files are stored (only staged with MEDIA_ASYNC_INGESTION,
+    then queued) at most `concurrency` at a time. If any file fails or the commit does,
+    the files stored for the others are discarded
+    """
+    for file in files:
+        if file.size is not None and file.size > MEDIA_MAX_SIZE:
+            app_logger.error(f"File {file.filename} exceeds {MEDIA_MAX_SIZE} bytes")
+            raise too_large()
+
+    hashes = [await hash_upload(file, MEDIA_CHUNK_SIZE, MEDIA_MAX_SIZE) for file in files]
+    sources: dict[str, Media] = {}
+    for content_hash in dict.fromkeys(hashes):
+        source = await media_by_content_hash(db, content_hash)
+        if source is not None:
+            sources[content_hash] = source
+    # the first file of every new content
+    new_files: dict[str, UploadFile] = {}
+    for file, content_hash in zip(files, hashes):
+        if content_hash not in sources:
+            new_files.setdefault(content_hash, file)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def create(file: UploadFile, content_hash: str) -> Media:
+        async with semaphore:
+            file_name = upload_file_name(file)
+            if MEDIA_ASYNC_INGESTION:
+                await media_ingest_queue.stage(file, file_name)
+                return Media(file_name=file_name, content_hash=content_hash, status=MEDIA_PENDING)
+            return await store_upload(file, file_name, content_hash)
+
+    results = await asyncio.gather(
+        *(create(file, content_hash) for content_hash, file in new_files.items()),
+        return_exceptions=True,
+    )
+    stored = [result for result in results if isinstance(result, Media)]
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        await discard_media(stored)
+        raise errors[0]
+
+    created: dict[str, Media] = {
+        content_hash: result
+        for content_hash, result in zip(new_files, results)
+        if isinstance(result, Media)
+    }
+    media: list[Media] = []
+    for file, content_hash in zip(files, hashes):
+        if new_files.get(content_hash) is file:
+            media.append(created[content_hash])
+            continue
+        source = sources.get(content_hash) or created[content_hash]
+        app_logger.info("{} is stored as {}, reusing it", file.filename, source.file_name)
+        media.append(shared_media(source, content_hash))
+
+    try:
+        db.add_all(media)
+        await db.flush()
+        media_ids = [item.id for item in media]
+        queued = [(item.id, item.file_name) for item in stored if item.status == MEDIA_PENDING]
+        await db.commit()
+        app_logger.info("Media created (IDs: {})", media_ids)
+    except Exception:
+        app_logger.exception("Database commit error")
+        await db.rollback()
+        await discard_media(stored)
+        raise Exception("Failed to create new Media")
+
+    # media sharing a staged file are ingested with the first one
+    for media_id, file_name in queued:
+        media_ingest_queue.enqueue(media_id, file_name)
+    return media
 
 
 @medias_router.post("/", status_code=201, response_model=dict)
@@ -34,55 +147,64 @@ async def download_media(
     db: AsyncSession = Depends(get_db),
     api_key: str = Header(..., convert_underscores=False),
 ):
-    """Media file download and publication on Yandex.Disk"""
-    app_logger.info(f"POST /api/medias")
+    """
+    Media file download and publication in the media storage
+    Images are re-encoded without metadata and downscaled in the image pool, their smaller
+    variants are stored next to them. Other files are streamed to the disk in chunks
+    straight from the request's spool. Content already on the disk is not uploaded again,
+    the new media shares the stored files.
+    With MEDIA_ASYNC_INGESTION the file is only staged, the media is returned pending and
+    stored by the ingest workers (see GET /api/medias/{media_id})
+    """
+    app_logger.info("POST /api/medias")
 
     try:
-        existing_user = await user_by_api_key(api_key=api_key, db=db)
+        await user_id_by_api_key(api_key=api_key, db=db)
+        (new_media,) = await add_media(db, [file], concurrency=1)
+        return {"result": True, "media_id": new_media.id, "status": new_media.status}
+
+    except HTTPException as http_ex:
+        if http_ex.status_code == 500:
+            app_logger.exception("Internal server error")
+            raise HTTPException(status_code=500, detail={"result": False})
+        raise http_ex
 
-        file_name = f"{uuid.uuid4()}_{file.filename}"
-        user_folder = os.path.join(uploads_path, str(existing_user.id))
-        file_path = os.path.join(user_folder, file_name)
+    except Exception as e:
+        app_logger.exception(f"Critical error: {str(e)}")
+        raise HTTPException(status_code=500, detail={"result": False})
 
-        await create_folder(user_folder)
-        app_logger.debug(f"Created folder: {user_folder}")
 
-        async with aiofiles.open(file_path, "wb") as buffer:
-            await buffer.write(await file.read())
-        app_logger.info(f"File saved locally: {file_path}")
+@medias_router.post("/batch", status_code=201, response_model=dict)
+async def download_media_batch(
+    files: list[UploadFile] = File(...),
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Header(..., convert_underscores=False),
+):
+    """
+    Several media files download func
+    Same as POST /api/medias for up to MEDIA_BATCH_MAX_FILES files with one authentication
+    and one commit, the files are stored MEDIA_BATCH_CONCURRENCY at a time.
+    The media ids are returned in the order of the files
+    """
+    app_logger.info("POST /api/medias/batch ({} files)", len(files))
 
-        try:
-            uploaded = await upload_file_to_disk(
-                user_folder, file_name, YANDEX_DISK_APP_FOLDER_PATH, YANDEX_DISK_TOKEN
+    try:
+        await user_id_by_api_key(api_key=api_key, db=db)
+        if len(files) > MEDIA_BATCH_MAX_FILES:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "result": False,
+                    "error_type": 400,
+                    "error_message": f"At most {MEDIA_BATCH_MAX_FILES} files per request",
+                },
             )
-            if not uploaded:
-                app_logger.error("Yandex.Disk upload failed")
-                raise Exception
-        except Exception as e:
-            app_logger.exception("Yandex.Disk upload error")
-            raise
-
-        yandex_disk_file_path = f"{YANDEX_DISK_APP_FOLDER_PATH}/{file_name}"
-        public_url = await get_file_shareable_link(yandex_disk_file_path, YANDEX_DISK_TOKEN)
-        direct_url = await get_direct_link(public_url) if public_url else None
-
-        if not direct_url:
-            app_logger.error("Failed to get direct link")
-            raise Exception("Failed to get direct link")
-
-        try:
-            new_media = Media(image_link=direct_url, file_name=file_name)
-            db.add(new_media)
-            await db.commit()
-            await db.refresh(new_media)
-            app_logger.info(f"Media created (ID: {new_media.id})")
-        except Exception as e:
-            app_logger.exception("Database commit error")
-            await db.rollback()
-            raise Exception("Failed to create new Media")
-
-        await delete_folder_recursive(user_folder)
-        return {"result": True, "media_id": new_media.id}
+        media = await add_media(db, files, concurrency=MEDIA_BATCH_CONCURRENCY)
+        return {
+            "result": True,
+            "media_ids": [m.id for m in media],
+            "statuses": [m.status for m in media],
+        }
 
     except HTTPException as http_ex:
         if http_ex.status_code == 500:
@@ -93,3 +215,55 @@ async def download_media(
     except Exception as e:
         app_logger.exception(f"Critical error: {str(e)}")
         raise HTTPException(status_code=500, detail={"result": False})
+
+
+@medias_router.get("/files/{file_name}", status_code=200)
+async def get_media_file(file_name: str):
+    """
+    Stored media file func
+    Served by the media storage: the local one sends the file (Range requests included),
+    Yandex.Disk redirects to its download URL
+    """
+    response = await get_media_storage().stream(file_name)
+    if response is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "result": False,
+                "error_type": 404,
+                "error_message": f"File {file_name} not found",
+            },
+        )
+    return response
+
+
+@medias_router.get("/{media_id}", status_code=200, response_model=dict)
+async def get_media_status(
+    media_id: int,
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Header(..., convert_underscores=False),
+):
+    """
+    Media status func
+    pending while an accepted upload is being stored, then ready (with its link) or failed
+    """
+    app_logger.info("GET /api/medias/{}", media_id)
+
+    await user_id_by_api_key(api_key=api_key, db=db)
+    media = await media_by_id(db, media_id)
+    if media is None:
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "result": False,
+                "error_type": 404,
+                "error_message": f"Media id={media_id} not found",
+            },
+        )
+    return {
+        "result": True,
+        "media_id": media.id,
+        "status": media.status,
+        "link": media.image_link,
+        "variants": media.variant_links,
+    }
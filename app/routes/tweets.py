@@ -1,32 +1,88 @@
-from celery import group
-from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query
+from typing import Optional, Sequence
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import (
-    YANDEX_DISK_APP_FOLDER_PATH,
-    Author,
-    Like,
+    FAST_JSON,
+    LIKES_SAMPLE_SIZE,
+    MEDIA_FAILED,
+    MEDIA_READY,
+    FastJSONResponse,
     Tweet,
     TweetCreate,
     TweetCreateResponse,
     TweetListResponse,
     TweetResponse,
-    celery_task_delete_media,
+    encode_cursor,
+    etag_matches,
     exception_handler,
+    fan_out_tweet,
+    followed_user_ids,
     get_db,
     get_media_by_ids,
     get_media_by_user_id_tweet_id,
+    get_media_storage,
+    like_tweet,
+    liked_tweet_ids,
+    likers_sample,
     logger,
+    make_etag,
+    release_media,
+    retract_tweet,
+    timeline_tweets,
     tweet_by_id,
     tweet_by_id_with_details,
+    tweet_version,
+    tweets_by_text,
     tweets_by_user_ids,
-    user_by_api_key,
+    unlike_tweet,
+    user_id_by_api_key,
 )
 
 tweets_router = APIRouter(prefix="/api/tweets", tags=["Tweets"])
 app_logger = logger.bind(name="app")
 
 
+async def tweet_payloads(
+    db: AsyncSession, tweets: Sequence[Tweet], current_user_id: int
+) -> list[dict]:
+    """
+    Tweets as seen by the current user, with a bounded sample of likers.
+    Plain dicts in the shape of TweetResponse, built once for both response paths.
+    """
+    tweet_ids = [tweet.id for tweet in tweets]
+    likers = await likers_sample(db, tweet_ids, LIKES_SAMPLE_SIZE)
+    liked_ids = await liked_tweet_ids(db, current_user_id, tweet_ids)
+    ready_media = {
+        tweet.id: [media for media in tweet.tweet_media if media.status == MEDIA_READY]
+        for tweet in tweets
+    }
+    return [
+        {
+            "id": tweet.id,
+            "content": tweet.tweet_data or "",
+            "attachments": [media.image_link for media in ready_media[tweet.id]],
+            "attachment_variants": [media.variant_links for media in ready_media[tweet.id]],
+            "author": {"id": tweet.author.id, "name": tweet.author.username},
+            "likes": [{"user_id": user_id, "name": name} for user_id, name in likers[tweet.id]],
+            "likes_count": tweet.likes_count,
+            "liked": tweet.id in liked_ids,
+        }
+        for tweet in tweets
+    ]
+
+
+def tweet_list_response(payloads: list[dict], next_cursor: str | None = None):
+    """
+    With FAST_JSON the payloads are rendered as they are, skipping the Pydantic models
+    and the response_model validation, otherwise they go through TweetListResponse
+    """
+    if FAST_JSON:
+        return FastJSONResponse({"result": True, "tweets": payloads, "next_cursor": next_cursor})
+    return TweetListResponse(result=True, tweets=payloads, next_cursor=next_cursor)
+
+
 @tweets_router.post("/", status_code=201, response_model=TweetCreateResponse)
 @exception_handler()
 async def create_new_tweet(
@@ -35,9 +91,9 @@ async def create_new_tweet(
     api_key: str = Header(..., convert_underscores=False),
 ):
     """Create new tweet func"""
-    app_logger.info(f"POST/api/tweets")
+    app_logger.info("POST/api/tweets")
 
-    current_user = await user_by_api_key(api_key=api_key, db=db)
+    current_user_id = await user_id_by_api_key(api_key=api_key, db=db)
     if not tweet_in.tweet_data and not tweet_in.media_ids:
         raise HTTPException(
             status_code=400,
@@ -47,7 +103,7 @@ async def create_new_tweet(
                 "error_message": "Tweet text or media required",
             },
         )
-    new_tweet = Tweet(tweet_data=tweet_in.tweet_data, user_id=current_user.id)
+    new_tweet = Tweet(tweet_data=tweet_in.tweet_data, user_id=current_user_id)
     db.add(new_tweet)
     await db.flush()
 
@@ -64,10 +120,22 @@ async def create_new_tweet(
                     "error_message": f"Media not found: {missing}",
                 },
             )
+        failed = {m.id for m in media_list if m.status == MEDIA_FAILED}
+        if failed:
+            raise HTTPException(
+                status_code=400,
+                detail={
+                    "result": False,
+                    "error_type": 400,
+                    "error_message": f"Media failed to upload: {failed}",
+                },
+            )
+        # pending media are attached as well, they show up once stored
         await new_tweet.set_tweet_media(db=db, media=media_list)
 
     await db.commit()
-    app_logger.info(f"Tweet {new_tweet.id} created successfully by user {current_user.id}")
+    await fan_out_tweet(db, author_id=current_user_id, tweet_id=new_tweet.id)
+    app_logger.info("Tweet {} created successfully by user {}", new_tweet.id, current_user_id)
     return {"result": True, "tweet_id": new_tweet.id}
 
 
@@ -78,53 +146,79 @@ async def get_tweets(
     api_key: str = Header(..., convert_underscores=False),
     limit: int = Query(10, ge=1, le=30),
     offset: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
 ):
-    """Get tweets func"""
-    app_logger.info(f"GET/api/tweets")
-
-    current_user = await user_by_api_key(api_key=api_key, db=db, _with="following")
-    followed_ids = [u.id for u in current_user.following]
-    if not followed_ids:
-        return TweetListResponse(result=True, tweets=[])
-
-    tweets = await tweets_by_user_ids(db, followed_ids, limit, offset)
-    tweets_data = []
-    for tweet in tweets:
-        attachments = [media.image_link for media in tweet.tweet_media]
-        likes_data = [Like(user_id=user.id, name=user.username) for user in tweet.liked_by]
-        tweets_data.append(
-            TweetResponse(
-                id=tweet.id,
-                content=tweet.tweet_data or "",
-                attachments=attachments,
-                author=Author(id=tweet.author.id, name=tweet.author.username),
-                likes=likes_data,
-            )
-        )
-    return TweetListResponse(result=True, tweets=tweets_data)
+    """
+    Get tweets func
+    Pass `next_cursor` of the previous page as `cursor` to page without an offset
+    """
+    app_logger.info("GET/api/tweets")
+
+    current_user_id = await user_id_by_api_key(api_key=api_key, db=db)
+    tweets = await timeline_tweets(db, current_user_id, limit, offset, cursor)
+    if tweets is None:
+        followed_ids = await followed_user_ids(db, current_user_id)
+        if not followed_ids:
+            return tweet_list_response([])
+        tweets = await tweets_by_user_ids(db, followed_ids, limit, offset, cursor)
+
+    tweets_data = await tweet_payloads(db, tweets, current_user_id)
+    next_cursor = encode_cursor(tweets[-1]) if len(tweets) == limit else None
+    return tweet_list_response(tweets_data, next_cursor)
+
+
+@tweets_router.get("/search", status_code=200, response_model=TweetListResponse)
+@exception_handler()
+async def search_tweets(
+    q: str = Query(..., min_length=1, max_length=200),
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Header(..., convert_underscores=False),
+    limit: int = Query(10, ge=1, le=30),
+    cursor: Optional[str] = Query(None),
+):
+    """
+    Search tweets func
+    Tweets containing every word of `q`, best match first,
+    pass `next_cursor` of the previous page as `cursor` for the next one
+    """
+    app_logger.info("GET/api/tweets/search")
+
+    current_user_id = await user_id_by_api_key(api_key=api_key, db=db)
+    tweets, next_cursor = await tweets_by_text(db, q, limit, cursor)
+    tweets_data = await tweet_payloads(db, tweets, current_user_id)
+    return tweet_list_response(tweets_data, next_cursor)
 
 
 @tweets_router.get("/{tweet_id}", status_code=200, response_model=TweetResponse)
 @exception_handler()
 async def get_tweet_by_id(
     tweet_id: int,
+    response: Response,
     db: AsyncSession = Depends(get_db),
     api_key: str = Header(..., convert_underscores=False),
+    if_none_match: Optional[str] = Header(None),
 ):
-    """Get tweet by id func"""
-    app_logger.info(f"GET/api/tweets")
+    """
+    Get tweet by id func
+    The ETag covers the tweet version and the viewer (`liked` is per user),
+    a matching If-None-Match is answered with 304 without loading the tweet
+    """
+    app_logger.info("GET/api/tweets")
+
+    current_user_id = await user_id_by_api_key(api_key=api_key, db=db)
+    version = await tweet_version(db, tweet_id)
+    if version is not None:
+        etag = make_etag(tweet_id, version, current_user_id)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
 
-    await user_by_api_key(api_key=api_key, db=db)
     tweet = await tweet_by_id_with_details(db=db, tweet_id=tweet_id)
-    attachments = [media.image_link for media in tweet.tweet_media]
-    likes_data = [Like(user_id=user.id, name=user.username) for user in tweet.liked_by]
-    return TweetResponse(
-        id=tweet.id,
-        content=tweet.tweet_data or "",
-        attachments=attachments,
-        author=Author(id=tweet.author.id, name=tweet.author.username),
-        likes=likes_data,
-    )
+    etag = make_etag(tweet.id, tweet.version, current_user_id)
+    tweet_data = (await tweet_payloads(db, [tweet], current_user_id))[0]
+    if FAST_JSON:
+        return FastJSONResponse(tweet_data, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return TweetResponse(**tweet_data)
 
 
 @tweets_router.delete("/{tweet_id}", status_code=200)
@@ -134,27 +228,28 @@ async def delete_tweet_by_id(
     db: AsyncSession = Depends(get_db),
     api_key: str = Header(..., convert_underscores=False),
 ):
-    """Delete tweet by id func"""
-    app_logger.info(f"DELETE/api/tweets/{tweet_id}")
+    """
+    Delete tweet by id func
+    Stored files are deleted only when no other media shares them
+    """
+    app_logger.info("DELETE/api/tweets/{}", tweet_id)
 
-    current_user = await user_by_api_key(api_key, db)
-    # File deletion
+    current_user_id = await user_id_by_api_key(api_key, db)
+    tweet = await tweet_by_id(tweet_id=tweet_id, db=db, user_id=current_user_id)
     media_files = await get_media_by_user_id_tweet_id(
-        db=db, user_id=current_user.id, tweet_id=tweet_id
+        db=db, user_id=current_user_id, tweet_id=tweet_id
     )
-    file_paths = [f"{YANDEX_DISK_APP_FOLDER_PATH[5:]}/{media.file_name}" for media in media_files]
-
-    if file_paths:
-        app_logger.debug(f"Triggering Celery tasks for files deletion: {file_paths}")
-        task_group = group(celery_task_delete_media.s(file_path) for file_path in file_paths)
-        task_group.apply_async()
-
-    # Tweet deletion
-    tweet = await tweet_by_id(tweet_id=tweet_id, db=db, user_id=current_user.id)
+    released = await release_media(db, media_files)
     await db.delete(tweet)
     await db.commit()
 
-    app_logger.info(f"Tweet {tweet_id} deleted successfully by user {current_user.id}")
+    # File deletion
+    if released:
+        await get_media_storage().discard(released)
+
+    await retract_tweet(db, author_id=current_user_id, tweet_id=tweet_id)
+
+    app_logger.info("Tweet {} deleted successfully by user {}", tweet_id, current_user_id)
     return {"result": True}
 
 
@@ -166,12 +261,22 @@ async def like_tweet_by_id(
     api_key: str = Header(..., convert_underscores=False),
 ):
     """Like tweet by id func"""
-    app_logger.info(f"POST/api/tweets/{tweet_id}/like")
+    app_logger.info("POST/api/tweets/{}/like", tweet_id)
 
-    current_user = await user_by_api_key(api_key, db)
-    tweet = await tweet_by_id(tweet_id=tweet_id, db=db)
-    await current_user.like_tweet(session=db, tweet=tweet)
-    app_logger.info(f"Tweet {tweet.id} liked successfully by user {current_user.id}")
+    current_user_id = await user_id_by_api_key(api_key=api_key, db=db)
+    tweet_exists, liked = await like_tweet(db, user_id=current_user_id, tweet_id=tweet_id)
+    if not tweet_exists:
+        app_logger.error(f"Tweet id={tweet_id} not found")
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "result": False,
+                "error_type": 404,
+                "error_message": f"Tweet id={tweet_id} not found",
+            },
+        )
+    if liked:
+        app_logger.info("Tweet {} liked successfully by user {}", tweet_id, current_user_id)
     return {"result": True}
 
 
@@ -183,10 +288,20 @@ async def delete_like_tweet_by_id(
     api_key: str = Header(..., convert_underscores=False),
 ):
     """Delete like tweet by id func"""
-    app_logger.info(f"DELETE/api/tweets/{tweet_id}/like")
+    app_logger.info("DELETE/api/tweets/{}/like", tweet_id)
 
-    current_user = await user_by_api_key(api_key, db)
-    tweet = await tweet_by_id(tweet_id=tweet_id, db=db)
-    await current_user.unlike_tweet(session=db, tweet=tweet)
-    app_logger.info(f"Tweet {tweet.id} like delete successfully by user {current_user.id}")
+    current_user_id = await user_id_by_api_key(api_key=api_key, db=db)
+    tweet_exists, unliked = await unlike_tweet(db, user_id=current_user_id, tweet_id=tweet_id)
+    if not tweet_exists:
+        app_logger.error(f"Tweet id={tweet_id} not found")
+        raise HTTPException(
+            status_code=404,
+            detail={
+                "result": False,
+                "error_type": 404,
+                "error_message": f"Tweet id={tweet_id} not found",
+            },
+        )
+    if unliked:
+        app_logger.info("Tweet {} like delete successfully by user {}", tweet_id, current_user_id)
     return {"result": True}
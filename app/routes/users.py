@@ -1,30 +1,56 @@
-from typing import Dict
+from typing import Dict, Optional
 
-from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import (
+    PROFILE_SAMPLE_SIZE,
     BaseUser,
+    FollowMany,
+    FollowManyResponse,
     Other,
+    UnfollowManyResponse,
     User,
     UserCreateResponse,
     UserFull,
     UserListResponse,
     UserResponse,
     UserWithRelations,
+    backfill_timeline,
     check_unique_user,
+    etag_matches,
     exception_handler,
+    follow_users,
     get_db,
     get_users,
     logger,
+    make_etag,
+    prune_timeline,
+    relations_sample,
+    unfollow_users,
     user_by_api_key,
     user_by_id,
+    user_id_by_api_key,
+    user_version,
 )
 
 users_router = APIRouter(prefix="/api/users", tags=["Users"])
 app_logger = logger.bind(name="app")
 
 
+async def user_with_relations(db: AsyncSession, user: User) -> UserWithRelations:
+    """Profile with the follow counters and the first PROFILE_SAMPLE_SIZE of each list"""
+    followers, following = await relations_sample(db, user.id, PROFILE_SAMPLE_SIZE)
+    return UserWithRelations(
+        id=user.id,
+        username=user.username,
+        followers_count=user.followers_count,
+        following_count=user.following_count,
+        followers=[Other(id=other_id, username=username) for other_id, username in followers],
+        following=[Other(id=other_id, username=username) for other_id, username in following],
+    )
+
+
 @users_router.post("/", status_code=201, response_model=UserCreateResponse)
 @exception_handler()
 async def create_user(
@@ -33,7 +59,7 @@ async def create_user(
     api_key: str = Header(..., convert_underscores=False),
 ):
     """Function of the registration of a new user"""
-    app_logger.info(f"POST/api/users")
+    app_logger.info("POST/api/users")
 
     if not await check_unique_user(db, user_data.username, user_data.email, api_key):
         raise HTTPException(
@@ -50,7 +76,7 @@ async def create_user(
     await db.commit()
     await db.refresh(new_user)
 
-    app_logger.info(f"User created successfully (user_id={new_user.id})")
+    app_logger.info("User created successfully (user_id={})", new_user.id)
     return {"result": True, "id": new_user.id}
 
 
@@ -61,32 +87,35 @@ async def get_authorized_user(
     api_key: str = Header(..., convert_underscores=False),
 ):
     """The function of obtaining an authorized user"""
-    app_logger.info(f"GET/api/users/me")
+    app_logger.info("GET/api/users/me")
 
-    user = await user_by_api_key(api_key=api_key, db=db, _with="all")
-    user_response = UserWithRelations(
-        id=user.id,
-        username=user.username,
-        followers=[Other(id=f.id, username=f.username) for f in user.followers],
-        following=[Other(id=f.id, username=f.username) for f in user.following],
-    )
-    return UserResponse(result=True, user=user_response)
+    user = await user_by_api_key(api_key=api_key, db=db)
+    return UserResponse(result=True, user=await user_with_relations(db, user))
 
 
 @users_router.get("/{user_id}", status_code=200, response_model=UserResponse)
 @exception_handler()
-async def get_user_by_id(user_id: int, db: AsyncSession = Depends(get_db)):
-    """The function of obtaining a user by ID"""
-    app_logger.info(f"GET/api/users/{user_id}")
+async def get_user_by_id(
+    user_id: int,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    if_none_match: Optional[str] = Header(None),
+):
+    """
+    The function of obtaining a user by ID
+    A matching If-None-Match is answered with 304 before the user is loaded
+    """
+    app_logger.info("GET/api/users/{}", user_id)
+
+    version = await user_version(db, user_id)
+    if version is not None:
+        etag = make_etag(user_id, version)
+        if etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
 
-    user = await user_by_id(user_id=user_id, db=db, _with="all")
-    user_response = UserWithRelations(
-        id=user.id,
-        username=user.username,
-        followers=[Other(id=f.id, username=f.username) for f in user.followers],
-        following=[Other(id=f.id, username=f.username) for f in user.following],
-    )
-    return UserResponse(result=True, user=user_response)
+    user = await user_by_id(user_id=user_id, db=db)
+    response.headers["ETag"] = make_etag(user.id, user.version)
+    return UserResponse(result=True, user=await user_with_relations(db, user))
 
 
 @users_router.get("/", status_code=200, response_model=UserListResponse)
@@ -98,9 +127,9 @@ async def get_all_users(
     offset: int = Query(0, ge=0),
 ):
     """The function of obtaining all users"""
-    app_logger.info(f"GET/api/users")
+    app_logger.info("GET/api/users")
 
-    await user_by_api_key(api_key=api_key, db=db)
+    await user_id_by_api_key(api_key=api_key, db=db)
     users = await get_users(db=db, limit=limit, offset=offset)
     users_data = []
     for u in users:
@@ -119,7 +148,7 @@ async def follow(
     api_key: str = Header(..., convert_underscores=False),
 ):
     """Follow func"""
-    app_logger.info(f"POST/api/users/{user_id}/follow")
+    app_logger.info("POST/api/users/{}/follow", user_id)
 
     existing_user = await user_by_api_key(api_key=api_key, db=db)
 
@@ -134,7 +163,8 @@ async def follow(
         )
     user = await user_by_id(user_id=user_id, db=db)
     await existing_user.follow(db, user)
-    app_logger.info(f"User id={existing_user.id} follow successfully id={user_id}")
+    await backfill_timeline(db, follower_id=existing_user.id, followed_ids=[user_id])
+    app_logger.info("User id={} follow successfully id={}", existing_user.id, user_id)
     return {"result": True}
 
 
@@ -146,7 +176,7 @@ async def unfollow(
     api_key: str = Header(..., convert_underscores=False),
 ) -> Dict[str, bool]:
     """Unfollow func"""
-    app_logger.info(f"DELETE/api/users/{user_id}/unfollow")
+    app_logger.info("DELETE/api/users/{}/unfollow", user_id)
 
     existing_user = await user_by_api_key(api_key=api_key, db=db)
 
@@ -161,5 +191,43 @@ async def unfollow(
         )
     user = await user_by_id(user_id=user_id, db=db)
     await existing_user.unfollow(db, user)
-    app_logger.info(f"User id={existing_user.id} unfollow successfully id={user_id}")
+    await prune_timeline(db, follower_id=existing_user.id, followed_ids=[user_id])
+    app_logger.info("User id={} unfollow successfully id={}", existing_user.id, user_id)
     return {"result": True}
+
+
+@users_router.post("/follow", status_code=200, response_model=FollowManyResponse)
+@exception_handler()
+async def follow_many(
+    follow_in: FollowMany,
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Header(..., convert_underscores=False),
+):
+    """
+    Bulk follow func
+    `followed` lists the newly followed ids, `skipped` unknown ids and the user's own id
+    """
+    app_logger.info("POST/api/users/follow ({} ids)", len(follow_in.user_ids))
+
+    current_user_id = await user_id_by_api_key(api_key=api_key, db=db)
+    followed, skipped = await follow_users(db, current_user_id, follow_in.user_ids)
+    await backfill_timeline(db, follower_id=current_user_id, followed_ids=followed)
+    app_logger.info("User id={} follow successfully {} users", current_user_id, len(followed))
+    return FollowManyResponse(result=True, followed=followed, skipped=skipped)
+
+
+@users_router.post("/unfollow", status_code=200, response_model=UnfollowManyResponse)
+@exception_handler()
+async def unfollow_many(
+    follow_in: FollowMany,
+    db: AsyncSession = Depends(get_db),
+    api_key: str = Header(..., convert_underscores=False),
+):
+    """Bulk unfollow func"""
+    app_logger.info("POST/api/users/unfollow ({} ids)", len(follow_in.user_ids))
+
+    current_user_id = await user_id_by_api_key(api_key=api_key, db=db)
+    unfollowed = await unfollow_users(db, current_user_id, follow_in.user_ids)
+    await prune_timeline(db, follower_id=current_user_id, followed_ids=unfollowed)
+    app_logger.info("User id={} unfollow successfully {} users", current_user_id, len(unfollowed))
+    return UnfollowManyResponse(result=True, unfollowed=unfollowed)
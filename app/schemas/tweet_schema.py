@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel
 
@@ -27,10 +27,15 @@ class TweetResponse(BaseModel):
     id: int
     content: str
     attachments: List[str]
+    # per attachment: links of its smaller sizes by variant name (empty if not processed)
+    attachment_variants: List[Dict[str, str]] = []
     author: Author
-    likes: List[Like]
+    likes: List[Like]  # first LIKES_SAMPLE_SIZE likers
+    likes_count: int = 0
+    liked: bool = False  # by the current user
 
 
 class TweetListResponse(BaseModel):
     result: bool
     tweets: List[TweetResponse]
+    next_cursor: Optional[str] = None
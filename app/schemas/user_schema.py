@@ -1,6 +1,6 @@
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class BaseUser(BaseModel):
@@ -22,6 +22,8 @@ class Other(BaseModel):
 class UserWithRelations(BaseModel):
     id: int
     username: str
+    followers_count: int
+    following_count: int
     followers: List[Other]
     following: List[Other]
 
@@ -38,3 +40,18 @@ class UserFull(BaseUser):
 class UserListResponse(BaseModel):
     result: bool
     users: List[UserFull]
+
+
+class FollowMany(BaseModel):
+    user_ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+
+class FollowManyResponse(BaseModel):
+    result: bool
+    followed: List[int]
+    skipped: List[int]
+
+
+class UnfollowManyResponse(BaseModel):
+    result: bool
+    unfollowed: List[int]
@@ -1,11 +1,74 @@
+from .auth_service import api_key_cache, user_by_api_key, user_id_by_api_key
 from .decorators import exception_handler
-from .media_service import get_media_by_ids, get_media_by_user_id_tweet_id
-from .tweet_service import tweet_by_id, tweet_by_id_with_details, tweets_by_user_ids
-from .user_service import check_unique_user, get_users, user_by_api_key, user_by_id
-from .utils import create_folder, delete_folder_recursive
+from .http_client import close_http_session, get_http_session, open_http_session
+from .images import (
+    ORIGINAL_IMAGE,
+    close_image_pool,
+    process_upload,
+    variant_file_name,
+)
+from .ingest import MediaIngestQueue, media_ingest_queue, store_upload
+from .last_seen import last_seen_buffer
+from .media_service import (
+    get_media_by_ids,
+    get_media_by_user_id_tweet_id,
+    media_by_content_hash,
+    media_by_id,
+    release_media,
+)
+from .storage import (
+    LocalMediaStorage,
+    MediaStorage,
+    YandexDiskStorage,
+    get_media_storage,
+    set_media_storage,
+)
+from .timeline import (
+    backfill_timeline,
+    close_timeline_store,
+    fan_out_tweet,
+    get_timeline_store,
+    prune_timeline,
+    retract_tweet,
+    set_timeline_store,
+    timeline_tweets,
+)
+from .tweet_service import (
+    encode_cursor,
+    like_tweet,
+    liked_tweet_ids,
+    likers_sample,
+    tweet_by_id,
+    tweet_by_id_with_details,
+    tweet_version,
+    tweets_by_text,
+    tweets_by_user_ids,
+    unlike_tweet,
+)
+from .user_service import (
+    check_unique_user,
+    follow_users,
+    followed_user_ids,
+    follower_user_ids,
+    get_users,
+    relations_sample,
+    repair_follow_counters,
+    unfollow_users,
+    user_by_id,
+    user_version,
+)
+from .utils import (
+    create_folder,
+    delete_folder_recursive,
+    etag_matches,
+    hash_upload,
+    make_etag,
+)
 from .yandex import (
     celery_task_delete_media,
+    celery_task_delete_media_batch,
     delete_from_yadisk,
+    delete_many_from_yadisk,
     get_direct_link,
     get_file_shareable_link,
     upload_file_to_disk,
@@ -0,0 +1,113 @@
+import time
+from collections import OrderedDict
+
+from fastapi import Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.models import User, hash_api_key
+from config.config import AUTH_CACHE_SIZE, AUTH_CACHE_TTL, get_db
+from config.logging_config import logger
+
+from .last_seen import last_seen_buffer
+from .user_service import user_loader_options
+
+app_logger = logger.bind(name="app")
+
+
+class ApiKeyCache:
+    """In-process LRU cache of api_key digest -> user id with a TTL per entry"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[int, float]] = OrderedDict()
+
+    def get(self, key_hash: str) -> int | None:
+        entry = self._entries.get(key_hash)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key_hash]
+            return None
+        self._entries.move_to_end(key_hash)
+        return user_id
+
+    def set(self, key_hash: str, user_id: int) -> None:
+        self._entries[key_hash] = (user_id, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key_hash)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key_hash: str) -> None:
+        self._entries.pop(key_hash, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+api_key_cache = ApiKeyCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+
+
+def invalid_api_key() -> HTTPException:
+    app_logger.error("Invalid API key")
+    return HTTPException(
+        status_code=403,
+        detail={
+            "result": False,
+            "error_type": 403,
+            "error_message": "Invalid API Key",
+        },
+    )
+
+
+async def user_id_by_api_key(api_key: str, db: AsyncSession = Depends(get_db)) -> int:
+    """
+    Get the id of the user owning api_key.
+    A cache hit resolves the key without reading the users table.
+    """
+    key_hash = hash_api_key(api_key)
+    user_id = api_key_cache.get(key_hash)
+    if user_id is None:
+        user_id = (await db.execute(select(User.id).where(User.api_key == key_hash))).scalar()
+        if user_id is None:
+            raise invalid_api_key()
+        api_key_cache.set(key_hash, user_id)
+
+    last_seen_buffer.touch(user_id)
+    app_logger.info("User authenticated: id={}", user_id)
+    return user_id
+
+
+async def user_by_api_key(
+    api_key: str, db: AsyncSession = Depends(get_db), _with=None
+) -> User | None:
+    """
+    Get user by api_key and record its last seen timestamp (written in the background).
+    A cached key is resolved by primary key, otherwise by the indexed key digest.
+    """
+    key_hash = hash_api_key(api_key)
+    user_id = api_key_cache.get(key_hash)
+    query = select(User).options(*user_loader_options(_with))
+    if user_id is None:
+        query = query.where(User.api_key == key_hash)
+    else:
+        query = query.where(User.id == user_id)
+
+    user_result = await db.execute(query)
+    current_user = user_result.scalars().first()
+    if current_user and current_user.api_key != key_hash:
+        # the key was changed by another process after it got cached here
+        current_user = None
+    if not current_user:
+        api_key_cache.invalidate(key_hash)
+        raise invalid_api_key()
+
+    api_key_cache.set(key_hash, current_user.id)
+    last_seen_buffer.touch(current_user.id)
+    app_logger.info("User authenticated: id={}", current_user.id)
+    return current_user
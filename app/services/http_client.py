@@ -0,0 +1,121 @@
+import asyncio
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.config import (
+    YANDEX_HTTP_CONNECT_TIMEOUT,
+    YANDEX_HTTP_KEEPALIVE,
+    YANDEX_HTTP_LIMIT,
+    YANDEX_HTTP_LIMIT_PER_HOST,
+    YANDEX_HTTP_READ_TIMEOUT,
+)
+from config.logging_config import logger
+
+from .metrics import yandex_trace_config
+
+app_logger = logger.bind(name="app")
+
+_session: aiohttp.ClientSession | None = None
+_session_loop: asyncio.AbstractEventLoop | None = None
+_sync_session: requests.Session | None = None
+_worker_loop: asyncio.AbstractEventLoop | None = None
+
+
+def create_http_session() -> aiohttp.ClientSession:
+    """Pooled aiohttp session with the configured connection limits and timeouts"""
+    connector = aiohttp.TCPConnector(
+        limit=YANDEX_HTTP_LIMIT,
+        limit_per_host=YANDEX_HTTP_LIMIT_PER_HOST,
+        keepalive_timeout=YANDEX_HTTP_KEEPALIVE,
+        ttl_dns_cache=300,
+    )
+    # no total timeout: uploads of large files are bounded by the read timeout instead
+    timeout = aiohttp.ClientTimeout(
+        total=None,
+        connect=YANDEX_HTTP_CONNECT_TIMEOUT,
+        sock_read=YANDEX_HTTP_READ_TIMEOUT,
+    )
+    return aiohttp.ClientSession(
+        connector=connector, timeout=timeout, trace_configs=[yandex_trace_config()]
+    )
+
+
+async def open_http_session() -> aiohttp.ClientSession:
+    """Create the shared session (app startup)"""
+    return get_http_session()
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """
+    Shared session of the running event loop.
+    Created lazily, so code running outside the app's lifespan gets one too.
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        _session = create_http_session()
+        _session_loop = loop
+        app_logger.debug("HTTP session created")
+    return _session
+
+
+async def close_http_session() -> None:
+    """Close the shared session (app shutdown)"""
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+        app_logger.debug("HTTP session closed")
+    _session = None
+    _session_loop = None
+
+
+def get_sync_session() -> requests.Session:
+    """Pooled requests session of the current (Celery worker) process"""
+    global _sync_session
+    if _sync_session is None:
+        _sync_session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=YANDEX_HTTP_LIMIT_PER_HOST, pool_maxsize=YANDEX_HTTP_LIMIT_PER_HOST
+        )
+        _sync_session.mount("https://", adapter)
+        _sync_session.mount("http://", adapter)
+    return _sync_session
+
+
+def close_sync_session() -> None:
+    global _sync_session
+    if _sync_session is not None:
+        _sync_session.close()
+        _sync_session = None
+
+
+def run_in_worker_loop(coro):
+    """
+    Run a coroutine from a Celery task on the process' own event loop.
+    The loop outlives the task, so the shared session keeps its connections between tasks.
+    """
+    global _worker_loop
+    if _worker_loop is None or _worker_loop.is_closed():
+        _worker_loop = asyncio.new_event_loop()
+    return _worker_loop.run_until_complete(coro)
+
+
+def close_worker_loop() -> None:
+    global _worker_loop
+    if _worker_loop is not None and not _worker_loop.is_closed():
+        _worker_loop.run_until_complete(close_http_session())
+        _worker_loop.close()
+    _worker_loop = None
+
+
+def reset_worker_clients() -> None:
+    """Forget the clients inherited from the parent process after fork, without closing them"""
+    global _session, _session_loop, _sync_session, _worker_loop
+    _session = _session_loop = _sync_session = _worker_loop = None
+
+
+def sync_timeout() -> tuple[float, float]:
+    """(connect, read) timeout for requests"""
+    return YANDEX_HTTP_CONNECT_TIMEOUT, YANDEX_HTTP_READ_TIMEOUT
@@ -0,0 +1,138 @@
+import asyncio
+import io
+import multiprocessing
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import aiofiles.os as aio_os
+from fastapi import UploadFile
+from PIL import Image, ImageOps
+
+from config.config import (
+    IMAGE_FORMAT,
+    IMAGE_MAX_DIMENSION,
+    IMAGE_PROCESSING,
+    IMAGE_QUALITY,
+    IMAGE_VARIANTS,
+    IMAGE_WORKERS,
+    MEDIA_CHUNK_SIZE,
+    MEDIA_MAX_SIZE,
+)
+from config.logging_config import logger
+
+from .utils import save_upload
+
+app_logger = logger.bind(name="app")
+
+ORIGINAL_IMAGE = "original"
+
+_pool: ProcessPoolExecutor | None = None
+
+
+def parse_variants(spec: str) -> dict[str, int]:
+    """IMAGE_VARIANTS value "small:320,medium:1024" as {"small": 320, "medium": 1024}"""
+    variants = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, size = item.split(":")
+        variants[name.strip()] = int(size)
+    return variants
+
+
+def variant_file_name(file_name: str, variant: str) -> str:
+    """Disk name of an encoded image: the upload's name with the IMAGE_FORMAT extension"""
+    stem = file_name.rsplit(".", 1)[0]
+    suffix = "" if variant == ORIGINAL_IMAGE else f"_{variant}"
+    return f"{stem}{suffix}.{IMAGE_FORMAT.lower()}"
+
+
+def process_image(
+    path: str, max_dimension: int, variants: dict[str, int], image_format: str, quality: int
+) -> dict[str, bytes] | None:
+    """
+    Runs in the process pool. Re-encodes the image file downscaled to `max_dimension`
+    (ORIGINAL_IMAGE) and to every smaller variant size. EXIF orientation is applied to
+    the pixels and no metadata is written. None for animations, they are kept as sent.
+    """
+    with Image.open(path) as source:
+        if getattr(source, "is_animated", False):
+            return None
+        image = ImageOps.exif_transpose(source)
+        has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        if image_format.upper() == "JPEG" or not has_alpha:
+            image = image.convert("RGB")
+        elif image.mode != "RGBA":
+            image = image.convert("RGBA")
+
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        sizes = {ORIGINAL_IMAGE: max_dimension}
+        sizes.update((name, size) for name, size in variants.items() if size < max(image.size))
+
+        encoded = {}
+        for name, size in sizes.items():
+            resized = image.copy()
+            resized.thumbnail((size, size), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, format=image_format, quality=quality)
+            encoded[name] = buffer.getvalue()
+        return encoded
+
+
+def get_image_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn: forking a process with the event loop's threads running is unsafe
+        _pool = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _pool
+
+
+def close_image_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+async def process_upload(file: UploadFile, path: Path | None = None) -> dict[str, bytes] | None:
+    """
+    Encoded ORIGINAL_IMAGE and variants of an uploaded image, computed off the event loop.
+    The pool reads the image from `path` (a staged upload) or from a temporary copy
+    written chunk by chunk, the upload itself is never held in memory.
+    None when the file is to be stored as sent: processing disabled,
+    not a still image or the pool failed.
+    """
+    if not IMAGE_PROCESSING:
+        return None
+    copy = None
+    if path is None:
+        path = copy = Path(tempfile.gettempdir()) / f"image_{uuid.uuid4().hex}"
+        await save_upload(file, copy, MEDIA_CHUNK_SIZE, MEDIA_MAX_SIZE)
+    loop = asyncio.get_running_loop()
+    try:
+        encoded = await loop.run_in_executor(
+            get_image_pool(),
+            process_image,
+            str(path),
+            IMAGE_MAX_DIMENSION,
+            parse_variants(IMAGE_VARIANTS),
+            IMAGE_FORMAT,
+            IMAGE_QUALITY,
+        )
+    except (OSError, ValueError, Image.DecompressionBombError):
+        app_logger.warning(f"{file.filename} is not a processable image, stored as sent")
+        return None
+    except BrokenProcessPool:
+        app_logger.exception("Image pool is broken, restarting it")
+        close_image_pool()
+        return None
+    finally:
+        if copy is not None and await aio_os.path.exists(copy):
+            await aio_os.remove(copy)
+    if encoded is not None:
+        size = len(encoded[ORIGINAL_IMAGE])
+        app_logger.info(f"Image {file.filename}: {file.size} -> {size} bytes")
+    return encoded
@@ -0,0 +1,238 @@
+import asyncio
+from pathlib import Path
+from typing import Any
+
+import aiofiles.os as aio_os
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import and_, or_, update
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+
+from app.models import MEDIA_FAILED, MEDIA_PENDING, MEDIA_READY, Media, Tweet
+from config.config import (
+    MEDIA_CHUNK_SIZE,
+    MEDIA_INGEST_DIR,
+    MEDIA_INGEST_WORKERS,
+    MEDIA_MAX_SIZE,
+    MEDIA_UPLOAD_CONCURRENCY,
+)
+from config.logging_config import logger
+
+from .images import ORIGINAL_IMAGE, process_upload, variant_file_name
+from .storage import get_media_storage
+from .utils import save_upload
+
+app_logger = logger.bind(name="app")
+
+# files being processed and stored at once by this process
+upload_slots = asyncio.Semaphore(MEDIA_UPLOAD_CONCURRENCY)
+
+
+async def store_upload(
+    file: UploadFile, file_name: str, content_hash: str | None, path: Path | None = None
+) -> Media:
+    """
+    Process and store a new file, the returned media is not added to a session.
+    Images are re-encoded in the image pool (read from `path` if the upload is already
+    on disk) and their variants are stored next to them.
+    At most MEDIA_UPLOAD_CONCURRENCY files are stored at once.
+    """
+    async with upload_slots:
+        return await store_file(file, file_name, content_hash, path)
+
+
+async def store_file(
+    file: UploadFile, file_name: str, content_hash: str | None, path: Path | None = None
+) -> Media:
+    encoded = await process_upload(file, path)
+    files: dict[str, tuple[str, UploadFile | bytes]]
+    if encoded is None:
+        files = {ORIGINAL_IMAGE: (file_name, file)}
+    else:
+        files = {
+            variant: (variant_file_name(file_name, variant), data)
+            for variant, data in encoded.items()
+        }
+    storage = get_media_storage()
+    links = await asyncio.gather(
+        *(storage.upload_and_link(data, name) for name, data in files.values()),
+        return_exceptions=True,
+    )
+    uploaded = [
+        name for (name, _), link in zip(files.values(), links) if isinstance(link, str) and link
+    ]
+    if len(uploaded) < len(files):
+        # the variants that did upload would be orphaned
+        if uploaded:
+            await storage.discard(uploaded)
+        error = next((link for link in links if isinstance(link, BaseException)), None)
+        if isinstance(error, HTTPException):
+            raise error
+        if error is not None:
+            app_logger.opt(exception=error).error("Media storage upload error")
+            raise error
+        app_logger.error("Failed to get direct link")
+        raise Exception("Failed to get direct link")
+
+    stored = {
+        variant: {"file_name": files[variant][0], "link": link}
+        for variant, link in zip(files, links)
+    }
+    original = stored.pop(ORIGINAL_IMAGE)
+    return Media(
+        image_link=original["link"],
+        file_name=original["file_name"],
+        variants=stored or None,
+        content_hash=content_hash,
+        status=MEDIA_READY,
+    )
+
+
+class MediaIngestQueue:
+    """
+    Uploads accepted in the asynchronous mode: the request stages the file in `staging_dir`
+    and commits a pending media, `workers` tasks of this process store it and mark it
+    ready (bumping the version of a tweet it is already attached to) or failed.
+    Media left pending by a restart are queued again on start if their file is staged here.
+    With several processes sharing `staging_dir` the same media may be stored twice,
+    the first result is kept and the other discarded.
+    """
+
+    def __init__(self, staging_dir: str | Path, workers: int):
+        self.staging_dir = Path(staging_dir)
+        self.workers = workers
+        self.session_factory: sessionmaker | None = None
+        self._queue: asyncio.Queue[tuple[int, str]] | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    def staged_path(self, file_name: str) -> Path:
+        return self.staging_dir / file_name
+
+    async def stage(self, file: UploadFile, file_name: str) -> None:
+        await save_upload(file, self.staged_path(file_name), MEDIA_CHUNK_SIZE, MEDIA_MAX_SIZE)
+
+    async def unstage(self, file_name: str) -> None:
+        path = self.staged_path(file_name)
+        if await aio_os.path.exists(path):
+            await aio_os.remove(path)
+
+    def enqueue(self, media_id: int, file_name: str) -> None:
+        if self._queue is None:
+            app_logger.warning(f"Ingestion is not running, media {media_id} stays pending")
+            return
+        self._queue.put_nowait((media_id, file_name))
+
+    async def join(self) -> None:
+        """Wait until the queued media are processed"""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def ingest(self, media_id: int, file_name: str) -> str | None:
+        """Store a staged upload, return the new status of the media (None if it is gone)"""
+        path = self.staged_path(file_name)
+        media = None
+        try:
+            staged = await asyncio.to_thread(open, path, "rb")
+        except FileNotFoundError:
+            app_logger.error(f"Staged file of media {media_id} is missing")
+        else:
+            size = (await aio_os.stat(path)).st_size
+            file = UploadFile(file=staged, filename=file_name, size=size)
+            try:
+                # the pending row already has the content hash
+                media = await store_upload(file, file_name, content_hash=None, path=path)
+            except Exception:
+                app_logger.exception(f"Storing media {media_id} failed")
+            finally:
+                await file.close()
+
+        values: dict[str, Any] = {"status": MEDIA_FAILED}
+        if media is not None:
+            values = {
+                "status": MEDIA_READY,
+                "image_link": media.image_link,
+                "file_name": media.file_name,
+                "variants": media.variants,
+            }
+        # media repeating the content in the same batch share the staged file
+        content_hash = select(Media.content_hash).where(Media.id == media_id).scalar_subquery()
+        shares_file = or_(
+            Media.id == media_id,
+            and_(Media.content_hash == content_hash, Media.file_name == file_name),
+        )
+        assert self.session_factory is not None, "ingestion is not started"
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(Media)
+                .where(shares_file, Media.status == MEDIA_PENDING)
+                .values(**values)
+                .returning(Media.tweet_id)
+            )
+            rows = result.all()
+            tweet_ids = {row.tweet_id for row in rows if row.tweet_id is not None}
+            if tweet_ids:
+                await session.execute(
+                    update(Tweet).where(Tweet.id.in_(tweet_ids)).values(version=Tweet.version + 1)
+                )
+            await session.commit()
+
+        if not rows and media is not None:
+            # deleted (or stored by another process) in the meantime
+            await get_media_storage().discard(media.file_names)
+        await self.unstage(file_name)
+        status = values["status"] if rows else None
+        app_logger.info(f"Media {media_id} ingested: {status}")
+        return status
+
+    async def _run(self, queue: asyncio.Queue[tuple[int, str]]) -> None:
+        while True:
+            media_id, file_name = await queue.get()
+            try:
+                await self.ingest(media_id, file_name)
+            except Exception:
+                app_logger.exception(f"Ingestion of media {media_id} failed")
+            finally:
+                queue.task_done()
+
+    async def recover(self) -> list[int]:
+        """
+        Queue the media left pending that are staged here, return their ids.
+        The others are staged on another node, which is still ingesting or will recover them.
+        """
+        assert self.session_factory is not None, "ingestion is not started"
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(Media.id, Media.file_name).where(Media.status == MEDIA_PENDING)
+            )
+            pending = result.all()
+        recovered = []
+        for media_id, file_name in pending:
+            if await aio_os.path.exists(self.staged_path(file_name)):
+                self.enqueue(media_id, file_name)
+                recovered.append(media_id)
+        if recovered:
+            app_logger.info(f"{len(recovered)} pending media queued again")
+        return recovered
+
+    async def start(self, session_factory: sessionmaker) -> None:
+        if self._queue is not None:
+            return
+        self.session_factory = session_factory
+        queue: asyncio.Queue[tuple[int, str]] = asyncio.Queue()
+        self._queue = queue
+        self._tasks = [asyncio.create_task(self._run(queue)) for _ in range(self.workers)]
+        try:
+            await self.recover()
+        except Exception:
+            app_logger.exception("Pending media could not be queued again")
+
+    async def stop(self) -> None:
+        """Stop the workers, media still queued stay pending until the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+
+
+media_ingest_queue = MediaIngestQueue(MEDIA_INGEST_DIR, MEDIA_INGEST_WORKERS)
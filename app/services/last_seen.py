@@ -0,0 +1,92 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import sessionmaker
+
+from app.models import User
+from config.config import LAST_SEEN_FLUSH_INTERVAL, LAST_SEEN_RESOLUTION
+from config.logging_config import logger
+
+app_logger = logger.bind(name="app")
+
+
+class LastSeenBuffer:
+    """
+    Write-behind buffer of users' last_seen timestamps.
+    A user is recorded at most once per `resolution` seconds, pending values are written
+    every `interval` seconds as a single bulk UPDATE.
+    """
+
+    def __init__(self, resolution: float, interval: float):
+        self.resolution = resolution
+        self.interval = interval
+        self._pending: dict[int, datetime] = {}
+        self._recorded_at: dict[int, float] = {}
+        self._task: asyncio.Task | None = None
+
+    def touch(self, user_id: int) -> None:
+        now = time.monotonic()
+        recorded_at = self._recorded_at.get(user_id)
+        if recorded_at is not None and now - recorded_at < self.resolution:
+            return
+        self._recorded_at[user_id] = now
+        self._pending[user_id] = datetime.now(timezone.utc)
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def flush(self, session_factory: sessionmaker) -> int:
+        """Write pending timestamps, return the number of updated users"""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        try:
+            async with session_factory() as session:
+                # executemany of one statement; users deleted meanwhile are simply skipped
+                await session.execute(
+                    update(User.__table__)
+                    .where(User.__table__.c.id == bindparam("user_id"))
+                    .values(last_seen=bindparam("seen")),
+                    [{"user_id": user_id, "seen": seen} for user_id, seen in pending.items()],
+                )
+                await session.commit()
+        except Exception:
+            app_logger.exception(f"Failed to flush last_seen of {len(pending)} users")
+            for user_id, seen in pending.items():
+                self._pending.setdefault(user_id, seen)
+            return 0
+
+        expired = time.monotonic() - self.resolution
+        self._recorded_at = {
+            user_id: recorded_at
+            for user_id, recorded_at in self._recorded_at.items()
+            if recorded_at > expired
+        }
+        app_logger.debug(f"last_seen flushed for {len(pending)} users")
+        return len(pending)
+
+    async def _run(self, session_factory: sessionmaker) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush(session_factory)
+
+    def start(self, session_factory: sessionmaker) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(session_factory))
+
+    async def stop(self, session_factory: sessionmaker) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush(session_factory)
+
+
+last_seen_buffer = LastSeenBuffer(
+    resolution=LAST_SEEN_RESOLUTION, interval=LAST_SEEN_FLUSH_INTERVAL
+)
@@ -1,9 +1,10 @@
 from typing import Sequence
 
+from sqlalchemy import delete
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 
-from app.models import Media, Tweet
+from app.models import MEDIA_READY, Media, Tweet
 from config.logging_config import logger
 
 app_logger = logger.bind(name="app")
@@ -23,3 +24,42 @@ async def get_media_by_user_id_tweet_id(
         select(Media).join(Tweet).where(Media.tweet_id == tweet_id).where(Tweet.user_id == user_id)
     )
     return medias_result.scalars().all()
+
+
+async def media_by_id(db: AsyncSession, media_id: int) -> Media | None:
+    return await db.get(Media, media_id)
+
+
+async def media_by_content_hash(db: AsyncSession, content_hash: str) -> Media | None:
+    """
+    Stored media with this content. The row is share-locked until the caller commits,
+    so its files can't be released by a concurrent tweet deletion in the meantime
+    """
+    result = await db.execute(
+        select(Media)
+        .where(Media.content_hash == content_hash, Media.status == MEDIA_READY)
+        .order_by(Media.id)
+        .limit(1)
+        .with_for_update(read=True, key_share=True)
+    )
+    return result.scalars().first()
+
+
+async def release_media(db: AsyncSession, media: Sequence[Media]) -> list[str]:
+    """
+    Delete the media rows and return the stored files no remaining media refers to.
+    Copies of an upload share the original's file names, so those are the reference count
+    """
+    if not media:
+        return []
+    await db.execute(delete(Media).where(Media.id.in_([m.id for m in media])))
+
+    hashes = {m.content_hash for m in media if m.content_hash}
+    referenced = set()
+    if hashes:
+        result = await db.execute(
+            select(Media.file_name).where(Media.content_hash.in_(hashes)).distinct()
+        )
+        referenced = set(result.scalars())
+    released = (m.file_names for m in media if m.file_name not in referenced)
+    return list(dict.fromkeys(name for file_names in released for name in file_names))
@@ -0,0 +1,243 @@
+import bisect
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Iterable
+
+import aiohttp
+from celery.signals import before_task_publish
+
+from config.config import engine
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric(ABC):
+    """
+    Minimal Prometheus metric of this process, label values are passed positionally.
+    Updates are plain dict operations, everything runs on the event loop.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    @abstractmethod
+    def samples(self) -> Iterable[str]:
+        """Exposition lines of the metric's values"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, value in self._values.items():
+            labels = format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}{labels} {format_value(value)}"
+
+
+class Gauge(Counter):
+    """Set directly or, with `collect`, read when scraped"""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        collect: Callable[[], float | None] | None = None,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def set(self, value: float, *labelvalues) -> None:
+        self._values[labelvalues] = value
+
+    def dec(self, *labelvalues, amount: float = 1) -> None:
+        self.inc(*labelvalues, amount=-amount)
+
+    def samples(self) -> Iterable[str]:
+        if self.collect is not None:
+            value = self.collect()
+            if value is None:
+                return
+            self._values[()] = value
+        yield from super().samples()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label values: [count per bucket..., count above the last bucket, sum]
+        self._values: dict[tuple, list[float]] = {}
+
+    def observe(self, value: float, *labelvalues) -> None:
+        state = self._values.get(labelvalues)
+        if state is None:
+            state = self._values[labelvalues] = [0] * (len(self.buckets) + 2)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def count(self, *labelvalues) -> int:
+        state = self._values.get(labelvalues)
+        return int(sum(state[:-1])) if state else 0
+
+    def samples(self) -> Iterable[str]:
+        for labelvalues, state in self._values.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), state[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else format_value(bound)
+                labels = format_labels(self.labelnames, labelvalues, f'le="{le}"')
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {format_value(state[-1])}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+def pool_stat(name: str) -> Callable[[], float | None]:
+    """Reader of a QueuePool statistic, pools without it (SQLite) report nothing"""
+
+    def collect() -> float | None:
+        stat = getattr(engine.pool, name, None)
+        return stat() if callable(stat) else None
+
+    return collect
+
+
+registry = Registry()
+
+http_requests_total = registry.register(
+    Counter("http_requests_total", "HTTP requests.", ("method", "route", "status"))
+)
+http_request_duration_seconds = registry.register(
+    Histogram("http_request_duration_seconds", "HTTP request latency.", ("method", "route"))
+)
+http_requests_in_flight = registry.register(
+    Gauge("http_requests_in_flight", "HTTP requests being served.")
+)
+db_pool_size = registry.register(
+    Gauge("db_pool_size", "Connections kept by the DB pool.", collect=pool_stat("size"))
+)
+db_pool_checked_out = registry.register(
+    Gauge("db_pool_checked_out", "DB connections in use.", collect=pool_stat("checkedout"))
+)
+db_pool_overflow = registry.register(
+    Gauge(
+        "db_pool_overflow",
+        "DB connections opened over the pool size.",
+        collect=pool_stat("overflow"),
+    )
+)
+yandex_request_duration_seconds = registry.register(
+    Histogram(
+        "yandex_request_duration_seconds", "Yandex Disk API latency.", ("method", "endpoint")
+    )
+)
+yandex_request_errors_total = registry.register(
+    Counter(
+        "yandex_request_errors_total",
+        "Failed Yandex Disk API calls (exception or HTTP error).",
+        ("method", "endpoint"),
+    )
+)
+celery_tasks_enqueued_total = registry.register(
+    Counter("celery_tasks_enqueued_total", "Celery tasks sent by this process.", ("task",))
+)
+
+
+def yandex_endpoint(path: str) -> str:
+    """API path of the call, uploads go to per-file URLs and are grouped together"""
+    if path.startswith("/v1/disk/"):
+        return path.removeprefix("/v1/disk")
+    return "upload"
+
+
+async def on_request_start(session, context, params) -> None:
+    context.started = time.perf_counter()
+
+
+async def on_request_end(session, context, params) -> None:
+    endpoint = yandex_endpoint(params.url.path)
+    yandex_request_duration_seconds.observe(
+        time.perf_counter() - context.started, params.method, endpoint
+    )
+    if params.response.status >= 400:
+        yandex_request_errors_total.inc(params.method, endpoint)
+
+
+async def on_request_exception(session, context, params) -> None:
+    endpoint = yandex_endpoint(params.url.path)
+    yandex_request_duration_seconds.observe(
+        time.perf_counter() - context.started, params.method, endpoint
+    )
+    yandex_request_errors_total.inc(params.method, endpoint)
+
+
+def yandex_trace_config() -> aiohttp.TraceConfig:
+    """Hooks timing every call made through the shared HTTP session"""
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_request_start.append(on_request_start)
+    trace_config.on_request_end.append(on_request_end)
+    trace_config.on_request_exception.append(on_request_exception)
+    return trace_config
+
+
+@before_task_publish.connect
+def count_enqueued_task(sender=None, **kwargs):
+    celery_tasks_enqueued_total.inc(sender)
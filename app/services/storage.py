@@ -0,0 +1,191 @@
+from abc import ABC, abstractmethod
+from pathlib import Path
+from urllib.parse import quote
+
+import aiofiles.os as aio_os
+import aiohttp
+from fastapi import UploadFile
+from fastapi.responses import FileResponse, RedirectResponse, Response
+
+from config.config import (
+    MEDIA_CHUNK_SIZE,
+    MEDIA_LOCAL_ROOT,
+    MEDIA_MAX_SIZE,
+    MEDIA_PUBLIC_URL,
+    MEDIA_STORAGE,
+    YANDEX_DISK_API_URL,
+    YANDEX_DISK_APP_FOLDER_PATH,
+    YANDEX_DISK_TOKEN,
+)
+from config.logging_config import logger
+
+from .http_client import get_http_session
+from .utils import save_upload
+from .yandex import (
+    celery_task_delete_media_batch,
+    delete_many_from_yadisk,
+    get_direct_link,
+    get_file_shareable_link,
+    upload_file_to_disk,
+)
+
+app_logger = logger.bind(name="app")
+
+# stored files never change (every upload gets a new name)
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class MediaStorage(ABC):
+    """
+    Where the media files live. Files are addressed by their unique name,
+    clients download them by the link returned after the upload.
+    """
+
+    @abstractmethod
+    async def upload(self, file: UploadFile | bytes, file_name: str) -> bool:
+        """Store a file under file_name, False on failure"""
+
+    @abstractmethod
+    async def link(self, file_name: str) -> str | None:
+        """Link clients download the stored file from"""
+
+    @abstractmethod
+    async def delete(self, file_names: list[str]) -> dict[str, str]:
+        """Delete files, return the outcome of each: deleted, missing, retry or failed"""
+
+    async def discard(self, file_names: list[str]) -> None:
+        """Delete files off the request path"""
+        await self.delete(file_names)
+
+    @abstractmethod
+    async def stream(self, file_name: str) -> Response | None:
+        """Response serving the file, None if there is no such file"""
+
+    async def upload_and_link(self, file: UploadFile | bytes, file_name: str) -> str | None:
+        """Upload a file and publish it, return its link or None on failure"""
+        if not await self.upload(file, file_name):
+            app_logger.error(f"Upload of {file_name} failed")
+            return None
+        return await self.link(file_name)
+
+
+class YandexDiskStorage(MediaStorage):
+    """Files in an app folder on Yandex Disk, published and linked through a redirector"""
+
+    def __init__(self, folder_path: str, token: str):
+        self.folder_path = folder_path
+        self.token = token
+
+    def path(self, file_name: str) -> str:
+        """Path of the file without the "disk:" prefix, as the deletion API takes it"""
+        return f"{self.folder_path[5:]}/{file_name}"
+
+    async def upload(self, file: UploadFile | bytes, file_name: str) -> bool:
+        return await upload_file_to_disk(file, file_name, self.folder_path, self.token)
+
+    async def link(self, file_name: str) -> str | None:
+        public_url = await get_file_shareable_link(f"{self.folder_path}/{file_name}", self.token)
+        return await get_direct_link(public_url) if public_url else None
+
+    async def delete(self, file_names: list[str]) -> dict[str, str]:
+        outcomes = await delete_many_from_yadisk(
+            self.token, [self.path(file_name) for file_name in file_names]
+        )
+        return {file_name: outcomes[self.path(file_name)] for file_name in file_names}
+
+    async def discard(self, file_names: list[str]) -> None:
+        """Deleted by a Celery task, which retries the transient failures"""
+        file_paths = [self.path(file_name) for file_name in file_names]
+        app_logger.debug(f"Triggering Celery task for files deletion: {file_paths}")
+        celery_task_delete_media_batch.delay(file_paths)
+
+    async def stream(self, file_name: str) -> Response | None:
+        """Redirect to the file's download URL, the bytes don't pass through the app"""
+        url = f"{YANDEX_DISK_API_URL}/resources/download"
+        headers = {"Authorization": f"OAuth {self.token}"}
+        params = {"path": f"{self.folder_path}/{file_name}"}
+        try:
+            async with get_http_session().get(url, headers=headers, params=params) as response:
+                if response.status == 404:
+                    return None
+                response.raise_for_status()
+                href = (await response.json()).get("href")
+        except aiohttp.ClientError:
+            app_logger.exception(f"Download URL of {file_name} is unavailable")
+            raise
+        return RedirectResponse(href) if href else None
+
+
+class LocalMediaStorage(MediaStorage):
+    """
+    Files in a local directory served by the app itself (single node setups, tests).
+    FileResponse answers Range requests and uses the server's zero-copy file sending
+    where the ASGI server supports it.
+    """
+
+    def __init__(self, root: str | Path, public_url: str = ""):
+        self.root = Path(root)
+        self.public_url = public_url.rstrip("/")
+
+    def path(self, file_name: str) -> Path | None:
+        """Path of the file, None for names that could leave the root"""
+        if not file_name or Path(file_name).name != file_name or file_name in {".", ".."}:
+            return None
+        return self.root / file_name
+
+    async def upload(self, file: UploadFile | bytes, file_name: str) -> bool:
+        path = self.path(file_name)
+        if path is None:
+            app_logger.error(f"Invalid media file name: {file_name}")
+            return False
+        try:
+            await save_upload(file, path, MEDIA_CHUNK_SIZE, MEDIA_MAX_SIZE)
+        except OSError:
+            app_logger.exception(f"Saving {file_name} failed")
+            return False
+        app_logger.info(f"File {file_name} saved to {self.root}")
+        return True
+
+    async def link(self, file_name: str) -> str | None:
+        return f"{self.public_url}/api/medias/files/{quote(file_name)}"
+
+    async def delete(self, file_names: list[str]) -> dict[str, str]:
+        outcomes = {}
+        for file_name in dict.fromkeys(file_names):
+            path = self.path(file_name)
+            try:
+                if path is None:
+                    outcomes[file_name] = "failed"
+                    continue
+                await aio_os.remove(path)
+                outcomes[file_name] = "deleted"
+            except FileNotFoundError:
+                outcomes[file_name] = "missing"
+            except OSError:
+                app_logger.exception(f"Deleting {file_name} failed")
+                outcomes[file_name] = "failed"
+        return outcomes
+
+    async def stream(self, file_name: str) -> Response | None:
+        path = self.path(file_name)
+        if path is None or not await aio_os.path.isfile(path):
+            return None
+        return FileResponse(path, headers={"Cache-Control": IMMUTABLE})
+
+
+def create_media_storage() -> MediaStorage:
+    if MEDIA_STORAGE == "local":
+        return LocalMediaStorage(MEDIA_LOCAL_ROOT, MEDIA_PUBLIC_URL)
+    return YandexDiskStorage(YANDEX_DISK_APP_FOLDER_PATH, YANDEX_DISK_TOKEN)
+
+
+media_storage: MediaStorage = create_media_storage()
+
+
+def get_media_storage() -> MediaStorage:
+    return media_storage
+
+
+def set_media_storage(storage: MediaStorage) -> None:
+    global media_storage
+    media_storage = storage
@@ -0,0 +1,298 @@
+import bisect
+from abc import ABC, abstractmethod
+from typing import Iterable, Sequence
+
+from redis import asyncio as aioredis
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Tweet
+from config.config import TIMELINE_BACKEND, TIMELINE_MAX_LENGTH, TIMELINE_REDIS_URL
+from config.logging_config import logger
+
+from .tweet_service import decode_cursor, recent_tweet_ids, tweets_by_ids
+from .user_service import followed_user_ids, follower_user_ids
+
+app_logger = logger.bind(name="app")
+
+
+class TimelineStore(ABC):
+    """
+    Precomputed feeds: for every user the ids of the followed users' tweets, newest first,
+    capped at `max_length`. Tweet ids grow with time, so they double as the sort key.
+    Only timelines that were built (rebuilt from the database) receive pushes.
+    A timeline stays complete until the cap makes it drop older tweets, then pushes older
+    than the lowest id it kept are ignored: the other tweets of that period are gone.
+    """
+
+    def __init__(self, max_length: int):
+        self.max_length = max_length
+
+    @abstractmethod
+    async def exists(self, user_id: int) -> bool:
+        """Whether the user's timeline is built"""
+
+    @abstractmethod
+    async def rebuild(self, user_id: int, tweet_ids: Iterable[int]) -> None:
+        """Replace the user's timeline with tweet_ids"""
+
+    @abstractmethod
+    async def push(self, user_ids: Iterable[int], tweet_ids: Iterable[int]) -> None:
+        """Add tweets to the users' built timelines, except below a truncated one's window"""
+
+    @abstractmethod
+    async def remove(self, user_ids: Iterable[int], tweet_ids: Iterable[int]) -> None:
+        """Drop tweets from the users' timelines"""
+
+    @abstractmethod
+    async def range(
+        self, user_id: int, before_id: int | None, offset: int, limit: int
+    ) -> list[int]:
+        """Tweet ids lower than before_id, newest first"""
+
+    @abstractmethod
+    async def is_complete(self, user_id: int) -> bool:
+        """Whether the cap has not dropped any tweet of the user's timeline"""
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryTimelineStore(TimelineStore):
+    """In-process store (tests, single worker setups)"""
+
+    def __init__(self, max_length: int):
+        super().__init__(max_length)
+        self._timelines: dict[int, list[int]] = {}  # ascending ids
+        # lowest id kept by the truncated timelines, older tweets were dropped
+        self._floors: dict[int, int] = {}
+
+    async def exists(self, user_id: int) -> bool:
+        return user_id in self._timelines
+
+    async def rebuild(self, user_id: int, tweet_ids: Iterable[int]) -> None:
+        timeline = sorted(set(tweet_ids))
+        self._timelines[user_id] = timeline[-self.max_length :]
+        if len(timeline) > self.max_length:
+            self._floors[user_id] = self._timelines[user_id][0]
+        else:
+            self._floors.pop(user_id, None)
+
+    async def push(self, user_ids: Iterable[int], tweet_ids: Iterable[int]) -> None:
+        tweet_ids = list(tweet_ids)
+        for user_id in user_ids:
+            timeline = self._timelines.get(user_id)
+            if timeline is None:
+                continue
+            floor = self._floors.get(user_id, 0)
+            for tweet_id in tweet_ids:
+                if tweet_id < floor:
+                    continue
+                index = bisect.bisect_left(timeline, tweet_id)
+                if index == len(timeline) or timeline[index] != tweet_id:
+                    timeline.insert(index, tweet_id)
+            if len(timeline) > self.max_length:
+                del timeline[: -self.max_length]
+                self._floors[user_id] = timeline[0]
+
+    async def remove(self, user_ids: Iterable[int], tweet_ids: Iterable[int]) -> None:
+        tweet_ids = set(tweet_ids)
+        for user_id in user_ids:
+            timeline = self._timelines.get(user_id)
+            if timeline is not None:
+                timeline[:] = [tweet_id for tweet_id in timeline if tweet_id not in tweet_ids]
+
+    async def range(
+        self, user_id: int, before_id: int | None, offset: int, limit: int
+    ) -> list[int]:
+        timeline = self._timelines.get(user_id, [])
+        end = len(timeline) if before_id is None else bisect.bisect_left(timeline, before_id)
+        end -= offset
+        return timeline[max(end - limit, 0) : max(end, 0)][::-1]
+
+    async def is_complete(self, user_id: int) -> bool:
+        return user_id not in self._floors
+
+
+class RedisTimelineStore(TimelineStore):
+    """
+    Sorted set per user scored by tweet id.
+    The member "0" marks a built timeline and is never returned,
+    its score is 0 while the timeline is complete and minus the lowest id it kept
+    once it was truncated.
+    """
+
+    # push into built timelines only (ids below the kept window of a truncated one are
+    # skipped, the tweets around them were dropped) and trim them, in a single round-trip
+    PUSH_SCRIPT = """
+    for _, key in ipairs(KEYS) do
+        local marker = redis.call('ZSCORE', key, '0')
+        if marker then
+            local floor = -tonumber(marker)
+            for i = 2, #ARGV do
+                if tonumber(ARGV[i]) >= floor then
+                    redis.call('ZADD', key, ARGV[i], ARGV[i])
+                end
+            end
+            if redis.call('ZREMRANGEBYRANK', key, 1, -tonumber(ARGV[1]) - 1) > 0 then
+                local lowest = redis.call('ZRANGE', key, 1, 1, 'WITHSCORES')
+                redis.call('ZADD', key, -tonumber(lowest[2]), '0')
+            end
+        end
+    end
+    """
+
+    def __init__(self, max_length: int, url: str):
+        super().__init__(max_length)
+        self.redis = aioredis.Redis.from_url(url)
+        self._push = self.redis.register_script(self.PUSH_SCRIPT)
+
+    @staticmethod
+    def key(user_id: int) -> str:
+        return f"timeline:{user_id}"
+
+    async def exists(self, user_id: int) -> bool:
+        return await self.redis.zscore(self.key(user_id), "0") is not None
+
+    async def rebuild(self, user_id: int, tweet_ids: Iterable[int]) -> None:
+        key = self.key(user_id)
+        tweet_ids = sorted(set(tweet_ids))
+        kept = tweet_ids[-self.max_length :]
+        members = {"0": 0 if len(tweet_ids) <= self.max_length else -kept[0]}
+        members.update({str(tweet_id): tweet_id for tweet_id in kept})
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.zadd(key, members)
+            await pipe.execute()
+
+    async def push(self, user_ids: Iterable[int], tweet_ids: Iterable[int]) -> None:
+        keys = [self.key(user_id) for user_id in user_ids]
+        if keys:
+            await self._push(keys=keys, args=[self.max_length, *tweet_ids])
+
+    async def remove(self, user_ids: Iterable[int], tweet_ids: Iterable[int]) -> None:
+        tweet_ids = [str(tweet_id) for tweet_id in tweet_ids]
+        if not tweet_ids:
+            return
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.zrem(self.key(user_id), *tweet_ids)
+            await pipe.execute()
+
+    async def range(
+        self, user_id: int, before_id: int | None, offset: int, limit: int
+    ) -> list[int]:
+        ids = await self.redis.zrevrangebyscore(
+            self.key(user_id),
+            max="+inf" if before_id is None else f"({before_id}",
+            min="(0",
+            start=offset,
+            num=limit,
+        )
+        return [int(tweet_id) for tweet_id in ids]
+
+    async def is_complete(self, user_id: int) -> bool:
+        return await self.redis.zscore(self.key(user_id), "0") == 0
+
+    async def close(self) -> None:
+        await self.redis.aclose()
+
+
+def create_timeline_store() -> TimelineStore | None:
+    if TIMELINE_BACKEND == "redis":
+        return RedisTimelineStore(TIMELINE_MAX_LENGTH, TIMELINE_REDIS_URL)
+    if TIMELINE_BACKEND == "memory":
+        return MemoryTimelineStore(TIMELINE_MAX_LENGTH)
+    return None
+
+
+timeline_store: TimelineStore | None = create_timeline_store()
+
+
+def get_timeline_store() -> TimelineStore | None:
+    return timeline_store
+
+
+def set_timeline_store(store: TimelineStore | None) -> None:
+    global timeline_store
+    timeline_store = store
+
+
+async def close_timeline_store() -> None:
+    if timeline_store is not None:
+        await timeline_store.close()
+
+
+async def timeline_tweets(
+    db: AsyncSession, user_id: int, limit: int, offset: int = 0, cursor: str | None = None
+) -> Sequence[Tweet] | None:
+    """
+    Feed page read from the precomputed timeline.
+    None when the timeline is disabled or the page lies beyond its capped window,
+    then the caller builds the page with tweets_by_user_ids.
+    """
+    store = get_timeline_store()
+    if store is None:
+        return None
+    try:
+        if not await store.exists(user_id):
+            followed_ids = await followed_user_ids(db, user_id)
+            # one extra id tells the store whether older tweets were left out
+            tweet_ids = await recent_tweet_ids(db, followed_ids, store.max_length + 1)
+            await store.rebuild(user_id, tweet_ids)
+            app_logger.debug(f"Timeline of user id={user_id} rebuilt")
+
+        before_id = decode_cursor(cursor)[1] if cursor else None
+        tweet_ids = await store.range(user_id, before_id, 0 if cursor else offset, limit)
+        if len(tweet_ids) < limit and not await store.is_complete(user_id):
+            return None
+    except (aioredis.RedisError, OSError):
+        app_logger.exception(f"Timeline of user id={user_id} is unavailable")
+        return None
+    return await tweets_by_ids(db, tweet_ids)
+
+
+async def fan_out_tweet(db: AsyncSession, author_id: int, tweet_id: int) -> None:
+    """Push a new tweet into the timelines of the author's followers"""
+    store = get_timeline_store()
+    if store is None:
+        return
+    try:
+        await store.push(await follower_user_ids(db, author_id), [tweet_id])
+    except (aioredis.RedisError, OSError):
+        app_logger.exception(f"Fan-out of tweet id={tweet_id} failed")
+
+
+async def retract_tweet(db: AsyncSession, author_id: int, tweet_id: int) -> None:
+    """Remove a deleted tweet from the timelines of the author's followers"""
+    store = get_timeline_store()
+    if store is None:
+        return
+    try:
+        await store.remove(await follower_user_ids(db, author_id), [tweet_id])
+    except (aioredis.RedisError, OSError):
+        app_logger.exception(f"Retraction of tweet id={tweet_id} failed")
+
+
+async def backfill_timeline(db: AsyncSession, follower_id: int, followed_ids: list[int]) -> None:
+    """Add recent tweets of newly followed users to the follower's timeline"""
+    store = get_timeline_store()
+    if store is None or not followed_ids:
+        return
+    try:
+        tweet_ids = await recent_tweet_ids(db, followed_ids, store.max_length + 1)
+        await store.push([follower_id], tweet_ids)
+    except (aioredis.RedisError, OSError):
+        app_logger.exception(f"Backfill of timeline of user id={follower_id} failed")
+
+
+async def prune_timeline(db: AsyncSession, follower_id: int, followed_ids: list[int]) -> None:
+    """Remove tweets of unfollowed users from the follower's timeline"""
+    store = get_timeline_store()
+    if store is None or not followed_ids:
+        return
+    try:
+        # older tweets of the users can't be inside the capped window
+        tweet_ids = await recent_tweet_ids(db, followed_ids, store.max_length)
+        await store.remove([follower_id], tweet_ids)
+    except (aioredis.RedisError, OSError):
+        app_logger.exception(f"Pruning of timeline of user id={follower_id} failed")
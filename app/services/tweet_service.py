@@ -1,17 +1,79 @@
+import base64
+import binascii
+import re
+from datetime import datetime
 from typing import Sequence
 
 from fastapi import Depends, HTTPException
+from sqlalchemy import (
+    column,
+    delete,
+    exists,
+    func,
+    literal,
+    literal_column,
+    table,
+    tuple_,
+    union_all,
+    update,
+)
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from sqlalchemy.orm import selectinload
 
-from app.models import Tweet, User
+from app.models import SEARCH_CONFIG, Tweet, User, likes
 from config.config import get_db
 from config.logging_config import logger
 
+from .user_service import insert_ignoring_conflicts
+
 app_logger = logger.bind(name="app")
 
 
+def encode_cursor(tweet: Tweet) -> str:
+    """Opaque feed cursor pointing right after the given tweet"""
+    raw = f"{tweet.timestamp.isoformat()}|{tweet.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        timestamp, tweet_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(tweet_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        app_logger.error(f"Invalid cursor: {cursor}")
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "result": False,
+                "error_type": 400,
+                "error_message": "Invalid cursor",
+            },
+        )
+
+
+def encode_search_cursor(rank: float, tweet_id: int) -> str:
+    """Opaque search cursor pointing right after the given match"""
+    raw = f"{rank!r}|{tweet_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_search_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        rank, tweet_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return float(rank), int(tweet_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        app_logger.error(f"Invalid cursor: {cursor}")
+        raise HTTPException(
+            status_code=400,
+            detail={
+                "result": False,
+                "error_type": 400,
+                "error_message": "Invalid cursor",
+            },
+        )
+
+
 async def tweet_by_id(
     tweet_id: int, db: AsyncSession = Depends(get_db), user_id=None
 ) -> User | None:
@@ -35,13 +97,18 @@ async def tweet_by_id(
     return tweet
 
 
+async def tweet_version(db: AsyncSession, tweet_id: int) -> int | None:
+    """Version of the tweet without loading it, None if it doesn't exist"""
+    result = await db.execute(select(Tweet.version).where(Tweet.id == tweet_id))
+    return result.scalar()
+
+
 async def tweet_by_id_with_details(db: AsyncSession, tweet_id: int) -> Tweet:
     tweet_result = await db.execute(
         select(Tweet)
         .where(Tweet.id == tweet_id)
         .options(
             selectinload(Tweet.tweet_media),
-            selectinload(Tweet.liked_by),
             selectinload(Tweet.author),
         )
         .order_by(Tweet.timestamp.desc())
@@ -61,18 +128,203 @@ async def tweet_by_id_with_details(db: AsyncSession, tweet_id: int) -> Tweet:
 
 
 async def tweets_by_user_ids(
-    db: AsyncSession, user_ids: list[int], limit: int, offset: int
+    db: AsyncSession, user_ids: list[int], limit: int, offset: int = 0, cursor: str | None = None
 ) -> Sequence[Tweet]:
-    result = await db.execute(
+    """
+    Page of the users' tweets, newest first.
+    With a cursor the page starts right after the tweet it points to (keyset pagination
+    over ix_tweets_user_id_timestamp_id), otherwise `offset` tweets are skipped.
+    """
+    query = (
         select(Tweet)
         .where(Tweet.user_id.in_(user_ids))
         .options(
             selectinload(Tweet.tweet_media),
-            selectinload(Tweet.liked_by),
             selectinload(Tweet.author),
         )
-        .order_by(Tweet.timestamp.desc())
-        .offset(offset)
+        .order_by(Tweet.timestamp.desc(), Tweet.id.desc())
         .limit(limit)
     )
+    if cursor:
+        query = query.where(tuple_(Tweet.timestamp, Tweet.id) < decode_cursor(cursor))
+    else:
+        query = query.offset(offset)
+    result = await db.execute(query)
     return result.scalars().all()
+
+
+async def tweets_by_ids(db: AsyncSession, tweet_ids: list[int]) -> list[Tweet]:
+    """Tweets with their relations, in the order of tweet_ids"""
+    if not tweet_ids:
+        return []
+    result = await db.execute(
+        select(Tweet)
+        .where(Tweet.id.in_(tweet_ids))
+        .options(
+            selectinload(Tweet.tweet_media),
+            selectinload(Tweet.author),
+        )
+    )
+    tweets = {tweet.id: tweet for tweet in result.scalars().all()}
+    return [tweets[tweet_id] for tweet_id in tweet_ids if tweet_id in tweets]
+
+
+async def recent_tweet_ids(db: AsyncSession, user_ids: list[int], limit: int) -> Sequence[int]:
+    if not user_ids:
+        return []
+    result = await db.execute(
+        select(Tweet.id)
+        .where(Tweet.user_id.in_(user_ids))
+        .order_by(Tweet.timestamp.desc(), Tweet.id.desc())
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+async def likers_sample(
+    db: AsyncSession, tweet_ids: list[int], limit: int
+) -> dict[int, list[tuple[int, str]]]:
+    """
+    Up to `limit` (user id, username) likers per tweet.
+    One bounded branch per tweet, so the cost doesn't grow with the number of likes.
+    """
+    samples: dict[int, list[tuple[int, str]]] = {tweet_id: [] for tweet_id in tweet_ids}
+    if not tweet_ids or limit <= 0:
+        return samples
+    branches = [
+        select(
+            select(likes.c.tweet_id, likes.c.user_id)
+            .where(likes.c.tweet_id == tweet_id)
+            .order_by(likes.c.user_id)
+            .limit(limit)
+            .subquery()
+        )
+        for tweet_id in tweet_ids
+    ]
+    sampled = union_all(*branches).subquery()
+    result = await db.execute(
+        select(sampled.c.tweet_id, User.id, User.username)
+        .join(User, User.id == sampled.c.user_id)
+        .order_by(sampled.c.tweet_id, User.id)
+    )
+    for tweet_id, user_id, username in result.all():
+        samples[tweet_id].append((user_id, username))
+    return samples
+
+
+async def liked_tweet_ids(db: AsyncSession, user_id: int, tweet_ids: list[int]) -> set[int]:
+    """Which of the tweets the user liked"""
+    if not tweet_ids:
+        return set()
+    result = await db.execute(
+        select(likes.c.tweet_id).where(likes.c.user_id == user_id, likes.c.tweet_id.in_(tweet_ids))
+    )
+    return set(result.scalars().all())
+
+
+async def apply_like_change(db: AsyncSession, changed_rows, tweet_id: int, delta: int):
+    """
+    Run the like insert/delete `changed_rows` (RETURNING likes.tweet_id) and move the tweet's
+    counter and version when a row was affected. Returns (tweet exists, state changed).
+    """
+    counter = update(Tweet).values(
+        likes_count=Tweet.likes_count + delta, version=Tweet.version + 1
+    )
+    if db.bind.dialect.name == "postgresql":
+        # a single round-trip: data-modifying CTEs, the outer SELECT reports the outcome
+        changed = changed_rows.cte("changed")
+        counted = (
+            counter.where(Tweet.id.in_(select(changed.c.tweet_id)))
+            .returning(Tweet.id)
+            .cte("counted")
+        )
+        result = await db.execute(
+            select(exists().where(Tweet.id == tweet_id), exists(select(counted.c.id)))
+        )
+        tweet_exists, state_changed = result.one()
+    else:
+        # SQLite has no DML in CTEs, the counter update is a second statement
+        result = await db.execute(changed_rows)
+        state_changed = result.first() is not None
+        if state_changed:
+            tweet_exists = True
+            await db.execute(counter.where(Tweet.id == tweet_id))
+        else:
+            result = await db.execute(select(exists().where(Tweet.id == tweet_id)))
+            tweet_exists = result.scalar()
+    if state_changed:
+        await db.commit()
+    return bool(tweet_exists), bool(state_changed)
+
+
+async def like_tweet(db: AsyncSession, user_id: int, tweet_id: int) -> tuple[bool, bool]:
+    """Idempotent like, returns whether the tweet exists and whether the like was added"""
+    changed_rows = (
+        insert_ignoring_conflicts(db, likes)
+        .from_select(
+            ["user_id", "tweet_id"],
+            select(literal(user_id), literal(tweet_id)).where(
+                exists().where(Tweet.id == tweet_id)
+            ),
+        )
+        .returning(likes.c.tweet_id)
+    )
+    return await apply_like_change(db, changed_rows, tweet_id, 1)
+
+
+async def unlike_tweet(db: AsyncSession, user_id: int, tweet_id: int) -> tuple[bool, bool]:
+    """Idempotent unlike, returns whether the tweet exists and whether a like was removed"""
+    changed_rows = (
+        delete(likes)
+        .where(likes.c.user_id == user_id)
+        .where(likes.c.tweet_id == tweet_id)
+        .returning(likes.c.tweet_id)
+    )
+    return await apply_like_change(db, changed_rows, tweet_id, -1)
+
+
+def search_terms(text: str) -> list[str]:
+    return re.findall(r"\w+", text)
+
+
+async def tweets_by_text(
+    db: AsyncSession, text: str, limit: int, cursor: str | None = None
+) -> tuple[list[Tweet], str | None]:
+    """
+    Page of tweets matching all words of `text`, best match first, and the cursor of the next
+    page. Ranked by ts_rank over the GIN-indexed search_vector on PostgreSQL and by bm25 over
+    the FTS5 index on SQLite, ties broken by the newest id (keyset pagination on rank, id).
+    """
+    terms = search_terms(text)
+    if not terms:
+        return [], None
+    if db.bind.dialect.name == "postgresql":
+        search_vector = literal_column("tweets.search_vector")
+        query = func.websearch_to_tsquery(SEARCH_CONFIG, " ".join(terms))
+        matches = select(
+            Tweet.id.label("id"), func.ts_rank(search_vector, query).label("rank")
+        ).where(search_vector.op("@@")(query))
+    else:
+        fts = table("tweets_fts", column("rowid"))
+        # quoted terms are matched literally, FTS5 operators in the input are ignored
+        query = " ".join(f'"{term}"' for term in terms)
+        rank = -func.bm25(literal_column("tweets_fts"))
+        matches = (
+            select(fts.c.rowid.label("id"), rank.label("rank"))
+            .select_from(fts)
+            .where(literal_column("tweets_fts").op("MATCH")(query))
+        )
+    matches = matches.subquery()
+    page = select(matches.c.id, matches.c.rank)
+    if cursor:
+        page = page.where(tuple_(matches.c.rank, matches.c.id) < decode_search_cursor(cursor))
+    result = await db.execute(
+        page.order_by(matches.c.rank.desc(), matches.c.id.desc()).limit(limit)
+    )
+    ranked = result.all()
+
+    tweets = await tweets_by_ids(db, [tweet_id for tweet_id, _ in ranked])
+    next_cursor = None
+    if len(ranked) == limit:
+        next_cursor = encode_search_cursor(ranked[-1].rank, ranked[-1].id)
+    return tweets, next_cursor
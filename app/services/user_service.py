@@ -1,74 +1,34 @@
 from typing import Sequence
 
 from fastapi import Depends, HTTPException
+from sqlalchemy import delete, func, literal, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, sessionmaker
 
-from app.models import User
+from app.models import User, followers, hash_api_key
 from config.config import get_db
 from config.logging_config import logger
 
 app_logger = logger.bind(name="app")
 
 
-async def user_by_api_key(
-    api_key: str, db: AsyncSession = Depends(get_db), _with=None
-) -> User | None:
-    """Get user by api_key and update last seen timestamp."""
+def user_loader_options(_with=None) -> list:
+    """Relationship loaders for the `_with` argument of user getters"""
     if _with == "followers":
-        user_result = await db.execute(
-            select(User).where(User.api_key == api_key).options(selectinload(User.followers))
-        )
-    elif _with == "following":
-        user_result = await db.execute(
-            select(User).where(User.api_key == api_key).options(selectinload(User.following))
-        )
-    elif _with == "all":
-        user_result = await db.execute(
-            select(User)
-            .where(User.api_key == api_key)
-            .options(selectinload(User.following), selectinload(User.followers))
-        )
-    else:
-        user_result = await db.execute(select(User).where(User.api_key == api_key))
-    current_user = user_result.scalars().first()
-    if current_user:
-        await current_user.update_last_seen()
-        await db.flush()
-        await db.commit()
-        await db.refresh(current_user)
-        app_logger.info(f"User authenticated: id={current_user.id}")
-    else:
-        app_logger.error("Invalid API key")
-        raise HTTPException(
-            status_code=403,
-            detail={
-                "result": False,
-                "error_type": 403,
-                "error_message": "Invalid API Key",
-            },
-        )
-    return current_user
+        return [selectinload(User.followers)]
+    if _with == "following":
+        return [selectinload(User.following)]
+    if _with == "all":
+        return [selectinload(User.following), selectinload(User.followers)]
+    return []
 
 
 async def user_by_id(user_id: int, db: AsyncSession = Depends(get_db), _with=None) -> User | None:
-    if _with == "followers":
-        user_result = await db.execute(
-            select(User).where(User.id == user_id).options(selectinload(User.followers))
-        )
-    elif _with == "following":
-        user_result = await db.execute(
-            select(User).where(User.id == user_id).options(selectinload(User.following))
-        )
-    elif _with == "all":
-        user_result = await db.execute(
-            select(User)
-            .where(User.id == user_id)
-            .options(selectinload(User.following), selectinload(User.followers))
-        )
-    else:
-        user_result = await db.execute(select(User).where(User.id == user_id))
+    user_result = await db.execute(
+        select(User).where(User.id == user_id).options(*user_loader_options(_with))
+    )
     user = user_result.scalars().first()
     if not user:
         app_logger.error(f"User id={user_id} not found")
@@ -83,6 +43,46 @@ async def user_by_id(user_id: int, db: AsyncSession = Depends(get_db), _with=Non
     return user
 
 
+async def user_version(db: AsyncSession, user_id: int) -> int | None:
+    """Version of the user without loading it, None if it doesn't exist"""
+    result = await db.execute(select(User.version).where(User.id == user_id))
+    return result.scalar()
+
+
+async def relations_sample(
+    db: AsyncSession, user_id: int, limit: int
+) -> tuple[list[tuple[int, str]], list[tuple[int, str]]]:
+    """
+    Up to `limit` (user id, username) followers and followed users of the user in one query,
+    the totals are in the counter columns.
+    """
+    sides = {"followers": [], "following": []}
+    if limit <= 0:
+        return sides["followers"], sides["following"]
+    branches = [
+        select(
+            select(literal(side).label("side"), other.label("other_id"))
+            .where(own == user_id)
+            .order_by(other)
+            .limit(limit)
+            .subquery()
+        )
+        for side, own, other in (
+            ("followers", followers.c.followed_id, followers.c.follower_id),
+            ("following", followers.c.follower_id, followers.c.followed_id),
+        )
+    ]
+    sampled = union_all(*branches).subquery()
+    result = await db.execute(
+        select(sampled.c.side, User.id, User.username)
+        .join(User, User.id == sampled.c.other_id)
+        .order_by(sampled.c.side, User.id)
+    )
+    for side, other_id, username in result.all():
+        sides[side].append((other_id, username))
+    return sides["followers"], sides["following"]
+
+
 async def check_unique_user(
     db: AsyncSession, username: str, email: str, api_key: str
 ) -> bool | None:
@@ -90,7 +90,9 @@ async def check_unique_user(
     app_logger.debug("check_unique_user()")
     result = await db.execute(
         select(User).where(
-            (User.username == username) | (User.email == email) | (User.api_key == api_key)
+            (User.username == username)
+            | (User.email == email)
+            | (User.api_key == hash_api_key(api_key))
         )
     )
     existing_user = result.scalars().first()
@@ -104,3 +106,114 @@ async def get_users(db: AsyncSession, limit: int, offset: int) -> Sequence[User]
         select(User).order_by(User.id.desc()).offset(offset).limit(limit)
     )
     return users_result.scalars().all()
+
+
+async def followed_user_ids(db: AsyncSession, user_id: int) -> Sequence[int]:
+    result = await db.execute(
+        select(followers.c.followed_id).where(followers.c.follower_id == user_id)
+    )
+    return result.scalars().all()
+
+
+async def follower_user_ids(db: AsyncSession, user_id: int) -> Sequence[int]:
+    result = await db.execute(
+        select(followers.c.follower_id).where(followers.c.followed_id == user_id)
+    )
+    return result.scalars().all()
+
+
+def insert_ignoring_conflicts(db: AsyncSession, table):
+    """INSERT ... ON CONFLICT DO NOTHING of the session's dialect"""
+    dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+    return dialect.insert(table).on_conflict_do_nothing()
+
+
+async def follow_users(
+    db: AsyncSession, follower_id: int, user_ids: list[int]
+) -> tuple[list[int], list[int]]:
+    """
+    Follow many users at once: one query validates the ids, one INSERT ... ON CONFLICT DO NOTHING
+    adds the relations. Returns the newly followed ids and the skipped ones (unknown or own id),
+    ids that were already followed are in neither list.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    result = await db.execute(
+        select(User.id).where(User.id.in_(user_ids)).where(User.id != follower_id)
+    )
+    existing = set(result.scalars().all())
+    skipped = [user_id for user_id in user_ids if user_id not in existing]
+    if not existing:
+        return [], skipped
+
+    result = await db.execute(
+        insert_ignoring_conflicts(db, followers)
+        .values(
+            [
+                {"follower_id": follower_id, "followed_id": user_id}
+                for user_id in user_ids
+                if user_id in existing
+            ]
+        )
+        .returning(followers.c.followed_id)
+    )
+    followed = set(result.scalars().all())
+    if followed:
+        await User.update_follow_counters(db, follower_id, followed, 1)
+    await db.commit()
+    return [user_id for user_id in user_ids if user_id in followed], skipped
+
+
+async def unfollow_users(db: AsyncSession, follower_id: int, user_ids: list[int]) -> list[int]:
+    """Unfollow many users with a single DELETE, returns the ids that were followed"""
+    user_ids = list(dict.fromkeys(user_ids))
+    result = await db.execute(
+        delete(followers)
+        .where(followers.c.follower_id == follower_id)
+        .where(followers.c.followed_id.in_(user_ids))
+        .returning(followers.c.followed_id)
+    )
+    unfollowed = set(result.scalars().all())
+    if unfollowed:
+        await User.update_follow_counters(db, follower_id, unfollowed, -1)
+    await db.commit()
+    return [user_id for user_id in user_ids if user_id in unfollowed]
+
+
+async def repair_follow_counters(session_factory: sessionmaker, batch_size: int = 1000) -> int:
+    """
+    Recompute followers_count/following_count from the followers table, `batch_size` users
+    per transaction. Returns how many users had drifted counters.
+    """
+    repaired = 0
+    last_id = 0
+    while True:
+        async with session_factory() as session:
+            result = await session.execute(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(batch_size)
+            )
+            user_ids = result.scalars().all()
+            if not user_ids:
+                return repaired
+            followers_total = (
+                select(func.count()).where(followers.c.followed_id == User.id).scalar_subquery()
+            )
+            following_total = (
+                select(func.count()).where(followers.c.follower_id == User.id).scalar_subquery()
+            )
+            result = await session.execute(
+                update(User)
+                .where(User.id.in_(user_ids))
+                .where(
+                    (User.followers_count != followers_total)
+                    | (User.following_count != following_total)
+                )
+                .values(
+                    followers_count=followers_total,
+                    following_count=following_total,
+                    version=User.version + 1,
+                )
+            )
+            await session.commit()
+        repaired += result.rowcount
+        last_id = user_ids[-1]
+        app_logger.info(f"Follow counters checked up to user id={last_id}, {repaired} repaired")
@@ -1,6 +1,12 @@
+import hashlib
 import os
+import uuid
+from pathlib import Path
+from typing import AsyncIterator
 
+import aiofiles
 import aiofiles.os as aio_os
+from fastapi import HTTPException, UploadFile
 
 from config.logging_config import logger
 
@@ -33,3 +39,66 @@ async def delete_folder_recursive(folder_path: str) -> None:
     except Exception as e:
         app_logger.exception(f"Error deleting folder: {folder_path}")
         raise Exception(f"Error deleting folder: {folder_path}")
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag built from the values the representation depends on"""
+    return '"' + "-".join(str(part) for part in parts) + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """If-None-Match check, uses the weak comparison required for it (RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+async def read_in_chunks(file: UploadFile, chunk_size: int, max_size: int) -> AsyncIterator[bytes]:
+    """Read an uploaded file chunk by chunk, failing as soon as it exceeds max_size."""
+    size = 0
+    while chunk := await file.read(chunk_size):
+        size += len(chunk)
+        if size > max_size:
+            app_logger.error(f"File {file.filename} exceeds {max_size} bytes")
+            raise HTTPException(
+                status_code=413,
+                detail={
+                    "result": False,
+                    "error_type": 413,
+                    "error_message": "File is too large",
+                },
+            )
+        yield chunk
+
+
+async def hash_upload(file: UploadFile, chunk_size: int, max_size: int) -> str:
+    """sha256 of an uploaded file read chunk by chunk, the file is rewound afterwards."""
+    digest = hashlib.sha256()
+    await file.seek(0)
+    async for chunk in read_in_chunks(file, chunk_size, max_size):
+        digest.update(chunk)
+    await file.seek(0)
+    return digest.hexdigest()
+
+
+async def save_upload(
+    file: UploadFile | bytes, path: Path, chunk_size: int, max_size: int
+) -> None:
+    """Write an uploaded file through a temporary name, readers never see a partial file."""
+    await create_folder(str(path.parent))
+    partial = path.parent / f".{uuid.uuid4()}.part"
+    try:
+        async with aiofiles.open(partial, "wb") as out:
+            if isinstance(file, bytes):
+                await out.write(file)
+            else:
+                await file.seek(0)
+                async for chunk in read_in_chunks(file, chunk_size, max_size):
+                    await out.write(chunk)
+        await aio_os.replace(partial, path)
+    finally:
+        if await aio_os.path.exists(partial):
+            await aio_os.remove(partial)
@@ -1,44 +1,75 @@
 import asyncio
-import os
 import time
 
 import aiohttp
 import requests
-
-from config.config import YANDEX_DISK_TOKEN, celery_app
+from celery.signals import worker_process_init, worker_process_shutdown
+from fastapi import HTTPException, UploadFile
+
+from config.config import (
+    MEDIA_CHUNK_SIZE,
+    MEDIA_DELETE_CONCURRENCY,
+    MEDIA_MAX_SIZE,
+    MEDIA_UPLOAD_RETRIES,
+    YANDEX_DISK_API_URL,
+    YANDEX_DISK_TOKEN,
+    celery_app,
+)
 from config.logging_config import logger
 
+from .http_client import (
+    close_sync_session,
+    close_worker_loop,
+    get_http_session,
+    get_sync_session,
+    reset_worker_clients,
+    run_in_worker_loop,
+    sync_timeout,
+)
+from .utils import read_in_chunks
+
 app_logger = logger.bind(name="app")
 
 
 async def upload_file_to_disk(
-    dir_path: str, file_name: str, disk_folder_path: str, ya_token: str
+    file: UploadFile | bytes,
+    file_name: str,
+    disk_folder_path: str,
+    ya_token: str,
+    max_retries: int = MEDIA_UPLOAD_RETRIES,
 ) -> bool:
-    """Upload a file to Yandex Disk."""
-    url = "https://cloud-api.yandex.net/v1/disk/resources/upload"
+    """
+    Stream an uploaded file to Yandex Disk in MEDIA_CHUNK_SIZE chunks (bytes, e.g. a processed
+    image, are sent as they are).
+    A failed attempt is replayed from the start of the request's spooled file.
+    """
+    url = f"{YANDEX_DISK_API_URL}/resources/upload"
     headers = {"Authorization": f"OAuth {ya_token}"}
     params = {"path": f"{disk_folder_path}/{file_name}", "overwrite": "true"}
 
+    session = get_http_session()
     try:
         app_logger.info("Requesting upload URL from Yandex Disk")
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, params=params) as response:
-                response.raise_for_status()
-                data = await response.json()
-                upload_url = data.get("href")
-                if not upload_url:
-                    app_logger.error("Failed to obtain upload URL")
-                    return False
-
-        path = os.path.join(dir_path, file_name)
-        if not os.path.isfile(path):
-            app_logger.error(f"File not found: {path}")
-            return False
-
-        app_logger.info("Uploading file to Yandex Disk")
-        async with aiohttp.ClientSession() as session:
-
-            async with session.put(upload_url, data=open(path, "rb")) as upload_response:
+        async with session.get(url, headers=headers, params=params) as response:
+            response.raise_for_status()
+            data = await response.json()
+            upload_url = data.get("href")
+            if not upload_url:
+                app_logger.error("Failed to obtain upload URL")
+                return False
+    except aiohttp.ClientError as e:
+        app_logger.exception("Error during file upload to Yandex Disk")
+        return False
+
+    for attempt in range(1, max_retries + 1):
+        if isinstance(file, bytes):
+            body = file
+        else:
+            await file.seek(0)
+            body = read_in_chunks(file, MEDIA_CHUNK_SIZE, MEDIA_MAX_SIZE)
+        try:
+            app_logger.info("Uploading file to Yandex Disk")
+            async with session.put(upload_url, data=body) as upload_response:
                 upload_response.raise_for_status()
                 if upload_response.status == 201:
                     app_logger.info("File uploaded successfully")
@@ -47,49 +78,49 @@ async def upload_file_to_disk(
                 app_logger.error("File upload failed")
                 return False
 
-    except aiohttp.ClientError as e:
-        app_logger.exception("Error during file upload to Yandex Disk")
-        return False
+        except aiohttp.ClientError as e:
+            if isinstance(e.__cause__, HTTPException):  # raised while reading the file
+                raise e.__cause__
+            app_logger.warning(f"Upload attempt {attempt} failed: {str(e)}")
+
+    app_logger.error("All attempts to upload the file failed")
+    return False
 
 
 async def get_file_shareable_link(
     file_path: str, ya_token: str, max_retries: int = 3, retry_delay: float = 1.0
 ) -> str | None:
     """Get a shareable link for a file on Yandex Disk with retry logic."""
-    publish_url = "https://cloud-api.yandex.net/v1/disk/resources/publish"
-    meta_url = "https://cloud-api.yandex.net/v1/disk/resources"
+    publish_url = f"{YANDEX_DISK_API_URL}/resources/publish"
+    meta_url = f"{YANDEX_DISK_API_URL}/resources"
     headers = {"Authorization": f"OAuth {ya_token}"}
     params = {"path": file_path}
 
-    async with aiohttp.ClientSession() as session:
-        for attempt in range(1, max_retries + 1):
-            try:
-                async with session.put(
-                    publish_url, headers=headers, params=params
-                ) as pub_response:
-                    pub_response.raise_for_status()
-
-                async with session.get(meta_url, headers=headers, params=params) as meta_response:
-                    meta_response.raise_for_status()
-                    data = await meta_response.json()
-                    public_url = data.get("public_url")
-
-                    if public_url:
-                        app_logger.info(
-                            f"Public link obtained after {attempt} attempts: {public_url}"
-                        )
-                        return public_url
-
-                if attempt < max_retries:
-                    await asyncio.sleep(retry_delay)
-
-            except aiohttp.ClientError as e:
-                app_logger.warning(f"Attempt {attempt} failed: {str(e)}")
-                if attempt == max_retries:
-                    app_logger.error("All attempts to get public link failed")
-                    return None
+    session = get_http_session()
+    for attempt in range(1, max_retries + 1):
+        try:
+            async with session.put(publish_url, headers=headers, params=params) as pub_response:
+                pub_response.raise_for_status()
+
+            async with session.get(meta_url, headers=headers, params=params) as meta_response:
+                meta_response.raise_for_status()
+                data = await meta_response.json()
+                public_url = data.get("public_url")
+
+                if public_url:
+                    app_logger.info(f"Public link obtained after {attempt} attempts: {public_url}")
+                    return public_url
+
+            if attempt < max_retries:
                 await asyncio.sleep(retry_delay)
 
+        except aiohttp.ClientError as e:
+            app_logger.warning(f"Attempt {attempt} failed: {str(e)}")
+            if attempt == max_retries:
+                app_logger.error("All attempts to get public link failed")
+                return None
+            await asyncio.sleep(retry_delay)
+
     return None
 
 
@@ -98,6 +129,85 @@ async def get_direct_link(public_url: str) -> str | None:
     return f"https://getfile.dokpub.com/yandex/get/{public_url}" if public_url else None
 
 
+@worker_process_init.connect
+def reset_worker_http_session(**kwargs):
+    """A forked worker must not share the parent's pooled connections"""
+    reset_worker_clients()
+
+
+@worker_process_shutdown.connect
+def close_worker_http_session(**kwargs):
+    close_sync_session()
+    close_worker_loop()
+
+
+# statuses worth another attempt later, anything else is final
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+async def delete_one_from_yadisk(
+    session: aiohttp.ClientSession, ya_token: str, file_disk_path: str
+) -> str:
+    """Delete a file, return its outcome: deleted, missing, retry or failed"""
+    url = f"{YANDEX_DISK_API_URL}/resources"
+    headers = {"Authorization": f"OAuth {ya_token}"}
+    params = {"path": file_disk_path, "permanently": "true"}
+    try:
+        async with session.delete(url, headers=headers, params=params) as response:
+            if response.status in {202, 204}:
+                return "deleted"
+            if response.status == 404:
+                return "missing"
+            app_logger.warning(f"Deleting {file_disk_path} failed: {response.status}")
+            return "retry" if response.status in RETRYABLE_STATUSES else "failed"
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        app_logger.warning(f"Deleting {file_disk_path} failed with exception: {str(e)}")
+        return "retry"
+
+
+async def delete_many_from_yadisk(
+    ya_token: str, file_disk_paths: list[str], concurrency: int = MEDIA_DELETE_CONCURRENCY
+) -> dict[str, str]:
+    """Delete files concurrently, at most `concurrency` requests at a time"""
+    session = get_http_session()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def delete(file_disk_path: str) -> str:
+        async with semaphore:
+            return await delete_one_from_yadisk(session, ya_token, file_disk_path)
+
+    paths = list(dict.fromkeys(file_disk_paths))
+    outcomes = await asyncio.gather(*(delete(path) for path in paths))
+    return dict(zip(paths, outcomes))
+
+
+@celery_app.task(bind=True, max_retries=3)
+def celery_task_delete_media_batch(self, file_paths: list[str], results: dict | None = None):
+    """
+    Delete a batch of files from Y.disk without blocking the worker between attempts.
+    Only the files that failed with a transient error are retried, with a growing countdown,
+    `results` carries the outcomes of the earlier attempts so the last one reports the batch.
+    """
+    attempt = run_in_worker_loop(delete_many_from_yadisk(YANDEX_DISK_TOKEN, file_paths))
+    outcomes = {**(results or {}), **attempt}
+    pending = [path for path, outcome in attempt.items() if outcome == "retry"]
+    app_logger.info(
+        f"Deleted {len(attempt) - len(pending)}/{len(attempt)} files, {len(pending)} to retry"
+    )
+    if pending:
+        if self.request.retries < self.max_retries:
+            self.retry(
+                args=[pending],
+                kwargs={"results": outcomes},
+                countdown=60 * 2**self.request.retries,
+            )
+        app_logger.error(f"Giving up deleting {len(pending)} files from Y.disk: {pending}")
+    status = (
+        "success" if all(o in {"deleted", "missing"} for o in outcomes.values()) else "partial"
+    )
+    return {"status": status, "results": outcomes}
+
+
 @celery_app.task(bind=True, max_retries=3)
 def celery_task_delete_media(self, file_path):
     try:
@@ -111,13 +221,15 @@ def delete_from_yadisk(ya_token: str, file_disk_path: str, retries: int = 3):
     """Sync function of deleting file from Y.disk"""
     app_logger.debug(f"delete_from_yadisk(file_disk_path={file_disk_path})")
 
-    url = "https://cloud-api.yandex.net/v1/disk/resources"
+    url = f"{YANDEX_DISK_API_URL}/resources"
     headers = {"Authorization": f"OAuth {ya_token}"}
     params = {"path": file_disk_path, "permanently": "true"}
 
     for attempt in range(1, retries + 1):
         try:
-            response = requests.delete(url, headers=headers, params=params)
+            response = get_sync_session().delete(
+                url, headers=headers, params=params, timeout=sync_timeout()
+            )
 
             if response.status_code == 204:
                 app_logger.info(f"Successfully deleted: {file_disk_path}")
@@ -0,0 +1,49 @@
+"""
+Compare two reports of benchmarks.run endpoint by endpoint.
+
+    python -m benchmarks.compare before.json after.json
+"""
+
+import json
+import sys
+from pathlib import Path
+
+METRICS = ("throughput", "p50", "p95", "p99")
+
+
+def endpoint_metrics(report: dict) -> dict[str, dict[str, float]]:
+    return {
+        endpoint: {"throughput": data["throughput"], **data["latency_ms"]}
+        for endpoint, data in report["endpoints"].items()
+    }
+
+
+def change(before: float, after: float) -> str:
+    if not before:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def compare(before: dict, after: dict) -> list[str]:
+    old, new = endpoint_metrics(before), endpoint_metrics(after)
+    lines = [f"{'endpoint':<32}" + "".join(f"{metric:>24}" for metric in METRICS)]
+    for endpoint in sorted(old.keys() & new.keys()):
+        cells = [
+            f"{old[endpoint][m]:.1f} -> {new[endpoint][m]:.1f} {change(old[endpoint][m], new[endpoint][m])}"
+            for m in METRICS
+        ]
+        lines.append(f"{endpoint:<32}" + "".join(f"{cell:>24}" for cell in cells))
+    return lines
+
+
+def main(argv: list[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        sys.exit(__doc__)
+    before, after = (json.loads(Path(path).read_text()) for path in argv)
+    print(f"{before['meta']['commit']} -> {after['meta']['commit']}")
+    print("\n".join(compare(before, after)))
+
+
+if __name__ == "__main__":
+    main()
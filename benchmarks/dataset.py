@@ -0,0 +1,141 @@
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.models import Media, Tweet, User, followers, hash_api_key, likes
+from config.config import Base
+from config.logging_config import logger
+
+bench_logger = logger.bind(name="bench")
+
+INSERT_BATCH = 5000
+
+
+@dataclass
+class Dataset:
+    """Synthetic social graph, ids are assigned in insertion order starting from 1"""
+
+    users: list[dict] = field(default_factory=list)
+    follows: list[dict] = field(default_factory=list)
+    tweets: list[dict] = field(default_factory=list)
+    media: list[dict] = field(default_factory=list)
+    likes: list[dict] = field(default_factory=list)
+    # relative activity of every user, drives who tweets, likes and sends load
+    activity: list[float] = field(default_factory=list)
+
+    def api_key(self, user_id: int) -> str:
+        return f"bench-key-{user_id}"
+
+
+def power_law(rnd: random.Random, alpha: float, scale: float, cap: int) -> int:
+    """Pareto distributed integer in [0, cap]"""
+    return min(int(scale * (rnd.paretovariate(alpha) - 1)), cap)
+
+
+def generate(
+    n_users: int = 1000,
+    mean_following: int = 30,
+    mean_tweets: int = 10,
+    mean_likes: int = 5,
+    media_ratio: float = 0.2,
+    alpha: float = 1.5,
+    seed: int = 42,
+) -> Dataset:
+    """
+    Generate users whose follower counts, tweet counts and likes per tweet follow
+    a power law: a few celebrities, a long tail of quiet accounts.
+    """
+    rnd = random.Random(seed)
+    dataset = Dataset()
+    now = datetime.now(timezone.utc)
+    # mean of paretovariate(alpha) - 1 is 1 / (alpha - 1)
+    scale = alpha - 1
+
+    user_ids = list(range(1, n_users + 1))
+    popularity = [rnd.paretovariate(alpha) for _ in user_ids]
+    dataset.activity = [rnd.paretovariate(alpha) for _ in user_ids]
+    for user_id in user_ids:
+        dataset.users.append(
+            {
+                "id": user_id,
+                "username": f"bench_user_{user_id}",
+                "email": f"bench_user_{user_id}@example.com",
+                "api_key": hash_api_key(dataset.api_key(user_id)),
+                "followers_count": 0,
+                "following_count": 0,
+            }
+        )
+
+    # preferential attachment: popular users collect most of the followers
+    for user_id in user_ids:
+        count = power_law(rnd, alpha, mean_following * scale, n_users - 1)
+        followed = set(rnd.choices(user_ids, weights=popularity, k=count))
+        followed.discard(user_id)
+        dataset.follows.extend(
+            {"follower_id": user_id, "followed_id": followed_id} for followed_id in followed
+        )
+        dataset.users[user_id - 1]["following_count"] = len(followed)
+        for followed_id in followed:
+            dataset.users[followed_id - 1]["followers_count"] += 1
+
+    posts = []
+    for user_id, activity in zip(user_ids, dataset.activity):
+        count = min(int(mean_tweets * scale * (activity - 1)), mean_tweets * 50)
+        posts.extend(
+            (now - timedelta(seconds=rnd.randint(0, 30 * 24 * 3600)), user_id)
+            for _ in range(count)
+        )
+    # the app relies on tweet ids growing with time
+    posts.sort()
+    for tweet_id, (timestamp, user_id) in enumerate(posts, start=1):
+        dataset.tweets.append(
+            {
+                "id": tweet_id,
+                "tweet_data": f"Benchmark tweet {tweet_id} by {user_id}",
+                "user_id": user_id,
+                "timestamp": timestamp,
+                "likes_count": 0,
+            }
+        )
+        if rnd.random() < media_ratio:
+            dataset.media.append(
+                {
+                    "image_link": f"https://example.com/bench/{tweet_id}.jpg",
+                    "file_name": f"bench_{tweet_id}.jpg",
+                    "tweet_id": tweet_id,
+                }
+            )
+
+    for tweet in dataset.tweets:
+        count = power_law(rnd, alpha, mean_likes * scale, n_users)
+        likers = set(rnd.choices(user_ids, weights=dataset.activity, k=count))
+        tweet["likes_count"] = len(likers)
+        dataset.likes.extend({"user_id": user_id, "tweet_id": tweet["id"]} for user_id in likers)
+
+    return dataset
+
+
+async def seed(engine: AsyncEngine, dataset: Dataset) -> None:
+    """Recreate the schema and bulk insert the dataset"""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        for table, rows in (
+            (User.__table__, dataset.users),
+            (followers, dataset.follows),
+            (Tweet.__table__, dataset.tweets),
+            (Media.__table__, dataset.media),
+            (likes, dataset.likes),
+        ):
+            for start in range(0, len(rows), INSERT_BATCH):
+                await conn.execute(table.insert(), rows[start : start + INSERT_BATCH])
+            bench_logger.info(f"{table.name}: {len(rows)} rows")
+        if conn.dialect.name == "postgresql":
+            # explicit ids were inserted, move the sequences past them
+            for table in ("users", "tweets", "media"):
+                await conn.exec_driver_sql(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT coalesce(max(id), 1) FROM {table}))"
+                )
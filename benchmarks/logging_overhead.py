@@ -0,0 +1,108 @@
+"""
+CPU cost of the log lines of a request.
+
+Replays the lines a feed request writes (request line, authentication, timeline debug line)
+with the classic setup (six text sinks with filters, queued to a writer thread, messages
+built with f-strings) and with LOG_MODE=fast (one JSON lines sink, lazily formatted messages),
+once keeping every request and once sampling the route. Process CPU time is measured,
+so the classic writer thread is included. Nothing leaves a temporary directory.
+
+    python -m benchmarks.logging_overhead --requests 20000 --sample-rate 0.1
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from config.logging_config import (
+    LOG_MODE,
+    configure_classic,
+    configure_fast,
+    current_request,
+    logger,
+)
+
+ROUTE = "GET /api/tweets/"
+
+
+def classic_request(app_logger, user_id: int) -> None:
+    app_logger.info("GET/api/tweets")
+    app_logger.info(f"User authenticated: id={user_id}")
+    app_logger.debug(f"Timeline of user id={user_id} rebuilt")
+
+
+def fast_request(app_logger, user_id: int) -> None:
+    app_logger.info("GET/api/tweets")
+    app_logger.info("User authenticated: id={}", user_id)
+    app_logger.debug("Timeline of user id={} rebuilt", user_id)
+
+
+def run(write_request, requests: int) -> float:
+    """CPU seconds per request, the sinks are drained before the clock stops"""
+    app_logger = logger.bind(name="app")
+    route = SimpleNamespace(path=ROUTE.split(" ", 1)[1])
+    started = time.process_time()
+    for user_id in range(requests):
+        token = current_request.set({"method": "GET", "route": route})
+        try:
+            write_request(app_logger, user_id)
+        finally:
+            current_request.reset(token)
+    logger.complete()
+    return (time.process_time() - started) / requests
+
+
+def measure(args: argparse.Namespace) -> dict:
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        try:
+            configure_classic(tmp)
+            report["classic"] = run(classic_request, args.requests)
+
+            sampled = f"1,{ROUTE}={args.sample_rate}"
+            for name, sampling in (("fast", "1"), ("fast_sampled", sampled)):
+                with open(tmp / f"{name}.jsonl", "w") as out:
+                    configure_fast(args.level, sampling, streams={"app": out}, default=out)
+                    report[name] = run(fast_request, args.requests)
+                    logger.remove()
+                report[f"{name}_lines"] = sum(1 for _ in open(tmp / f"{name}.jsonl"))
+            report["classic_lines"] = sum(1 for _ in open(tmp / "app_debug.log"))
+        finally:
+            configure_fast() if LOG_MODE == "fast" else configure_classic()
+
+    return {
+        "meta": {
+            "requests": args.requests,
+            "level": args.level,
+            "sample_rate": args.sample_rate,
+        },
+        **{
+            name: {
+                "cpu_us_per_request": round(report[name] * 1e6, 1),
+                "lines": report[f"{name}_lines"],
+            }
+            for name in ("classic", "fast", "fast_sampled")
+        },
+        "speedup": round(report["classic"] / report["fast"], 2),
+        "speedup_sampled": round(report["classic"] / report["fast_sampled"], 2),
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--level", default="INFO", help="LOG_LEVEL of the fast mode")
+    parser.add_argument("--sample-rate", type=float, default=0.1, help="share of requests kept")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    print(json.dumps(measure(parse_args(argv)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
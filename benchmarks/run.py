@@ -0,0 +1,341 @@
+"""
+End-to-end load benchmark.
+
+Seeds a synthetic social graph, starts the app with uvicorn against a local Yandex Disk stub
+and drives it over HTTP with a weighted mix of requests.
+Prints (or writes with --output) a JSON report with throughput and latency percentiles
+per endpoint, see benchmarks/compare.py for comparing two reports.
+
+    python -m benchmarks.run --users 2000 --duration 60 --concurrency 32 --output before.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import aiohttp
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config.logging_config import logger
+
+from .dataset import Dataset, generate, seed
+from .yandex_stub import YandexDiskStub
+
+bench_logger = logger.bind(name="bench")
+
+ROOT = Path(__file__).resolve().parent.parent
+IMAGE = ROOT / "tests" / "test_files" / "test_image_1.jpeg"
+DEFAULT_DATABASE_URL = f"sqlite+aiosqlite:///{ROOT / 'benchmarks' / 'bench.db'}"
+
+# share of every operation in the request mix
+SCENARIO = {
+    "feed": 50,
+    "tweet": 20,
+    "like": 10,
+    "create": 10,
+    "follow": 5,
+    "media": 5,
+}
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    if not values:
+        return 0.0
+    rank = max(int(round(q / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class Recorder:
+    """Latencies (seconds) and failures per endpoint"""
+
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.statuses: dict[str, dict[str, int]] = {}
+        self.recording = False
+
+    def record(self, endpoint: str, latency: float, status: int | None, ok: bool) -> None:
+        if not self.recording:
+            return
+        self.latencies.setdefault(endpoint, []).append(latency)
+        self.errors.setdefault(endpoint, 0)
+        if not ok:
+            self.errors[endpoint] += 1
+        statuses = self.statuses.setdefault(endpoint, {})
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            endpoints[endpoint] = {
+                "requests": len(latencies),
+                "errors": self.errors[endpoint],
+                "statuses": self.statuses[endpoint],
+                "throughput": round(len(latencies) / elapsed, 2),
+                "latency_ms": {
+                    "mean": round(sum(latencies) / len(latencies) * 1000, 3),
+                    "p50": round(percentile(latencies, 50) * 1000, 3),
+                    "p95": round(percentile(latencies, 95) * 1000, 3),
+                    "p99": round(percentile(latencies, 99) * 1000, 3),
+                    "max": round(latencies[-1] * 1000, 3),
+                },
+            }
+        requests = sum(e["requests"] for e in endpoints.values())
+        return {
+            "total": {
+                "requests": requests,
+                "errors": sum(e["errors"] for e in endpoints.values()),
+                "throughput": round(requests / elapsed, 2),
+            },
+            "endpoints": endpoints,
+        }
+
+
+class VirtualUser:
+    """Picks the next operation of the mix and times it"""
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        base_url: str,
+        dataset: Dataset,
+        recorder: Recorder,
+        rnd: random.Random,
+    ):
+        self.session = session
+        self.base_url = base_url
+        self.dataset = dataset
+        self.recorder = recorder
+        self.rnd = rnd
+        self.user_ids = [user["id"] for user in dataset.users]
+        self.n_tweets = len(dataset.tweets)
+        self.image = IMAGE.read_bytes()
+
+    async def request(self, endpoint: str, method: str, path: str, ok=(200, 201), **kwargs):
+        started = time.perf_counter()
+        try:
+            async with self.session.request(method, self.base_url + path, **kwargs) as response:
+                await response.read()
+                status = response.status
+        except aiohttp.ClientError:
+            status = None
+        self.recorder.record(endpoint, time.perf_counter() - started, status, status in ok)
+
+    async def step(self) -> None:
+        user_id = self.rnd.choices(self.user_ids, weights=self.dataset.activity)[0]
+        headers = {"api_key": self.dataset.api_key(user_id)}
+        operation = self.rnd.choices(list(SCENARIO), weights=list(SCENARIO.values()))[0]
+
+        if operation == "feed":
+            await self.request("GET /api/tweets", "GET", "/api/tweets/", headers=headers)
+        elif operation == "tweet":
+            tweet_id = self.rnd.randint(1, self.n_tweets)
+            await self.request(
+                "GET /api/tweets/{id}", "GET", f"/api/tweets/{tweet_id}", headers=headers
+            )
+        elif operation == "like":
+            tweet_id = self.rnd.randint(1, self.n_tweets)
+            await self.request(
+                "POST /api/tweets/{id}/likes",
+                "POST",
+                f"/api/tweets/{tweet_id}/likes",
+                headers=headers,
+            )
+        elif operation == "create":
+            await self.request(
+                "POST /api/tweets",
+                "POST",
+                "/api/tweets/",
+                headers=headers,
+                json={"tweet_data": "Benchmark tweet", "media_ids": []},
+            )
+        elif operation == "follow":
+            followed_id = self.rnd.choice(self.user_ids)
+            if followed_id == user_id:
+                return
+            await self.request(
+                "POST /api/users/{id}/follow",
+                "POST",
+                f"/api/users/{followed_id}/follow",
+                headers=headers,
+            )
+        elif operation == "media":
+            form = aiohttp.FormData()
+            form.add_field("file", self.image, filename="bench.jpeg", content_type="image/jpeg")
+            await self.request(
+                "POST /api/medias", "POST", "/api/medias/", headers=headers, data=form
+            )
+
+    async def run(self, deadline: float) -> None:
+        while time.monotonic() < deadline:
+            await self.step()
+
+
+async def wait_until_ready(base_url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(f"{base_url}/api/healthchecker") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"The app at {base_url} did not become ready in {timeout}s")
+
+
+def start_app(args: argparse.Namespace, stub: YandexDiskStub) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": args.database_url,
+        "YANDEX_DISK_API_URL": stub.api_url,
+        "YANDEX_DISK_TOKEN": "bench",
+    }
+    command = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "app.app:app",
+        "--host",
+        "127.0.0.1",
+        "--port",
+        str(args.port),
+        "--workers",
+        str(args.workers),
+        "--log-level",
+        "warning",
+        "--no-access-log",
+    ]
+    return subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> dict:
+    dataset = generate(
+        n_users=args.users,
+        mean_following=args.mean_following,
+        mean_tweets=args.mean_tweets,
+        mean_likes=args.mean_likes,
+        seed=args.seed,
+    )
+    engine = create_async_engine(args.database_url)
+    await seed(engine, dataset)
+    await engine.dispose()
+
+    stub = YandexDiskStub(port=args.stub_port)
+    await stub.start()
+    app_process = None
+    base_url = args.base_url
+    if base_url is None:
+        base_url = f"http://127.0.0.1:{args.port}"
+        app_process = start_app(args, stub)
+
+    recorder = Recorder()
+    try:
+        await wait_until_ready(base_url)
+        connector = aiohttp.TCPConnector(limit=args.concurrency)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            rnd = random.Random(args.seed)
+            users = [
+                VirtualUser(session, base_url, dataset, recorder, random.Random(rnd.random()))
+                for _ in range(args.concurrency)
+            ]
+            if args.warmup:
+                deadline = time.monotonic() + args.warmup
+                await asyncio.gather(*(user.run(deadline) for user in users))
+
+            recorder.recording = True
+            started = time.monotonic()
+            deadline = started + args.duration
+            await asyncio.gather(*(user.run(deadline) for user in users))
+            elapsed = time.monotonic() - started
+            recorder.recording = False
+    finally:
+        if app_process is not None:
+            app_process.terminate()
+            app_process.wait(timeout=30)
+        await stub.stop()
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "base_url": base_url,
+            "database": args.database_url.split("://")[0],
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "seed": args.seed,
+            "scenario": SCENARIO,
+            "dataset": {
+                "users": len(dataset.users),
+                "follows": len(dataset.follows),
+                "tweets": len(dataset.tweets),
+                "media": len(dataset.media),
+                "likes": len(dataset.likes),
+            },
+        },
+        **recorder.report(elapsed),
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--mean-following", type=int, default=30)
+    parser.add_argument("--mean-tweets", type=int, default=10)
+    parser.add_argument("--mean-likes", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5, help="unmeasured seconds")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--database-url",
+        default=os.getenv("BENCH_DATABASE_URL", DEFAULT_DATABASE_URL),
+        help="database to seed, it is dropped and recreated",
+    )
+    parser.add_argument("--stub-port", type=int, default=0, help="Yandex Disk stub port")
+    parser.add_argument(
+        "--base-url",
+        default=None,
+        help="benchmark an already running app instead of starting one, run it with "
+        "YANDEX_DISK_API_URL=http://127.0.0.1:<stub-port>/v1/disk",
+    )
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(text)
+        bench_logger.info(f"Report written to {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+CPU cost of rendering a page of tweets.
+
+Compares, per request, the Pydantic path (response objects validated again against
+response_model and encoded with the json module) with the FAST_JSON path (plain dicts
+rendered by FastJSONResponse). Only serialization is measured, no database or HTTP.
+
+    python -m benchmarks.serialization --tweets 30 --likes 10 --iterations 2000
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import APIRoute, serialize_response
+
+from app import Author, FastJSONResponse, Like, TweetListResponse, TweetResponse
+from app.app import app
+
+
+def payloads(n_tweets: int, n_likes: int) -> list[dict]:
+    """Tweets in the shape built by app.routes.tweets.tweet_payloads"""
+    return [
+        {
+            "id": tweet_id,
+            "content": f"Benchmark tweet {tweet_id} " * 8,
+            "attachments": [f"https://example.com/bench/{tweet_id}_{n}.jpg" for n in range(2)],
+            "attachment_variants": [
+                {"small": f"https://example.com/bench/{tweet_id}_{n}_small.webp"} for n in range(2)
+            ],
+            "author": {"id": tweet_id % 97, "name": f"bench_user_{tweet_id % 97}"},
+            "likes": [
+                {"user_id": user_id, "name": f"bench_user_{user_id}"} for user_id in range(n_likes)
+            ],
+            "likes_count": n_likes * 40,
+            "liked": tweet_id % 2 == 0,
+        }
+        for tweet_id in range(1, n_tweets + 1)
+    ]
+
+
+def models(tweets: list[dict]) -> TweetListResponse:
+    """The response objects the route used to build before FAST_JSON"""
+    return TweetListResponse(
+        result=True,
+        tweets=[
+            TweetResponse(
+                id=tweet["id"],
+                content=tweet["content"],
+                attachments=tweet["attachments"],
+                attachment_variants=tweet["attachment_variants"],
+                author=Author(**tweet["author"]),
+                likes=[Like(**like) for like in tweet["likes"]],
+                likes_count=tweet["likes_count"],
+                liked=tweet["liked"],
+            )
+            for tweet in tweets
+        ],
+        next_cursor="cursor",
+    )
+
+
+def feed_route() -> APIRoute:
+    return next(
+        route
+        for route in app.routes
+        if isinstance(route, APIRoute) and route.path == "/api/tweets/" and "GET" in route.methods
+    )
+
+
+async def measure(args: argparse.Namespace) -> dict:
+    tweets = payloads(args.tweets, args.likes)
+    field = feed_route().response_field
+
+    async def pydantic_path() -> bytes:
+        # what FastAPI does with a model returned from a route with response_model
+        content = await serialize_response(field=field, response_content=models(tweets))
+        return JSONResponse(content).body
+
+    async def fast_path() -> bytes:
+        return FastJSONResponse({"result": True, "tweets": tweets, "next_cursor": "cursor"}).body
+
+    if json.loads(await pydantic_path()) != json.loads(await fast_path()):
+        raise RuntimeError("The two paths render different documents")
+
+    report = {}
+    for name, render in (("pydantic", pydantic_path), ("fast_json", fast_path)):
+        for _ in range(args.iterations // 10):
+            await render()
+        started = time.process_time()
+        for _ in range(args.iterations):
+            body = await render()
+        elapsed = time.process_time() - started
+        report[name] = {
+            "cpu_us_per_request": round(elapsed / args.iterations * 1e6, 1),
+            "bytes": len(body),
+        }
+    saved = report["pydantic"]["cpu_us_per_request"] - report["fast_json"]["cpu_us_per_request"]
+    return {
+        "meta": {
+            "tweets": args.tweets,
+            "likes_per_tweet": args.likes,
+            "iterations": args.iterations,
+        },
+        **report,
+        "saved_us_per_request": round(saved, 1),
+        "speedup": round(
+            report["pydantic"]["cpu_us_per_request"] / report["fast_json"]["cpu_us_per_request"], 2
+        ),
+    }
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--tweets", type=int, default=30, help="tweets per page")
+    parser.add_argument("--likes", type=int, default=10, help="likers listed per tweet")
+    parser.add_argument("--iterations", type=int, default=2000)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> None:
+    print(json.dumps(asyncio.run(measure(parse_args(argv))), indent=2))
+
+
+if __name__ == "__main__":
+    main()
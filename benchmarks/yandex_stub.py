@@ -0,0 +1,74 @@
+from aiohttp import web
+
+from config.logging_config import logger
+
+bench_logger = logger.bind(name="bench")
+
+
+class YandexDiskStub:
+    """
+    Local stand-in for the parts of the Yandex Disk REST API the app uses
+    (upload link, upload, publish, meta, delete). Uploaded bodies are drained, not kept.
+    Serve it and point YANDEX_DISK_API_URL at `api_url`.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.uploaded_bytes = 0
+        self.requests = 0
+        self._runner: web.AppRunner | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def api_url(self) -> str:
+        return f"{self.base_url}/v1/disk"
+
+    def application(self) -> web.Application:
+        app = web.Application(client_max_size=0)
+        app.router.add_get("/v1/disk/resources/upload", self.upload_link)
+        app.router.add_put("/upload", self.upload)
+        app.router.add_put("/v1/disk/resources/publish", self.publish)
+        app.router.add_get("/v1/disk/resources", self.meta)
+        app.router.add_delete("/v1/disk/resources", self.delete)
+        return app
+
+    async def upload_link(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        href = f"{self.base_url}/upload?path={request.query['path']}"
+        return web.json_response({"href": href, "method": "PUT", "templated": False})
+
+    async def upload(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        async for chunk in request.content.iter_any():
+            self.uploaded_bytes += len(chunk)
+        return web.Response(status=201)
+
+    async def publish(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.json_response({"href": f"{self.api_url}/resources?path=x"})
+
+    async def meta(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        path = request.query["path"]
+        return web.json_response({"path": path, "public_url": f"{self.base_url}/d/{path}"})
+
+    async def delete(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        return web.Response(status=204)
+
+    async def start(self) -> None:
+        self._runner = web.AppRunner(self.application(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        bench_logger.info(f"Yandex Disk stub listening on {self.base_url}")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
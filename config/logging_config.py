@@ -1,65 +1,207 @@
+import json
+import os
+import random
 import sys
+import traceback
+from contextvars import ContextVar
 from pathlib import Path
+from typing import TextIO
 
 from loguru import logger
 
 BASE_DIR = Path(__file__).resolve().parent.parent
-logger.remove()  # delete default logger
-
-# app config
-logger.add(
-    sys.stdout,
-    level="ERROR",
-    format="{time:YYYY-MM-DD HH:mm:ss} - {name} - {line} - {level} - {message}",
-    filter=lambda record: record["extra"].get("name") == "app",
-    enqueue=True,
-)
-
-logger.add(
-    str(BASE_DIR / "logs/app_debug.log"),
-    level="DEBUG",
-    format="{time:YYYY-MM-DD HH:mm:ss} - {name} - {line} - {level} - {message}",
-    rotation="50 MB",
-    retention=5,
-    filter=lambda record: record["extra"].get("name") == "app",
-    enqueue=True,
-)
-
-logger.add(
-    str(BASE_DIR / "logs/app_error.log"),
-    level="ERROR",
-    format="{time:YYYY-MM-DD HH:mm:ss} - {name} - {line} - {level} - {message}",
-    rotation="5 MB",
-    retention=5,
-    filter=lambda record: record["extra"].get("name") == "app",
-    enqueue=True,
-)
-
-# tests config
-logger.add(
-    sys.stdout,
-    level="ERROR",
-    format="{time:YYYY-MM-DD HH:mm:ss} - {name} - {line} - {level} - {message}",
-    filter=lambda record: record["extra"].get("name") == "tests",
-    enqueue=True,
-)
-
-logger.add(
-    str(BASE_DIR / "logs/tests_debug.log"),
-    level="DEBUG",
-    format="{time:YYYY-MM-DD HH:mm:ss} - {name} - {line} - {level} - {message}",
-    rotation="50 MB",
-    retention=5,
-    filter=lambda record: record["extra"].get("name") == "tests",
-    enqueue=True,
-)
-
-logger.add(
-    str(BASE_DIR / "logs/tests_error.log"),
-    level="ERROR",
-    format="{time:YYYY-MM-DD HH:mm:ss} - {name} - {line} - {level} - {message}",
-    rotation="5 MB",
-    retention=5,
-    filter=lambda record: record["extra"].get("name") == "tests",
-    enqueue=True,
-)
+
+# "classic": text sinks per logger name (app / tests / bench), "fast": a single JSON lines sink
+LOG_MODE = os.getenv("LOG_MODE", "classic")
+# fast mode: lowest level written and share of requests whose INFO/DEBUG lines are kept,
+# as "rate" or "rate,METHOD /route=rate,...", e.g. "1,GET /api/tweets/=0.01"
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "1")
+
+CLASSIC_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} - {name} - {line} - {level} - {message}"
+
+# ASGI scope of the request being served (set by LogContextMiddleware)
+current_request: ContextVar[dict | None] = ContextVar("log_request", default=None)
+
+
+def configure_classic(log_dir: Path = BASE_DIR / "logs") -> None:
+    """Stdout, debug and error files for the app and the tests, stderr for the benchmarks"""
+    logger.remove()  # delete default logger
+
+    # app config
+    logger.add(
+        sys.stdout,
+        level="ERROR",
+        format=CLASSIC_FORMAT,
+        filter=lambda record: record["extra"].get("name") == "app",
+        enqueue=True,
+    )
+
+    logger.add(
+        str(log_dir / "app_debug.log"),
+        level="DEBUG",
+        format=CLASSIC_FORMAT,
+        rotation="50 MB",
+        retention=5,
+        filter=lambda record: record["extra"].get("name") == "app",
+        enqueue=True,
+    )
+
+    logger.add(
+        str(log_dir / "app_error.log"),
+        level="ERROR",
+        format=CLASSIC_FORMAT,
+        rotation="5 MB",
+        retention=5,
+        filter=lambda record: record["extra"].get("name") == "app",
+        enqueue=True,
+    )
+
+    # tests config
+    logger.add(
+        sys.stdout,
+        level="ERROR",
+        format=CLASSIC_FORMAT,
+        filter=lambda record: record["extra"].get("name") == "tests",
+        enqueue=True,
+    )
+
+    logger.add(
+        str(log_dir / "tests_debug.log"),
+        level="DEBUG",
+        format=CLASSIC_FORMAT,
+        rotation="50 MB",
+        retention=5,
+        filter=lambda record: record["extra"].get("name") == "tests",
+        enqueue=True,
+    )
+
+    logger.add(
+        str(log_dir / "tests_error.log"),
+        level="ERROR",
+        format=CLASSIC_FORMAT,
+        rotation="5 MB",
+        retention=5,
+        filter=lambda record: record["extra"].get("name") == "tests",
+        enqueue=True,
+    )
+
+    # benchmarks config
+    logger.add(
+        sys.stderr,
+        level="INFO",
+        format=CLASSIC_FORMAT,
+        filter=lambda record: record["extra"].get("name") == "bench",
+        enqueue=True,
+    )
+
+
+def parse_sampling(spec: str) -> tuple[float, dict[str, float]]:
+    """LOG_SAMPLING value as (default rate, {"METHOD /route": rate})"""
+    default, rates = 1.0, {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        route, _, rate = item.rpartition("=")
+        if route:
+            rates[route.strip()] = float(rate)
+        else:
+            default = float(rate)
+    return default, rates
+
+
+class RequestSampler:
+    """
+    Whether the INFO/DEBUG lines of the current request are kept. Decided once per request,
+    on its first such line, by the rate of the matched route. Lines outside of requests
+    (startup, background tasks) are always kept.
+    """
+
+    def __init__(self, default: float = 1.0, rates: dict[str, float] | None = None):
+        self.default = default
+        self.rates = rates or {}
+
+    def sampled(self) -> bool:
+        scope = current_request.get()
+        if scope is None:
+            return True
+        decision = scope.get("log_sampled")
+        if decision is None:
+            route = scope.get("route")
+            if route is None:  # not routed yet
+                return True
+            rate = self.rates.get(f"{scope['method']} {route.path}", self.default)
+            decision = scope["log_sampled"] = rate >= 1 or random.random() < rate
+        return decision
+
+
+class JsonSink:
+    """
+    The only sink of the fast mode: one JSON object per line, routed to a stream by the
+    logger name (the default stream for the others). Warnings and errors are always written.
+    """
+
+    WARNING = logger.level("WARNING").no
+
+    def __init__(self, streams: dict[str, TextIO], default: TextIO, sampler: RequestSampler):
+        self.streams = streams
+        self.default = default
+        self.sampler = sampler
+
+    def filter(self, record) -> bool:
+        return record["level"].no >= self.WARNING or self.sampler.sampled()
+
+    def write(self, message) -> None:
+        record = message.record
+        extra = record["extra"]
+        entry = {
+            "time": record["time"].isoformat(),
+            "level": record["level"].name,
+            "name": extra.get("name"),
+            "module": record["name"],
+            "line": record["line"],
+            "message": record["message"],
+        }
+        if len(extra) > 1:
+            entry.update((key, value) for key, value in extra.items() if key != "name")
+        if record["exception"] is not None:
+            entry["exception"] = "".join(traceback.format_exception(*record["exception"]))
+        stream = self.streams.get(entry["name"], self.default)
+        stream.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+
+
+def message_only(record) -> str:
+    # a callable format keeps loguru from rendering the traceback into the unused text
+    return "{message}"
+
+
+def configure_fast(
+    level: str = LOG_LEVEL,
+    sampling: str = LOG_SAMPLING,
+    streams: dict[str, TextIO] | None = None,
+    default: TextIO | None = None,
+) -> JsonSink:
+    """
+    Single JSON lines sink, written in the calling thread (no queue, no pickling).
+    Records below `level` are dropped by loguru before the message is formatted
+    (pass the values as arguments: logger.info("Tweet {} liked", tweet_id)).
+    """
+    logger.remove()
+    sink = JsonSink(
+        streams if streams is not None else {"app": sys.stdout},
+        default if default is not None else sys.stderr,
+        RequestSampler(*parse_sampling(sampling)),
+    )
+    logger.add(
+        sink.write,
+        level=level,
+        format=message_only,
+        filter=sink.filter,
+        backtrace=False,
+        diagnose=False,
+    )
+    return sink
+
+
+if LOG_MODE == "fast":
+    configure_fast()
+else:
+    configure_classic()
@@ -0,0 +1,88 @@
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+# "IN (?, ?, ?)" / "IN ($1, $2)" / "VALUES (...), (...)" collapse to a single shape
+_PLACEHOLDER_LIST = re.compile(r"\((?:\s*(?:\?|%s|\$\d+|:\w+)\s*,)+\s*(?:\?|%s|\$\d+|:\w+)\s*\)")
+_REPEATED_GROUPS = re.compile(r"(\(\?\))(?:\s*,\s*\(\?\))+")
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Statement text without the parts that vary between executions of the same query"""
+    shape = _PLACEHOLDER_LIST.sub("(?)", statement)
+    shape = _REPEATED_GROUPS.sub(r"\1", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+class QueryStats:
+    """Statements executed inside one request (or `count_queries` block)"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes: Counter[str] = Counter()
+
+    def add(self, statement: str, duration: float) -> None:
+        self.count += 1
+        self.duration += duration
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int) -> dict[str, int]:
+        """Shapes executed at least `threshold` times, the usual sign of an N+1"""
+        return {shape: n for shape, n in self.shapes.items() if n >= threshold}
+
+
+current_query_stats: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryStats]:
+    """Collect the statements executed in the current context"""
+    stats = QueryStats()
+    token = current_query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        current_query_stats.reset(token)
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_query_stats.get() is not None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_query_stats.get()
+    if stats is not None and conn.info.get("query_started"):
+        stats.add(statement, time.perf_counter() - conn.info["query_started"].pop())
+
+
+def handle_error(exception_context):
+    # the statement failed, after_cursor_execute won't run for it
+    conn = exception_context.connection
+    if conn is None or not conn.info.get("query_started"):
+        return
+    started = conn.info["query_started"].pop()
+    stats = current_query_stats.get()
+    if stats is not None and exception_context.statement:
+        stats.add(exception_context.statement, time.perf_counter() - started)
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Record every statement of the engine into the active QueryStats, if any.
+    SQLAlchemy runs the sync events in a greenlet sharing the caller's context.
+    """
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "before_cursor_execute", before_cursor_execute):
+        return
+    event.listen(sync_engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", after_cursor_execute)
+    event.listen(sync_engine, "handle_error", handle_error)
@@ -1,4 +1,11 @@
+import asyncio
 import subprocess
 
 def lint():
-    subprocess.run("black ./app/ && isort ./app/", shell=True, check=True)
\ No newline at end of file
+    subprocess.run("black ./app/ && isort ./app/", shell=True, check=True)
+
+def repair_counters():
+    from app.services import repair_follow_counters
+    from config.config import async_session
+
+    asyncio.run(repair_follow_counters(async_session))
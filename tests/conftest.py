@@ -1,6 +1,20 @@
+import os
+import tempfile
+
+# keep the app's own engine (startup, background jobs) off the real database
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+# media is stored on the local disk, no network needed
+os.environ.setdefault("MEDIA_STORAGE", "local")
+os.environ.setdefault("MEDIA_LOCAL_ROOT", tempfile.mkdtemp(prefix="blog_media_"))
+# X-DB-* headers for query budgets
+os.environ.setdefault("SQL_DEBUG_HEADERS", "true")
+
+import pytest
 import pytest_asyncio
+from app import api_key_cache
 from app.app import app
 from config.config import Base, get_db
+from config.query_stats import instrument_engine
 from fastapi.testclient import TestClient
 from loguru import logger
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
@@ -15,6 +29,7 @@ test_engine = create_async_engine(
     echo=True,
     connect_args={"check_same_thread": False},
 )
+instrument_engine(test_engine)
 
 TestingSessionLocal = sessionmaker(
     bind=test_engine,
@@ -51,6 +66,21 @@ def assert_and_log(function_name: str, condition, error_message: str):
         raise
 
 
+def assert_query_budget(function_name: str, response, max_queries: int):
+    """Checks that the request stayed within max_queries SQL statements without repeats"""
+    queries = int(response.headers["X-DB-Queries"])
+    assert_and_log(
+        function_name=function_name,
+        condition=queries <= max_queries,
+        error_message=f"{queries} SQL statements > budget of {max_queries}",
+    )
+    assert_and_log(
+        function_name=function_name,
+        condition=response.headers["X-DB-Repeated"] == "0",
+        error_message=f"{response.headers['X-DB-Repeated']} repeated SQL statements",
+    )
+
+
 @pytest_asyncio.fixture(scope="function")
 async def db_session():
     """Fixture for creating and deleting tables in front of each test."""
@@ -135,6 +165,42 @@ def test_client(db_session):
             yield session
 
     app.dependency_overrides[get_db] = override_get_db
+    api_key_cache.clear()
 
     with TestClient(app) as client:
         yield client
+
+
+@pytest.fixture(scope="function")
+def memory_timeline():
+    """Fixture for switching feeds to a small in-memory timeline store."""
+    from app.services.timeline import MemoryTimelineStore, get_timeline_store, set_timeline_store
+
+    previous_store = get_timeline_store()
+    store = MemoryTimelineStore(max_length=3)
+    set_timeline_store(store)
+    yield store
+    set_timeline_store(previous_store)
+
+
+@pytest.fixture(scope="function")
+def local_storage(tmp_path):
+    """Fixture for storing media in an empty temporary directory."""
+    from app.services.storage import LocalMediaStorage, get_media_storage, set_media_storage
+
+    previous_storage = get_media_storage()
+    storage = LocalMediaStorage(tmp_path)
+    set_media_storage(storage)
+    yield storage
+    set_media_storage(previous_storage)
+
+
+@pytest.fixture(scope="function")
+def ingest_queue(test_client, tmp_path_factory, monkeypatch):
+    """Fixture for ingesting media asynchronously into the test database."""
+    from app.services.ingest import media_ingest_queue
+
+    monkeypatch.setattr("app.routes.medias.MEDIA_ASYNC_INGESTION", True)
+    monkeypatch.setattr(media_ingest_queue, "session_factory", TestingSessionLocal)
+    monkeypatch.setattr(media_ingest_queue, "staging_dir", tmp_path_factory.mktemp("ingest"))
+    yield media_ingest_queue
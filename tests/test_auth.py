@@ -0,0 +1,94 @@
+import pytest
+from sqlalchemy import select
+
+from app import api_key_cache
+from app.models import User, hash_api_key
+from app.services.last_seen import LastSeenBuffer
+from config.logging_config import logger
+
+from .conftest import TestingSessionLocal, assert_and_log, test_data
+
+tests_logger = logger.bind(name="tests")
+
+old_user = test_data["users"]["created"]
+
+
+@pytest.mark.asyncio
+async def test_api_key_stored_hashed(added_test_user, db_session):
+    """Only the digest of the api_key reaches the database"""
+    tests_logger.debug("test_api_key_stored_hashed()")
+
+    raw_key = old_user["headers"]["api_key"]
+    result = await db_session.execute(select(User.api_key).where(User.id == added_test_user.id))
+    stored_key = result.scalar()
+
+    assert_and_log(
+        function_name="test_api_key_stored_hashed",
+        condition=stored_key == hash_api_key(raw_key) and stored_key != raw_key,
+        error_message=f"{stored_key} is not the digest of {raw_key}",
+    )
+
+
+def test_api_key_cache(added_test_user, test_client):
+    """Authenticated keys are cached and dropped when the key is replaced"""
+    tests_logger.debug("test_api_key_cache()")
+
+    key_hash = hash_api_key(old_user["headers"]["api_key"])
+    response = test_client.get("/api/users/me", headers=old_user["headers"])
+    assert_and_log(
+        function_name="test_api_key_cache",
+        condition=response.status_code == 200,
+        error_message=f"{response.status_code} != 200",
+    )
+    assert_and_log(
+        function_name="test_api_key_cache",
+        condition=api_key_cache.get(key_hash) == added_test_user.id,
+        error_message=f"{api_key_cache.get(key_hash)} != {added_test_user.id}",
+    )
+
+    # invalid keys are never cached
+    test_client.get("/api/users/me", headers={"api_key": "Who I am"})
+    assert_and_log(
+        function_name="test_api_key_cache",
+        condition=api_key_cache.get(hash_api_key("Who I am")) is None,
+        error_message="Invalid api_key was cached",
+    )
+
+    # replacing the key invalidates the cached identity
+    added_test_user.api_key = "new key"
+    assert_and_log(
+        function_name="test_api_key_cache",
+        condition=api_key_cache.get(key_hash) is None,
+        error_message="Replaced api_key is still cached",
+    )
+
+
+@pytest.mark.asyncio
+async def test_last_seen_buffer(added_test_user, db_session):
+    """last_seen is recorded once per resolution window and written in one flush"""
+    tests_logger.debug("test_last_seen_buffer()")
+
+    buffer = LastSeenBuffer(resolution=60, interval=60)
+    for _ in range(3):
+        buffer.touch(added_test_user.id)
+    buffer.touch(47)  # missing users don't break the bulk update
+    assert_and_log(
+        function_name="test_last_seen_buffer",
+        condition=len(buffer) == 2,
+        error_message=f"{len(buffer)} != 2",
+    )
+
+    flushed = await buffer.flush(TestingSessionLocal)
+    assert_and_log(
+        function_name="test_last_seen_buffer",
+        condition=flushed == 2 and len(buffer) == 0,
+        error_message=f"flushed {flushed}, pending {len(buffer)}",
+    )
+
+    # touched again inside the resolution window: nothing to write
+    buffer.touch(added_test_user.id)
+    assert_and_log(
+        function_name="test_last_seen_buffer",
+        condition=len(buffer) == 0,
+        error_message=f"{len(buffer)} != 0",
+    )
@@ -0,0 +1,116 @@
+import io
+from collections import Counter
+from statistics import median
+
+import pytest
+from benchmarks import logging_overhead
+from benchmarks.dataset import generate
+from benchmarks.run import percentile
+from benchmarks.serialization import measure, parse_args
+from benchmarks.yandex_stub import YandexDiskStub
+from fastapi import UploadFile
+
+from app.services.http_client import close_http_session
+from app.services.metrics import yandex_request_duration_seconds
+from app.services.yandex import get_file_shareable_link, upload_file_to_disk
+from config.logging_config import logger
+
+from .conftest import assert_and_log
+
+tests_logger = logger.bind(name="tests")
+
+
+def test_generate_dataset():
+    """Synthetic graph: skewed follower counts, tweet ids growing with time, consistent likes"""
+    tests_logger.debug("test_generate_dataset()")
+
+    dataset = generate(n_users=500, seed=1)
+    follower_counts = Counter(follow["followed_id"] for follow in dataset.follows)
+    counts = [follower_counts.get(user["id"], 0) for user in dataset.users]
+    assert_and_log(
+        function_name="test_generate_dataset",
+        condition=max(counts) > 10 * max(median(counts), 1),
+        error_message=f"follower counts are not skewed: max={max(counts)} median={median(counts)}",
+    )
+    assert_and_log(
+        function_name="test_generate_dataset",
+        condition=counts == [user["followers_count"] for user in dataset.users],
+        error_message="followers_count doesn't match follows",
+    )
+
+    timestamps = [tweet["timestamp"] for tweet in dataset.tweets]
+    assert_and_log(
+        function_name="test_generate_dataset",
+        condition=timestamps == sorted(timestamps),
+        error_message="tweet ids don't follow time",
+    )
+
+    likes_counts = Counter(like["tweet_id"] for like in dataset.likes)
+    assert_and_log(
+        function_name="test_generate_dataset",
+        condition=all(t["likes_count"] == likes_counts.get(t["id"], 0) for t in dataset.tweets),
+        error_message="likes_count doesn't match likes",
+    )
+    assert_and_log(
+        function_name="test_generate_dataset",
+        condition=percentile([1, 2, 3, 4], 50) == 2 and percentile([1, 2, 3, 4], 99) == 4,
+        error_message="wrong percentiles",
+    )
+
+
+@pytest.mark.asyncio
+async def test_yandex_stub(monkeypatch):
+    """Upload and publication against the local Ya.disk stand-in"""
+    tests_logger.debug("test_yandex_stub()")
+
+    stub = YandexDiskStub()
+    await stub.start()
+    monkeypatch.setattr("app.services.yandex.YANDEX_DISK_API_URL", stub.api_url)
+    try:
+        file = UploadFile(file=io.BytesIO(b"x" * 1000), filename="stub.jpg", size=1000)
+        uploaded = await upload_file_to_disk(file, "stub.jpg", "disk:/App", "token")
+        public_url = await get_file_shareable_link("disk:/App/stub.jpg", "token")
+    finally:
+        await close_http_session()
+        await stub.stop()
+
+    assert_and_log(
+        function_name="test_yandex_stub",
+        condition=uploaded and stub.uploaded_bytes == 1000 and public_url is not None,
+        error_message=f"upload={uploaded} bytes={stub.uploaded_bytes} public_url={public_url}",
+    )
+    assert_and_log(
+        function_name="test_yandex_stub",
+        condition=yandex_request_duration_seconds.count("PUT", "upload") >= 1
+        and yandex_request_duration_seconds.count("GET", "/resources/upload") >= 1,
+        error_message="Ya.disk calls are not timed",
+    )
+
+
+@pytest.mark.asyncio
+async def test_serialization_benchmark():
+    """Both response paths render the same document (the timings are only reported)"""
+    tests_logger.debug("test_serialization_benchmark()")
+
+    report = await measure(parse_args(["--tweets", "30", "--iterations", "50"]))
+    assert_and_log(
+        function_name="test_serialization_benchmark",
+        condition=report["pydantic"]["bytes"] == report["fast_json"]["bytes"],
+        error_message=f"{report}",
+    )
+
+
+def test_logging_benchmark():
+    """Fast mode drops the DEBUG line and samples the route, the classic one writes them all"""
+    tests_logger.debug("test_logging_benchmark()")
+
+    report = logging_overhead.measure(
+        logging_overhead.parse_args(["--requests", "200", "--sample-rate", "0.1"])
+    )
+    assert_and_log(
+        function_name="test_logging_benchmark",
+        condition=report["classic"]["lines"] >= 600
+        and report["fast"]["lines"] == 400
+        and report["fast_sampled"]["lines"] < 200,
+        error_message=f"{report}",
+    )
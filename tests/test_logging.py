@@ -0,0 +1,67 @@
+import io
+import json
+
+from config.logging_config import configure_classic, configure_fast, current_request, logger
+
+from .conftest import assert_and_log
+
+tests_logger = logger.bind(name="tests")
+
+
+class Route:
+    def __init__(self, path: str):
+        self.path = path
+
+
+def test_fast_logging():
+    """One JSON line per kept record, routed by logger name, sampled per request by route"""
+    tests_logger.debug("test_fast_logging()")
+
+    app_stream, other_stream = io.StringIO(), io.StringIO()
+    try:
+        configure_fast(
+            "INFO", "1,GET /api/tweets/=0", streams={"app": app_stream}, default=other_stream
+        )
+        app_logger = logger.bind(name="app")
+        app_logger.debug("Dropped by level {}", 1)
+        app_logger.info("Tweet {} liked", 7)
+        logger.bind(name="yandex").info("Uploaded")
+
+        token = current_request.set({"method": "GET", "route": Route("/api/tweets/")})
+        try:
+            app_logger.info("Sampled out")
+            try:
+                raise ValueError("boom")
+            except ValueError:
+                app_logger.exception("Kept")
+        finally:
+            current_request.reset(token)
+
+        token = current_request.set({"method": "GET", "route": Route("/api/users/me")})
+        try:
+            app_logger.info("Other route")
+        finally:
+            current_request.reset(token)
+    finally:
+        configure_classic()
+
+    app_lines = [json.loads(line) for line in app_stream.getvalue().splitlines()]
+    other_lines = [json.loads(line) for line in other_stream.getvalue().splitlines()]
+    assert_and_log(
+        function_name="test_fast_logging",
+        condition=[line["message"] for line in app_lines]
+        == ["Tweet 7 liked", "Kept", "Other route"],
+        error_message=f"unexpected app lines {app_lines}",
+    )
+    assert_and_log(
+        function_name="test_fast_logging",
+        condition="ValueError: boom" in app_lines[1].get("exception", "")
+        and app_lines[1]["level"] == "ERROR",
+        error_message=f"exception not logged {app_lines[1]}",
+    )
+    assert_and_log(
+        function_name="test_fast_logging",
+        condition=[(line["name"], line["message"]) for line in other_lines]
+        == [("yandex", "Uploaded")],
+        error_message=f"unexpected default stream lines {other_lines}",
+    )
@@ -1,5 +1,28 @@
+import asyncio
+import io
 import os
 
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from fastapi import FastAPI, HTTPException, Request, UploadFile
+from fastapi.testclient import TestClient
+from PIL import Image
+
+from app.middlewares import BODY_TOO_LARGE_DETAIL, BodySizeLimitMiddleware
+from app.models import MEDIA_PENDING, Media
+from app.services.http_client import close_http_session, get_http_session, get_sync_session
+from app.services.images import (
+    ORIGINAL_IMAGE,
+    close_image_pool,
+    process_image,
+    process_upload,
+    variant_file_name,
+)
+from app.services.ingest import store_upload
+from app.services.utils import read_in_chunks
+from app.services.yandex import celery_task_delete_media_batch, delete_many_from_yadisk
+from config.config import MEDIA_MAX_SIZE
 from config.logging_config import logger
 
 from .conftest import assert_and_log, test_data
@@ -44,3 +67,664 @@ def test_media_load(added_test_user, test_client):
             condition="result" in response_data and "media_id" in response_data,
             error_message="`result` and `media_id` not in response_data",
         )
+
+
+def test_media_too_large(added_test_user, test_client, monkeypatch):
+    """Test that an oversized file is rejected before it is sent to Ya.disk"""
+    tests_logger.debug("test_media_too_large()")
+
+    monkeypatch.setattr("app.routes.medias.MEDIA_MAX_SIZE", 16)
+    response = test_client.post(
+        "/api/medias",
+        headers=old_user["headers"],
+        files={"file": ("test_image.jpg", b"x" * 17, "image/jpeg")},
+    )
+
+    assert_and_log(
+        function_name="test_media_too_large",
+        condition=response.status_code == 413,
+        error_message=f"{response.status_code} != 413",
+    )
+
+
+def test_body_size_limit():
+    """Test that bodies over the limit are rejected by Content-Length and while streaming"""
+    tests_logger.debug("test_body_size_limit()")
+
+    limited = FastAPI()
+    limited.add_middleware(BodySizeLimitMiddleware, max_size=16)
+
+    @limited.post("/upload")
+    async def upload(request: Request):
+        return len(await request.body())
+
+    with TestClient(limited) as client:
+        fits = client.post("/upload", content=b"x" * 16)
+        declared = client.post("/upload", content=b"x" * 17)
+        streamed = client.post("/upload", content=iter([b"x" * 10, b"x" * 10]))
+
+    assert_and_log(
+        function_name="test_body_size_limit",
+        condition=fits.status_code == 200 and fits.json() == 16,
+        error_message=f"{fits.status_code} {fits.text}",
+    )
+    assert_and_log(
+        function_name="test_body_size_limit",
+        condition=declared.status_code == 413 and streamed.status_code == 413,
+        error_message=f"{declared.status_code}, {streamed.status_code} != 413",
+    )
+    assert_and_log(
+        function_name="test_body_size_limit",
+        condition="content-length" not in streamed.request.headers
+        and streamed.json() == {"detail": BODY_TOO_LARGE_DETAIL},
+        error_message=f"unexpected streamed request or response {streamed.text}",
+    )
+
+
+def test_body_size_limit_cors(test_client):
+    """Test that the 413 of an oversized upload carries the CORS headers"""
+    tests_logger.debug("test_body_size_limit_cors()")
+
+    response = test_client.post(
+        "/api/medias",
+        headers={**old_user["headers"], "Origin": "http://localhost:3000"},
+        files={"file": ("test_image.jpg", b"x" * (MEDIA_MAX_SIZE + 128 * 1024), "image/jpeg")},
+    )
+    assert_and_log(
+        function_name="test_body_size_limit_cors",
+        condition=response.status_code == 413
+        and response.headers.get("access-control-allow-origin") == "http://localhost:3000",
+        error_message=f"{response.status_code}, {dict(response.headers)}",
+    )
+
+
+@pytest.mark.asyncio
+async def test_read_in_chunks_limit():
+    """Test that a file is read in chunks and fails as soon as it exceeds max_size"""
+    tests_logger.debug("test_read_in_chunks_limit()")
+
+    file = UploadFile(file=io.BytesIO(b"x" * 25), filename=img)
+    chunks = [chunk async for chunk in read_in_chunks(file, chunk_size=10, max_size=25)]
+    assert_and_log(
+        function_name="test_read_in_chunks_limit",
+        condition=[len(chunk) for chunk in chunks] == [10, 10, 5],
+        error_message=f"unexpected chunks {[len(chunk) for chunk in chunks]}",
+    )
+
+    await file.seek(0)
+    chunks = []
+    with pytest.raises(HTTPException) as error:
+        async for chunk in read_in_chunks(file, chunk_size=10, max_size=24):
+            chunks.append(chunk)
+    assert_and_log(
+        function_name="test_read_in_chunks_limit",
+        condition=error.value.status_code == 413 and len(chunks) == 2,
+        error_message=f"{error.value.status_code}, {len(chunks)} chunks read",
+    )
+
+
+@pytest.mark.asyncio
+async def test_http_session_shared():
+    """Test that Yandex Disk calls share one pooled session until it is closed"""
+    tests_logger.debug("test_http_session_shared()")
+
+    session = get_http_session()
+    assert_and_log(
+        function_name="test_http_session_shared",
+        condition=get_http_session() is session and get_sync_session() is get_sync_session(),
+        error_message="session is not reused",
+    )
+
+    await close_http_session()
+    assert_and_log(
+        function_name="test_http_session_shared",
+        condition=session.closed and get_http_session() is not session,
+        error_message="session is not recreated after close",
+    )
+    await close_http_session()
+
+
+@pytest.mark.asyncio
+async def test_delete_many_from_yadisk(monkeypatch):
+    """Test batch deletion against a local stub of the Ya.disk API"""
+    tests_logger.debug("test_delete_many_from_yadisk()")
+
+    statuses = {"/a.jpg": 204, "/b.jpg": 404, "/c.jpg": 503, "/d.jpg": 403}
+    requested = []
+
+    async def delete_resource(request):
+        requested.append(request.query["path"])
+        return web.Response(status=statuses[request.query["path"]])
+
+    stub = web.Application()
+    stub.router.add_delete("/v1/disk/resources", delete_resource)
+    async with TestServer(stub) as server:
+        monkeypatch.setattr(
+            "app.services.yandex.YANDEX_DISK_API_URL", str(server.make_url("/v1/disk"))
+        )
+        outcomes = await delete_many_from_yadisk("token", [*statuses, "/a.jpg"], concurrency=2)
+    await close_http_session()
+
+    assert_and_log(
+        function_name="test_delete_many_from_yadisk",
+        condition=outcomes
+        == {"/a.jpg": "deleted", "/b.jpg": "missing", "/c.jpg": "retry", "/d.jpg": "failed"},
+        error_message=f"unexpected outcomes {outcomes}",
+    )
+    assert_and_log(
+        function_name="test_delete_many_from_yadisk",
+        condition=sorted(requested) == sorted(statuses),
+        error_message=f"unexpected requests {requested}",
+    )
+
+
+def test_delete_media_batch_retries(monkeypatch):
+    """Test that the batch deletion task reports the outcomes of every attempt"""
+    tests_logger.debug("test_delete_media_batch_retries()")
+
+    attempts = [
+        {"/a.jpg": "deleted", "/b.jpg": "retry", "/c.jpg": "retry"},
+        {"/b.jpg": "deleted", "/c.jpg": "retry"},
+    ]
+    requested = []
+
+    async def delete_many_from_yadisk(ya_token, file_disk_paths, concurrency=1):
+        requested.append(file_disk_paths)
+        return attempts.pop(0) if attempts else {"/c.jpg": "retry"}
+
+    monkeypatch.setattr("app.services.yandex.delete_many_from_yadisk", delete_many_from_yadisk)
+    result = celery_task_delete_media_batch.apply(args=[["/a.jpg", "/b.jpg", "/c.jpg"]]).get()
+    assert_and_log(
+        function_name="test_delete_media_batch_retries",
+        condition=result
+        == {
+            "status": "partial",
+            "results": {"/a.jpg": "deleted", "/b.jpg": "deleted", "/c.jpg": "retry"},
+        }
+        and requested[1:] == [["/b.jpg", "/c.jpg"], ["/c.jpg"], ["/c.jpg"]],
+        error_message=f"unexpected result {result} after {len(requested)} attempts",
+    )
+
+
+def test_process_image(tmp_path):
+    """Test that an image is re-encoded without metadata, upright and never upscaled"""
+    tests_logger.debug("test_process_image()")
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # stored rotated 90 degrees
+    exif[0x010F] = "Camera"
+    Image.new("RGB", (800, 600)).save(tmp_path / img, format="JPEG", exif=exif)
+
+    encoded = process_image(str(tmp_path / img), 640, {"small": 100, "large": 2000}, "WEBP", 80)
+    sizes = {name: Image.open(io.BytesIO(data)).size for name, data in encoded.items()}
+    assert_and_log(
+        function_name="test_process_image",
+        condition=sizes == {ORIGINAL_IMAGE: (480, 640), "small": (75, 100)},
+        error_message=f"unexpected sizes {sizes}",
+    )
+    assert_and_log(
+        function_name="test_process_image",
+        condition=not Image.open(io.BytesIO(encoded[ORIGINAL_IMAGE])).getexif(),
+        error_message="metadata is kept",
+    )
+
+
+@pytest.mark.asyncio
+async def test_process_upload():
+    """Test that an upload is encoded in the image pool with its variants"""
+    tests_logger.debug("test_process_upload()")
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (1600, 1200)).save(buffer, format="JPEG")
+    buffer.seek(0)
+    file = UploadFile(file=buffer, filename=img, size=len(buffer.getvalue()))
+    try:
+        encoded = await process_upload(file)
+    finally:
+        close_image_pool()
+    sizes = {name: Image.open(io.BytesIO(data)).size for name, data in (encoded or {}).items()}
+    assert_and_log(
+        function_name="test_process_upload",
+        condition=sizes
+        == {ORIGINAL_IMAGE: (1600, 1200), "small": (320, 240), "medium": (1024, 768)},
+        error_message=f"unexpected sizes {sizes}",
+    )
+
+
+@pytest.mark.asyncio
+async def test_store_upload_failed_variant(local_storage, monkeypatch):
+    """Test that the stored variants are discarded when another one fails to upload"""
+    tests_logger.debug("test_store_upload_failed_variant()")
+
+    upload = local_storage.upload
+
+    async def fail_medium(file, file_name):
+        return "_medium" not in file_name and await upload(file, file_name)
+
+    monkeypatch.setattr(local_storage, "upload", fail_medium)
+    buffer = io.BytesIO()
+    Image.new("RGB", (1600, 1200)).save(buffer, format="JPEG")
+    buffer.seek(0)
+    file = UploadFile(file=buffer, filename=img, size=len(buffer.getvalue()))
+    try:
+        with pytest.raises(Exception, match="Failed to get direct link"):
+            await store_upload(file, img, content_hash=None)
+    finally:
+        close_image_pool()
+    left = sorted(path.name for path in local_storage.root.iterdir())
+    assert_and_log(
+        function_name="test_store_upload_failed_variant",
+        condition=left == [],
+        error_message=f"files left in storage {left}",
+    )
+
+
+@pytest.mark.asyncio
+async def test_process_upload_disabled(monkeypatch):
+    """Test that uploads are stored as sent when image processing is off"""
+    tests_logger.debug("test_process_upload_disabled()")
+
+    monkeypatch.setattr("app.services.images.IMAGE_PROCESSING", False)
+    file = UploadFile(file=io.BytesIO(b"image"), filename="img.jpeg")
+    assert_and_log(
+        function_name="test_process_upload_disabled",
+        condition=await process_upload(file) is None,
+        error_message="the upload is processed",
+    )
+    assert_and_log(
+        function_name="test_process_upload_disabled",
+        condition=variant_file_name("abc_img.jpeg", "small") == "abc_img_small.webp"
+        and variant_file_name("abc_img.jpeg", ORIGINAL_IMAGE) == "abc_img.webp",
+        error_message="unexpected variant file names",
+    )
+
+
+def test_media_variants(added_test_user, test_client, local_storage):
+    """Test that tweets list the links of the smaller sizes of their images"""
+    tests_logger.debug("test_media_variants()")
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (1600, 1200)).save(buffer, format="JPEG")
+    media = test_client.post(
+        "/api/medias",
+        headers=old_user["headers"],
+        files={"file": (img, buffer.getvalue(), "image/jpeg")},
+    ).json()
+    tweet_id = test_client.post(
+        "/api/tweets",
+        headers=old_user["headers"],
+        json={"tweet_data": "", "media_ids": [media["media_id"]]},
+    ).json()["tweet_id"]
+    tweet = test_client.get(f"/api/tweets/{tweet_id}", headers=old_user["headers"]).json()
+
+    variants = tweet["attachment_variants"]
+    assert_and_log(
+        function_name="test_media_variants",
+        condition=len(variants) == 1 and sorted(variants[0]) == ["medium", "small"],
+        error_message=f"unexpected variants {variants}",
+    )
+    small = Image.open(io.BytesIO(test_client.get(variants[0]["small"]).content))
+    assert_and_log(
+        function_name="test_media_variants",
+        condition=small.size == (320, 240),
+        error_message=f"unexpected small size {small.size}",
+    )
+
+
+def test_media_dedup(added_test_user, test_client, local_storage, monkeypatch):
+    """Test that the same content is stored once and deleted with its last reference"""
+    tests_logger.debug("test_media_dedup()")
+
+    monkeypatch.setattr("app.services.images.IMAGE_PROCESSING", False)
+
+    tweet_ids = []
+    for content in (b"meme", b"meme", b"other"):
+        media = test_client.post(
+            "/api/medias",
+            headers=old_user["headers"],
+            files={"file": ("meme.jpg", content, "image/jpeg")},
+        ).json()
+        tweet = test_client.post(
+            "/api/tweets",
+            headers=old_user["headers"],
+            json={"tweet_data": "", "media_ids": [media["media_id"]]},
+        ).json()
+        tweet_ids.append(tweet["tweet_id"])
+
+    stored = sorted(path.read_bytes() for path in local_storage.root.iterdir())
+    assert_and_log(
+        function_name="test_media_dedup",
+        condition=stored == [b"meme", b"other"],
+        error_message=f"unexpected stored files {stored}",
+    )
+
+    test_client.delete(f"/api/tweets/{tweet_ids[0]}", headers=old_user["headers"])
+    stored = sorted(path.read_bytes() for path in local_storage.root.iterdir())
+    assert_and_log(
+        function_name="test_media_dedup",
+        condition=stored == [b"meme", b"other"],
+        error_message=f"a shared file is deleted: {stored}",
+    )
+
+    test_client.delete(f"/api/tweets/{tweet_ids[1]}", headers=old_user["headers"])
+    test_client.delete(f"/api/tweets/{tweet_ids[2]}", headers=old_user["headers"])
+    assert_and_log(
+        function_name="test_media_dedup",
+        condition=not any(local_storage.root.iterdir()),
+        error_message="files are left after their last reference",
+    )
+
+
+def test_local_media_file(added_test_user, test_client, local_storage, monkeypatch):
+    """Test that a locally stored media file is served by its link, with Range support"""
+    tests_logger.debug("test_local_media_file()")
+
+    monkeypatch.setattr("app.services.images.IMAGE_PROCESSING", False)
+    content = bytes(range(256)) * 4
+    media = test_client.post(
+        "/api/medias",
+        headers=old_user["headers"],
+        files={"file": ("photo.jpg", content, "image/jpeg")},
+    ).json()
+    tweet_id = test_client.post(
+        "/api/tweets",
+        headers=old_user["headers"],
+        json={"tweet_data": "", "media_ids": [media["media_id"]]},
+    ).json()["tweet_id"]
+    link = test_client.get(f"/api/tweets/{tweet_id}", headers=old_user["headers"]).json()[
+        "attachments"
+    ][0]
+
+    response = test_client.get(link)
+    assert_and_log(
+        function_name="test_local_media_file",
+        condition=response.status_code == 200 and response.content == content,
+        error_message=f"{response.status_code}, {len(response.content)} bytes",
+    )
+
+    response = test_client.get(link, headers={"Range": "bytes=100-199"})
+    assert_and_log(
+        function_name="test_local_media_file",
+        condition=response.status_code == 206 and response.content == content[100:200],
+        error_message=f"{response.status_code}, {len(response.content)} bytes",
+    )
+
+    for file_name in ("missing.jpg", "..%2Fsecret"):
+        response = test_client.get(f"/api/medias/files/{file_name}")
+        assert_and_log(
+            function_name="test_local_media_file",
+            condition=response.status_code == 404,
+            error_message=f"{file_name}: {response.status_code} != 404",
+        )
+
+
+def test_media_async_ingestion(
+    added_test_user, test_client, local_storage, ingest_queue, monkeypatch
+):
+    """Test that an accepted upload is pending, attachable, and shown once stored"""
+    tests_logger.debug("test_media_async_ingestion()")
+
+    monkeypatch.setattr("app.services.images.IMAGE_PROCESSING", False)
+    queued = []
+    monkeypatch.setattr(ingest_queue, "enqueue", lambda *job: queued.append(job))
+
+    media = test_client.post(
+        "/api/medias",
+        headers=old_user["headers"],
+        files={"file": ("photo.jpg", b"photo", "image/jpeg")},
+    ).json()
+    assert_and_log(
+        function_name="test_media_async_ingestion",
+        condition=media["status"] == "pending" and len(queued) == 1,
+        error_message=f"unexpected response {media}, queued {queued}",
+    )
+
+    tweet_id = test_client.post(
+        "/api/tweets",
+        headers=old_user["headers"],
+        json={"tweet_data": "", "media_ids": [media["media_id"]]},
+    ).json()["tweet_id"]
+    pending_tweet = test_client.get(f"/api/tweets/{tweet_id}", headers=old_user["headers"])
+    assert_and_log(
+        function_name="test_media_async_ingestion",
+        condition=pending_tweet.json()["attachments"] == [],
+        error_message="a pending media is listed",
+    )
+
+    status = test_client.portal.call(ingest_queue.ingest, *queued[0])
+    media_status = test_client.get(
+        f"/api/medias/{media['media_id']}", headers=old_user["headers"]
+    ).json()
+    tweet = test_client.get(f"/api/tweets/{tweet_id}", headers=old_user["headers"])
+    assert_and_log(
+        function_name="test_media_async_ingestion",
+        condition=status == media_status["status"] == "ready"
+        and tweet.json()["attachments"] == [media_status["link"]]
+        and tweet.headers["ETag"] != pending_tweet.headers["ETag"],
+        error_message=f"unexpected state {media_status}, {tweet.json()}",
+    )
+    assert_and_log(
+        function_name="test_media_async_ingestion",
+        condition=test_client.get(media_status["link"]).content == b"photo"
+        and not any(ingest_queue.staging_dir.iterdir()),
+        error_message="the file is not stored or its staged copy is left",
+    )
+
+
+def test_media_ingest_recover(added_test_user, test_client, ingest_queue, monkeypatch):
+    """Test that only the pending media staged on this node are queued again"""
+    tests_logger.debug("test_media_ingest_recover()")
+
+    queued = []
+    monkeypatch.setattr(ingest_queue, "enqueue", lambda *job: queued.append(job))
+
+    async def add_pending() -> list[int]:
+        async with ingest_queue.session_factory() as session:
+            media = [
+                Media(file_name=name, status=MEDIA_PENDING) for name in ("here.jpg", "there.jpg")
+            ]
+            session.add_all(media)
+            await session.commit()
+            return [item.id for item in media]
+
+    here_id, _ = test_client.portal.call(add_pending)
+    ingest_queue.staged_path("here.jpg").write_bytes(b"photo")
+    recovered = test_client.portal.call(ingest_queue.recover)
+    assert_and_log(
+        function_name="test_media_ingest_recover",
+        condition=recovered == [here_id] and queued == [(here_id, "here.jpg")],
+        error_message=f"recovered {recovered}, queued {queued}",
+    )
+
+
+def test_media_async_ingestion_failed(
+    added_test_user, test_client, local_storage, ingest_queue, monkeypatch
+):
+    """Test that a media that could not be stored is reported and can't be attached"""
+    tests_logger.debug("test_media_async_ingestion_failed()")
+
+    async def upload(file, file_name):
+        return False
+
+    monkeypatch.setattr("app.services.images.IMAGE_PROCESSING", False)
+    monkeypatch.setattr(local_storage, "upload", upload)
+
+    media_id = test_client.post(
+        "/api/medias",
+        headers=old_user["headers"],
+        files={"file": ("photo.jpg", b"photo", "image/jpeg")},
+    ).json()["media_id"]
+    test_client.portal.call(ingest_queue.join)
+
+    response = test_client.get(f"/api/medias/{media_id}", headers=old_user["headers"])
+    assert_and_log(
+        function_name="test_media_async_ingestion_failed",
+        condition=response.json()["status"] == "failed",
+        error_message=f"unexpected status {response.json()}",
+    )
+
+    response = test_client.post(
+        "/api/tweets",
+        headers=old_user["headers"],
+        json={"tweet_data": "", "media_ids": [media_id]},
+    )
+    assert_and_log(
+        function_name="test_media_async_ingestion_failed",
+        condition=response.status_code == 400,
+        error_message=f"{response.status_code} != 400",
+    )
+
+    response = test_client.get("/api/medias/100", headers=old_user["headers"])
+    assert_and_log(
+        function_name="test_media_async_ingestion_failed",
+        condition=response.status_code == 404,
+        error_message=f"{response.status_code} != 404",
+    )
+
+
+def test_media_batch(added_test_user, test_client, local_storage, monkeypatch):
+    """Test a batch upload: ids in order, bounded concurrency, all or nothing"""
+    tests_logger.debug("test_media_batch()")
+
+    monkeypatch.setattr("app.services.images.IMAGE_PROCESSING", False)
+    monkeypatch.setattr("app.routes.medias.MEDIA_BATCH_CONCURRENCY", 2)
+    monkeypatch.setattr("app.routes.medias.MEDIA_BATCH_MAX_FILES", 5)
+    uploading, peak = 0, 0
+    upload = local_storage.upload
+
+    async def tracked_upload(file, file_name):
+        nonlocal uploading, peak
+        uploading += 1
+        peak = max(peak, uploading)
+        await asyncio.sleep(0.01)
+        uploading -= 1
+        return await upload(file, file_name)
+
+    monkeypatch.setattr(local_storage, "upload", tracked_upload)
+
+    def post(*contents):
+        return test_client.post(
+            "/api/medias/batch",
+            headers=old_user["headers"],
+            files=[
+                ("files", (f"{n}.jpg", content, "image/jpeg"))
+                for n, content in enumerate(contents)
+            ],
+        )
+
+    first = test_client.post(
+        "/api/medias", headers=old_user["headers"], files={"file": ("a.jpg", b"a", "image/jpeg")}
+    ).json()
+    response = post(b"a", b"b", b"c", b"d", b"e")
+    media = response.json()
+    stored = sorted(path.read_bytes() for path in local_storage.root.iterdir())
+    assert_and_log(
+        function_name="test_media_batch",
+        condition=response.status_code == 201
+        and media["media_ids"] == [first["media_id"] + n for n in range(1, 6)]
+        and stored == [b"a", b"b", b"c", b"d", b"e"],
+        error_message=f"unexpected response {media}, stored {stored}",
+    )
+    assert_and_log(
+        function_name="test_media_batch",
+        condition=peak == 2,
+        error_message=f"{peak} uploads at once",
+    )
+
+    response = post(*(b"x" for _ in range(6)))
+    assert_and_log(
+        function_name="test_media_batch",
+        condition=response.status_code == 400,
+        error_message=f"{response.status_code} != 400",
+    )
+
+    async def failing_upload(file, file_name):
+        if file_name.endswith("_1.jpg"):
+            return False
+        return await upload(file, file_name)
+
+    monkeypatch.setattr(local_storage, "upload", failing_upload)
+    response = post(b"f", b"g")
+    stored_after = sorted(path.read_bytes() for path in local_storage.root.iterdir())
+    assert_and_log(
+        function_name="test_media_batch",
+        condition=response.status_code == 500 and stored_after == stored,
+        error_message=f"{response.status_code}, stored {stored_after}",
+    )
+
+
+def test_media_batch_duplicates(added_test_user, test_client, local_storage, monkeypatch):
+    """Test that a content repeated in a batch is stored once, and nothing is left on rollback"""
+    tests_logger.debug("test_media_batch_duplicates()")
+
+    monkeypatch.setattr("app.services.images.IMAGE_PROCESSING", False)
+
+    def post(*contents):
+        return test_client.post(
+            "/api/medias/batch",
+            headers=old_user["headers"],
+            files=[
+                ("files", (f"{n}.jpg", content, "image/jpeg"))
+                for n, content in enumerate(contents)
+            ],
+        )
+
+    media = post(b"p", b"p", b"q").json()
+    links = [
+        test_client.get(f"/api/medias/{media_id}", headers=old_user["headers"]).json()["link"]
+        for media_id in media["media_ids"]
+    ]
+    stored = sorted(path.read_bytes() for path in local_storage.root.iterdir())
+    assert_and_log(
+        function_name="test_media_batch_duplicates",
+        condition=stored == [b"p", b"q"]
+        and links[0] == links[1] != links[2]
+        and media["statuses"] == ["ready"] * 3,
+        error_message=f"unexpected media {media}, links {links}, stored {stored}",
+    )
+
+    async def failing_commit(self):
+        raise RuntimeError("commit failed")
+
+    monkeypatch.setattr("sqlalchemy.ext.asyncio.AsyncSession.commit", failing_commit)
+    response = post(b"r", b"s")
+    stored_after = sorted(path.read_bytes() for path in local_storage.root.iterdir())
+    assert_and_log(
+        function_name="test_media_batch_duplicates",
+        condition=response.status_code == 500 and stored_after == stored,
+        error_message=f"{response.status_code}, stored {stored_after}",
+    )
+
+
+def test_media_batch_duplicates_async(
+    added_test_user, test_client, local_storage, ingest_queue, monkeypatch
+):
+    """Test that media repeating a content in a batch are staged once and ingested together"""
+    tests_logger.debug("test_media_batch_duplicates_async()")
+
+    monkeypatch.setattr("app.services.images.IMAGE_PROCESSING", False)
+    queued = []
+    monkeypatch.setattr(ingest_queue, "enqueue", lambda *job: queued.append(job))
+
+    media = test_client.post(
+        "/api/medias/batch",
+        headers=old_user["headers"],
+        files=[("files", (f"{n}.jpg", b"photo", "image/jpeg")) for n in range(2)],
+    ).json()
+    staged = list(ingest_queue.staging_dir.iterdir())
+    assert_and_log(
+        function_name="test_media_batch_duplicates_async",
+        condition=media["statuses"] == ["pending"] * 2 and len(queued) == len(staged) == 1,
+        error_message=f"unexpected media {media}, queued {queued}, staged {staged}",
+    )
+
+    test_client.portal.call(ingest_queue.ingest, *queued[0])
+    statuses = [
+        test_client.get(f"/api/medias/{media_id}", headers=old_user["headers"]).json()["status"]
+        for media_id in media["media_ids"]
+    ]
+    assert_and_log(
+        function_name="test_media_batch_duplicates_async",
+        condition=statuses == ["ready"] * 2,
+        error_message=f"unexpected statuses {statuses}",
+    )
@@ -0,0 +1,84 @@
+import re
+
+import pytest
+from sqlalchemy import event
+
+from app.models import followers, likes
+from app.services import media_service, tweet_service, user_service
+from config.logging_config import logger
+
+from .conftest import assert_and_log, test_engine
+
+tests_logger = logger.bind(name="tests")
+
+# a full pass over one of the app's tables (SCAN over a subquery or the FTS5 index is fine)
+FULL_SCAN = re.compile(r"^SCAN (users|tweets|media|likes|followers)\b")
+SORT = "USE TEMP B-TREE FOR ORDER BY"
+
+
+def hot_queries(db):
+    """name -> (call of a service function, whether its statements may sort in a temp b-tree)"""
+    cursor = tweet_service.encode_search_cursor(1.0, 10)
+    feed_cursor = "MjAyNi0xMC0xOFQwMDowMDowMCswMDowMHwxMA=="
+    return {
+        # a single author is read in index order, several are merged with a sort
+        "feed of one": (lambda: tweet_service.tweets_by_user_ids(db, [1], 10), False),
+        "feed page": (
+            lambda: tweet_service.tweets_by_user_ids(db, [1], 10, cursor=feed_cursor),
+            False,
+        ),
+        "feed of many": (lambda: tweet_service.tweets_by_user_ids(db, [1, 2], 10), True),
+        "recent tweets": (lambda: tweet_service.recent_tweet_ids(db, [1], 10), False),
+        "tweet": (lambda: tweet_service.tweet_by_id_with_details(db, 1), False),
+        "tweet version": (lambda: tweet_service.tweet_version(db, 1), False),
+        # the outer ORDER BY sorts at most `limit` rows per tweet
+        "likers": (lambda: tweet_service.likers_sample(db, [1, 2], 10), True),
+        "liked": (lambda: tweet_service.liked_tweet_ids(db, 2, [1, 2]), False),
+        "search": (lambda: tweet_service.tweets_by_text(db, "body", 10, cursor), True),
+        "followed": (lambda: user_service.followed_user_ids(db, 2), False),
+        "followers": (lambda: user_service.follower_user_ids(db, 1), False),
+        "relations": (lambda: user_service.relations_sample(db, 1, 10), True),
+        "user version": (lambda: user_service.user_version(db, 1), False),
+        "media": (lambda: media_service.get_media_by_ids(db, [1, 2]), False),
+        "media by hash": (lambda: media_service.media_by_content_hash(db, "0" * 64), False),
+    }
+
+
+@pytest.mark.asyncio
+async def test_query_plans(db_session, added_test_user, added_test_post, added_second_test_user):
+    """EXPLAIN QUERY PLAN of the hot service queries: no full table scans, no unexpected sorts"""
+    tests_logger.debug("test_query_plans()")
+
+    await db_session.execute(likes.insert().values(user_id=2, tweet_id=1))
+    await db_session.execute(followers.insert().values(follower_id=2, followed_id=1))
+    await db_session.commit()
+
+    executed = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        executed.append((statement, parameters))
+
+    for name, (call, may_sort) in hot_queries(db_session).items():
+        executed.clear()
+        event.listen(test_engine.sync_engine, "before_cursor_execute", capture)
+        try:
+            await call()
+        finally:
+            event.remove(test_engine.sync_engine, "before_cursor_execute", capture)
+
+        connection = await db_session.connection()
+        for statement, parameters in executed:
+            result = await connection.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {statement}", parameters
+            )
+            plan = [row[-1] for row in result.all()]
+            assert_and_log(
+                function_name="test_query_plans",
+                condition=not any(FULL_SCAN.match(step) for step in plan),
+                error_message=f"{name}: full table scan in {plan} for {statement}",
+            )
+            assert_and_log(
+                function_name="test_query_plans",
+                condition=may_sort or SORT not in plan,
+                error_message=f"{name}: sort in {plan} for {statement}",
+            )
@@ -44,3 +44,32 @@ async def test_tables_created(db_session):
             condition="tweets" in tables,
             error_message="Table 'tweets' not created",
         )
+
+
+def test_metrics(added_test_user, test_client):
+    """Prometheus metrics of the requests served so far"""
+    tests_logger.debug("test_metrics()")
+
+    test_client.get("/api/healthchecker")
+    test_client.get("/api/tweets/1", headers={"api_key": "key1"})
+
+    response = test_client.get("/metrics")
+    assert_and_log(
+        function_name="test_metrics",
+        condition=response.status_code == 200
+        and response.headers["content-type"].startswith("text/plain"),
+        error_message=f"{response.status_code} != 200",
+    )
+    assert_and_log(
+        function_name="test_metrics",
+        condition='http_requests_total{method="GET",route="/api/tweets/{tweet_id}",status="404"}'
+        in response.text,
+        error_message="request counter by route template not found",
+    )
+    assert_and_log(
+        function_name="test_metrics",
+        condition='http_request_duration_seconds_bucket{method="GET",route="/api/healthchecker",'
+        'le="+Inf"}' in response.text
+        and "http_requests_in_flight 1" in response.text,
+        error_message="latency histogram or in-flight gauge not found",
+    )
@@ -1,8 +1,12 @@
 import os
 
+import pytest
+
+from app.services.timeline import MemoryTimelineStore
 from config.logging_config import logger
+from config.query_stats import statement_shape
 
-from .conftest import assert_and_log, test_data
+from .conftest import assert_and_log, assert_query_budget, test_data
 
 tests_logger = logger.bind(name="tests")
 
@@ -283,6 +287,20 @@ def test_like_tweet(added_test_user, added_test_post, added_second_test_user, te
         condition=response_get["likes"][0]["name"] == old_user["username"],
         error_message=f"{response_get['likes'][0]['name']} != {old_user['username']}",
     )
+    assert_and_log(
+        function_name="test_like_tweet",
+        condition=response_get["likes_count"] == 1 and response_get["liked"] is True,
+        error_message=f"likes_count={response_get['likes_count']}, liked={response_get['liked']}",
+    )
+
+    # liking twice changes nothing
+    test_client.post(f"/api/tweets/1/likes", headers=old_user["headers"])
+    response_get = test_client.get(f"/api/tweets/1", headers=new_user["headers"]).json()
+    assert_and_log(
+        function_name="test_like_tweet",
+        condition=response_get["likes_count"] == 1 and response_get["liked"] is False,
+        error_message=f"likes_count={response_get['likes_count']}, liked={response_get['liked']}",
+    )
 
 
 def test_unlike_tweet(added_test_user, added_test_post, added_second_test_user, test_client):
@@ -351,3 +369,328 @@ def test_unlike_tweet(added_test_user, added_test_post, added_second_test_user,
         condition=response_get["likes"] == [],
         error_message=f"{response_get['likes']} != []",
     )
+    assert_and_log(
+        function_name="test_unlike_tweet",
+        condition=response_get["likes_count"] == 0 and response_get["liked"] is False,
+        error_message=f"likes_count={response_get['likes_count']}, liked={response_get['liked']}",
+    )
+
+
+def test_get_tweets_cursor(added_test_user, added_second_test_user, test_client):
+    """Keyset pagination of the feed"""
+    tests_logger.debug("test_get_tweets_cursor()")
+
+    for number in range(3):
+        test_client.post(
+            "/api/tweets",
+            headers=old_user["headers"],
+            json={"tweet_data": f"Tweet {number}", "media_ids": []},
+        )
+    test_client.post("/api/users/1/follow", headers=new_user["headers"])
+
+    # first page
+    response = test_client.get("/api/tweets?limit=2", headers=new_user["headers"])
+    assert_and_log(
+        function_name="test_get_tweets_cursor",
+        condition=response.status_code == 200,
+        error_message=f"{response.status_code} != 200",
+    )
+    first_page = response.json()
+    assert_and_log(
+        function_name="test_get_tweets_cursor",
+        condition=[t["content"] for t in first_page["tweets"]] == ["Tweet 2", "Tweet 1"],
+        error_message=f"Unexpected first page: {first_page['tweets']}",
+    )
+    assert_and_log(
+        function_name="test_get_tweets_cursor",
+        condition=first_page["next_cursor"],
+        error_message="next_cursor is empty",
+    )
+
+    # next page starts after the cursor
+    response = test_client.get(
+        "/api/tweets",
+        headers=new_user["headers"],
+        params={"limit": 2, "cursor": first_page["next_cursor"]},
+    )
+    second_page = response.json()
+    assert_and_log(
+        function_name="test_get_tweets_cursor",
+        condition=[t["content"] for t in second_page["tweets"]] == ["Tweet 0"],
+        error_message=f"Unexpected second page: {second_page['tweets']}",
+    )
+    assert_and_log(
+        function_name="test_get_tweets_cursor",
+        condition=second_page["next_cursor"] is None,
+        error_message=f"{second_page['next_cursor']} is not None",
+    )
+
+    # invalid cursor
+    response = test_client.get(
+        "/api/tweets", headers=new_user["headers"], params={"cursor": "who_am_i"}
+    )
+    assert_and_log(
+        function_name="test_get_tweets_cursor",
+        condition=response.status_code == 400,
+        error_message=f"{response.status_code} != 400",
+    )
+
+
+def test_get_tweets_timeline(
+    added_test_user, added_second_test_user, memory_timeline, test_client
+):
+    """Feed served from the precomputed timeline"""
+    tests_logger.debug("test_get_tweets_timeline()")
+
+    def post_tweet(text):
+        response = test_client.post(
+            "/api/tweets", headers=old_user["headers"], json={"tweet_data": text, "media_ids": []}
+        )
+        return response.json()["tweet_id"]
+
+    def feed(**params):
+        response = test_client.get("/api/tweets", headers=new_user["headers"], params=params)
+        return response.json()
+
+    post_tweet("Tweet 1")
+    test_client.post("/api/users/1/follow", headers=new_user["headers"])
+
+    # first read builds the timeline
+    contents = [t["content"] for t in feed()["tweets"]]
+    assert_and_log(
+        function_name="test_get_tweets_timeline",
+        condition=contents == ["Tweet 1"],
+        error_message=f"{contents} != ['Tweet 1']",
+    )
+
+    # new tweets are pushed, the oldest one falls out of the capped timeline
+    for text in ("Tweet 2", "Tweet 3"):
+        post_tweet(text)
+    last_tweet_id = post_tweet("Tweet 4")
+    first_page = feed(limit=2)
+    contents = [t["content"] for t in first_page["tweets"]]
+    assert_and_log(
+        function_name="test_get_tweets_timeline",
+        condition=contents == ["Tweet 4", "Tweet 3"],
+        error_message=f"{contents} != ['Tweet 4', 'Tweet 3']",
+    )
+
+    # pages beyond the capped timeline come from the database
+    second_page = feed(limit=2, cursor=first_page["next_cursor"])
+    contents = [t["content"] for t in second_page["tweets"]]
+    assert_and_log(
+        function_name="test_get_tweets_timeline",
+        condition=contents == ["Tweet 2", "Tweet 1"],
+        error_message=f"{contents} != ['Tweet 2', 'Tweet 1']",
+    )
+
+    # deleted tweets are removed
+    test_client.delete(f"/api/tweets/{last_tweet_id}", headers=old_user["headers"])
+    contents = [t["content"] for t in feed()["tweets"]]
+    assert_and_log(
+        function_name="test_get_tweets_timeline",
+        condition=contents == ["Tweet 3", "Tweet 2", "Tweet 1"],
+        error_message=f"{contents} != ['Tweet 3', 'Tweet 2', 'Tweet 1']",
+    )
+
+    # unfollowed user's tweets are removed
+    test_client.delete("/api/users/1/unfollow", headers=new_user["headers"])
+    contents = [t["content"] for t in feed()["tweets"]]
+    assert_and_log(
+        function_name="test_get_tweets_timeline",
+        condition=contents == [],
+        error_message=f"{contents} != []",
+    )
+
+
+@pytest.mark.asyncio
+async def test_truncated_timeline_floor():
+    """Older tweets pushed into a truncated timeline that shrank are not kept"""
+    tests_logger.debug("test_truncated_timeline_floor()")
+
+    store = MemoryTimelineStore(max_length=3)
+    await store.rebuild(1, [10, 20, 30, 40])
+    # unfollow of the author of 30 and 40, then a follow of a user with older tweets only:
+    # tweets of the other followed users older than 20 were dropped with 10
+    await store.remove([1], [30, 40])
+    await store.push([1], [5, 15, 18, 25])
+    tweet_ids = await store.range(1, None, 0, 3)
+    assert_and_log(
+        function_name="test_truncated_timeline_floor",
+        condition=tweet_ids == [25, 20] and not await store.is_complete(1),
+        error_message=f"{tweet_ids} != [25, 20] or the timeline is complete",
+    )
+
+
+def test_get_tweet_etag(added_test_user, added_test_post, added_second_test_user, test_client):
+    """Conditional GET of a tweet: 304 while unchanged, per viewer, a new ETag after a like"""
+    tests_logger.debug("test_get_tweet_etag()")
+
+    response = test_client.get("/api/tweets/1", headers=old_user["headers"])
+    etag = response.headers.get("etag")
+    assert_and_log(
+        function_name="test_get_tweet_etag",
+        condition=response.status_code == 200 and etag is not None,
+        error_message=f"{response.status_code} != 200 or no ETag",
+    )
+
+    headers = {**old_user["headers"], "If-None-Match": etag}
+    response = test_client.get("/api/tweets/1", headers=headers)
+    assert_and_log(
+        function_name="test_get_tweet_etag",
+        condition=response.status_code == 304,
+        error_message=f"{response.status_code} != 304",
+    )
+
+    # another viewer gets its own representation
+    response = test_client.get(
+        "/api/tweets/1", headers={**new_user["headers"], "If-None-Match": etag}
+    )
+    assert_and_log(
+        function_name="test_get_tweet_etag",
+        condition=response.status_code == 200,
+        error_message=f"{response.status_code} != 200",
+    )
+
+    test_client.post("/api/tweets/1/likes", headers=new_user["headers"])
+    response = test_client.get("/api/tweets/1", headers=headers)
+    assert_and_log(
+        function_name="test_get_tweet_etag",
+        condition=response.status_code == 200 and response.json()["likes_count"] == 1,
+        error_message=f"{response.status_code} != 200 after a like",
+    )
+
+
+def test_get_tweets_query_budget(added_test_user, added_second_test_user, test_client):
+    """The feed costs the same number of SQL statements however many tweets it shows"""
+    tests_logger.debug("test_get_tweets_query_budget()")
+
+    for number in range(5):
+        test_client.post(
+            "/api/tweets",
+            headers=old_user["headers"],
+            json={"tweet_data": f"Tweet {number}", "media_ids": []},
+        )
+        test_client.post(f"/api/tweets/{number + 1}/likes", headers=new_user["headers"])
+    test_client.post("/api/users/1/follow", headers=new_user["headers"])
+
+    response = test_client.get("/api/tweets", headers=new_user["headers"])
+    assert_and_log(
+        function_name="test_get_tweets_query_budget",
+        condition=response.status_code == 200 and len(response.json()["tweets"]) == 5,
+        error_message=f"{response.status_code} != 200",
+    )
+    assert_query_budget("test_get_tweets_query_budget", response, max_queries=6)
+
+    response = test_client.get("/api/tweets/1", headers=new_user["headers"])
+    assert_query_budget("test_get_tweets_query_budget", response, max_queries=6)
+
+    assert_and_log(
+        function_name="test_get_tweets_query_budget",
+        condition=statement_shape("SELECT * FROM t WHERE id IN (?, ?, ?)")
+        == statement_shape("SELECT *\n FROM t WHERE id IN ($1, $2)"),
+        error_message="IN lists of different length have different shapes",
+    )
+
+
+def test_like_query_budget(added_test_user, added_test_post, added_second_test_user, test_client):
+    """Like and unlike are a write plus the counter update, repeats don't write"""
+    tests_logger.debug("test_like_query_budget()")
+
+    test_client.get("/api/users/me", headers=old_user["headers"])
+    for method, expected_count, max_queries in (
+        ("post", 1, 2),
+        ("post", 1, 2),
+        ("delete", 0, 2),
+        ("delete", 0, 2),
+    ):
+        response = test_client.request(method, "/api/tweets/1/likes", headers=old_user["headers"])
+        assert_query_budget("test_like_query_budget", response, max_queries=max_queries)
+        tweet = test_client.get("/api/tweets/1", headers=old_user["headers"]).json()
+        assert_and_log(
+            function_name="test_like_query_budget",
+            condition=tweet["likes_count"] == expected_count,
+            error_message=f"{tweet['likes_count']} != {expected_count}",
+        )
+
+
+def test_search_tweets(added_test_user, added_second_test_user, test_client):
+    """Full-text search: every word must match, best match first, keyset pages"""
+    tests_logger.debug("test_search_tweets()")
+
+    for text in (
+        "FastAPI and SQLAlchemy",
+        "fastapi fastapi fastapi sqlalchemy",
+        "Only SQLAlchemy here",
+        "Привет, FastAPI!",
+    ):
+        test_client.post(
+            "/api/tweets", headers=old_user["headers"], json={"tweet_data": text, "media_ids": []}
+        )
+
+    response = test_client.get("/api/tweets/search?q=fastapi", headers=new_user["headers"])
+    ids = [tweet["id"] for tweet in response.json()["tweets"]]
+    assert_and_log(
+        function_name="test_search_tweets",
+        condition=response.status_code == 200 and ids[0] == 2 and sorted(ids) == [1, 2, 4],
+        error_message=f"{response.status_code}, {ids}",
+    )
+
+    response = test_client.get(
+        "/api/tweets/search?q=SQLALCHEMY fastapi&limit=1", headers=new_user["headers"]
+    )
+    pages = [[tweet["id"] for tweet in response.json()["tweets"]]]
+    response = test_client.get(
+        "/api/tweets/search",
+        params={"q": "SQLALCHEMY fastapi", "limit": 1, "cursor": response.json()["next_cursor"]},
+        headers=new_user["headers"],
+    )
+    pages.append([tweet["id"] for tweet in response.json()["tweets"]])
+    assert_and_log(
+        function_name="test_search_tweets",
+        condition=pages == [[2], [1]],
+        error_message=f"{pages} != [[2], [1]]",
+    )
+
+    # deleted tweets leave the index, punctuation only finds nothing
+    test_client.delete("/api/tweets/4", headers=old_user["headers"])
+    for query, expected in (("привет", []), ('"*', []), ("here", [3])):
+        response = test_client.get(
+            "/api/tweets/search", params={"q": query}, headers=new_user["headers"]
+        )
+        ids = [tweet["id"] for tweet in response.json()["tweets"]]
+        assert_and_log(
+            function_name="test_search_tweets",
+            condition=ids == expected,
+            error_message=f"{query}: {ids} != {expected}",
+        )
+
+
+def test_fast_json(
+    added_test_user, added_test_post, added_second_test_user, test_client, monkeypatch
+):
+    """FAST_JSON renders the same documents and headers as the response_model path"""
+    tests_logger.debug("test_fast_json()")
+
+    test_client.post("/api/tweets/1/likes", headers=new_user["headers"])
+    test_client.post("/api/users/1/follow", headers=new_user["headers"])
+
+    responses = {}
+    for fast_json in (False, True):
+        monkeypatch.setattr("app.routes.tweets.FAST_JSON", fast_json)
+        responses[fast_json] = [
+            test_client.get(path, headers=new_user["headers"])
+            for path in ("/api/tweets", "/api/tweets/1", "/api/tweets/search?q=body")
+        ]
+
+    for slow, fast in zip(responses[False], responses[True]):
+        assert_and_log(
+            function_name="test_fast_json",
+            condition=fast.status_code == 200 and fast.json() == slow.json(),
+            error_message=f"{fast.json()} != {slow.json()}",
+        )
+        assert_and_log(
+            function_name="test_fast_json",
+            condition=fast.headers.get("ETag") == slow.headers.get("ETag"),
+            error_message=f"{fast.headers.get('ETag')} != {slow.headers.get('ETag')}",
+        )
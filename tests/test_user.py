@@ -1,7 +1,11 @@
+import pytest
+from sqlalchemy import update
+
+from app import User, repair_follow_counters
 from app.routes.users import unfollow
 from config.logging_config import logger
 
-from .conftest import assert_and_log, test_data
+from .conftest import TestingSessionLocal, assert_and_log, assert_query_budget, test_data
 
 tests_logger = logger.bind(name="tests")
 
@@ -321,3 +325,113 @@ def test_unfollow(added_test_user, added_second_test_user, test_client):
         condition=response_get_user["user"]["followers"] == [],
         error_message=f"{response_get_user['user']['followers']} != []",
     )
+
+
+def test_get_user_etag(added_test_user, added_second_test_user, test_client):
+    """Conditional GET of a user: 304 while unchanged, a new ETag after a follow"""
+    tests_logger.debug("test_get_user_etag()")
+
+    response = test_client.get("/api/users/2")
+    etag = response.headers.get("etag")
+    assert_and_log(
+        function_name="test_get_user_etag",
+        condition=response.status_code == 200 and etag is not None,
+        error_message=f"{response.status_code} != 200 or no ETag",
+    )
+
+    response = test_client.get("/api/users/2", headers={"If-None-Match": etag})
+    assert_and_log(
+        function_name="test_get_user_etag",
+        condition=response.status_code == 304 and response.headers.get("etag") == etag,
+        error_message=f"{response.status_code} != 304",
+    )
+
+    test_client.post("/api/users/2/follow", headers=old_user["headers"])
+    response = test_client.get("/api/users/2", headers={"If-None-Match": etag})
+    assert_and_log(
+        function_name="test_get_user_etag",
+        condition=response.status_code == 200 and response.headers.get("etag") != etag,
+        error_message=f"{response.status_code} != 200 or ETag not changed",
+    )
+
+
+def test_follow_query_budget(added_test_user, added_second_test_user, test_client):
+    """SQL statements issued by follow and by the profile read"""
+    tests_logger.debug("test_follow_query_budget()")
+
+    response = test_client.post("/api/users/2/follow", headers=old_user["headers"])
+    assert_query_budget("test_follow_query_budget", response, max_queries=5)
+
+    response = test_client.get("/api/users/2")
+    assert_query_budget("test_follow_query_budget", response, max_queries=4)
+
+
+def test_follow_many(added_test_user, added_second_test_user, test_client):
+    """Bulk follow and unfollow test"""
+    tests_logger.debug("test_follow_many()")
+
+    body = {"user_ids": [2, 1, 99, 2]}
+    response = test_client.post("/api/users/follow", headers=old_user["headers"], json=body)
+    assert_and_log(
+        function_name="test_follow_many",
+        condition=response.json() == {"result": True, "followed": [2], "skipped": [1, 99]},
+        error_message=f"{response.json()}",
+    )
+    assert_query_budget("test_follow_many", response, max_queries=5)
+
+    # already followed ids are neither followed nor skipped
+    response = test_client.post("/api/users/follow", headers=old_user["headers"], json=body)
+    assert_and_log(
+        function_name="test_follow_many",
+        condition=response.json()["followed"] == [],
+        error_message=f"{response.json()}",
+    )
+
+    response = test_client.post("/api/users/unfollow", headers=old_user["headers"], json=body)
+    assert_and_log(
+        function_name="test_follow_many",
+        condition=response.json() == {"result": True, "unfollowed": [2]},
+        error_message=f"{response.json()}",
+    )
+
+    response = test_client.post(
+        "/api/users/follow", headers=old_user["headers"], json={"user_ids": []}
+    )
+    assert_and_log(
+        function_name="test_follow_many",
+        condition=response.status_code == 422,
+        error_message=f"{response.status_code} != 422",
+    )
+
+
+@pytest.mark.asyncio
+async def test_follow_counters(added_test_user, added_second_test_user, test_client):
+    """Profiles show the counters kept by follow/unfollow, the repair job fixes drifted ones"""
+    tests_logger.debug("test_follow_counters()")
+
+    test_client.post("/api/users/2/follow", headers=old_user["headers"])
+    test_client.post("/api/users/follow", headers=new_user["headers"], json={"user_ids": [1]})
+    test_client.post("/api/users/unfollow", headers=new_user["headers"], json={"user_ids": [1]})
+    test_client.delete("/api/users/2/unfollow", headers=old_user["headers"])
+    test_client.post("/api/users/2/follow", headers=old_user["headers"])
+
+    counts = {}
+    for user_id in (1, 2):
+        user = test_client.get(f"/api/users/{user_id}").json()["user"]
+        counts[user_id] = (user["followers_count"], user["following_count"])
+    assert_and_log(
+        function_name="test_follow_counters",
+        condition=counts == {1: (0, 1), 2: (1, 0)},
+        error_message=f"{counts} != {{1: (0, 1), 2: (1, 0)}}",
+    )
+
+    async with TestingSessionLocal() as session:
+        await session.execute(update(User).values(followers_count=7))
+        await session.commit()
+    repaired = await repair_follow_counters(TestingSessionLocal, batch_size=1)
+    user = test_client.get("/api/users/2").json()["user"]
+    assert_and_log(
+        function_name="test_follow_counters",
+        condition=repaired == 2 and user["followers_count"] == 1,
+        error_message=f"repaired={repaired}, followers_count={user['followers_count']}",
+    )